@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_asgi_application()
+
+from car_rental.tempbookings import start_reaper  # noqa: E402
+
+start_reaper()  # only if TEMP_BOOKING_REAP_INTERVAL is set
@@ -10,12 +10,16 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import sys
+import tempfile
 from pathlib import Path
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+TESTING = sys.argv[1:2] == ['test']
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -108,6 +112,22 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Take the write lock at BEGIN so concurrent writers queue (up to
+        # `timeout` seconds) instead of failing with "database is locked".
+        # Every atomic() block in car_rental writes, and most read first:
+        # the booking overlap check, and the calendar, facet and search
+        # rows the signals re-derive. A DEFERRED transaction that
+        # reads and then writes fails at once when it races another writer
+        # (SQLite will not wait on that lock upgrade). The cost falls on
+        # read-only atomic() blocks, which only the Django admin has
+        # (change-form GETs): they queue behind writers too.
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
+        # The early car_rental migrations cannot replay on an empty DB
+        # (0001 points at Location before 0003 creates it), so tests build
+        # the schema straight from the models. A file (not :memory:) so that
+        # threaded tests get real SQLite locking rather than shared-cache
+        # table locks.
+        'TEST': {'MIGRATE': False, 'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -146,6 +166,37 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
+# Temp bookings (home page searches) expire this many seconds after creation.
+# Set TEMP_BOOKING_REAP_INTERVAL (seconds) to also delete expired rows from a
+# background thread in each server process; `manage.py reap_temp_bookings`
+# does the same from cron.
+TEMP_BOOKING_TTL = 24 * 60 * 60
+TEMP_BOOKING_REAP_INTERVAL = None
+
+# Processes resizing uploaded car photos (None: one per CPU)
+IMAGE_DERIVATIVE_WORKERS = None
+
+CACHES = {
+    # Per process: entries are keyed by the change versions or never change
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    # The change versions (car_rental/versioning.py) must be seen by every
+    # worker. The database is a local SQLite file, so the workers share a
+    # host and a directory beside it; use a Redis cache here once they do not.
+    # Test runs clear every cache, so they keep theirs apart from the dev server's.
+    'versions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': Path(tempfile.gettempdir()) / 'car_rental-test-versions' if TESTING else BASE_DIR / 'var' / 'versions',
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 10000},  # one per versioned model; never culled
+    },
+}
+
+# Car listing response cache: entries live LIST_CACHE_TIMEOUT seconds (0
+# disables it); after a change a stale copy is served for up to
+# LIST_CACHE_MAX_STALE seconds while one request rebuilds it.
+LIST_CACHE_TIMEOUT = 600
+LIST_CACHE_MAX_STALE = 30
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
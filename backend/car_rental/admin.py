@@ -49,7 +49,10 @@ class CarAdmin(admin.ModelAdmin):
     ]
     search_fields = ['name', 'location__name']
     ordering = ['name', 'model_year']
-    readonly_fields = ['image_preview']
+    readonly_fields = [
+        'image_preview', 'reviews_count', 'rating_sum', 'rating_avg',
+        'stars_1', 'stars_2', 'stars_3', 'stars_4', 'stars_5',
+    ]
     inlines = [CarImageInline]
 
     def image_preview(self, obj):
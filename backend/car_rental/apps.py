@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class CarRentalConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'car_rental'
+
+    def ready(self):
+        from . import carsearch, signals  # noqa: F401
+        # Databases built without migrations (tests) still get the FTS5 table
+        post_migrate.connect(carsearch.ensure_table, sender=self)
@@ -0,0 +1,127 @@
+"""
+Async (ASGI) versions of the read-heavy endpoints, mounted under /api/async/.
+
+DRF views are synchronous, so these are plain Django async views that fetch
+with the async ORM and reuse the DRF serializers on fully prefetched objects
+(serializing them never touches the DB). Independent queries of one response
+are fanned out with ``fan_out``, which runs each in its own worker thread
+and connection instead of queueing them on the single thread the async ORM
+uses.
+"""
+import asyncio
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import connection
+from django.http import JsonResponse
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.request import Request
+
+from .autocomplete import location_autocomplete
+from .carcalendar import busy_car_ids
+from .catalog import get_catalog
+from .models import Car, Location
+from .serializers import CarSerializer, LocationSerializer
+from . import tempbookings
+
+
+def _closing(fn):
+    def run(*args):
+        try:
+            return fn(*args)
+        finally:
+            connection.close()
+    return run
+
+
+async def fan_out(*calls):
+    """Run independent blocking callables concurrently, each on its own connection."""
+    return await asyncio.gather(*(
+        sync_to_async(_closing(call), thread_sensitive=False)() for call in calls
+    ))
+
+
+def _not_found(detail='Not found.'):
+    return JsonResponse({'detail': detail}, status=404)
+
+
+async def cars_available(request):
+    pickup_location = request.GET.get('pickup_location')
+    start_datetime_str = request.GET.get('start_datetime')
+    end_datetime_str = request.GET.get('end_datetime')
+    start_datetime = parse_datetime(start_datetime_str) if start_datetime_str else None
+    end_datetime = parse_datetime(end_datetime_str) if end_datetime_str else None
+
+    calls = [get_catalog('addons').get]  # CarSerializer renders add-ons from it
+    if start_datetime:
+        calls.append(lambda: busy_car_ids(start_datetime, end_datetime))
+    if pickup_location:
+        calls.append(lambda: list(
+            Location.objects.filter(name__icontains=pickup_location).values_list('id', flat=True)
+        ))
+    results = list(await fan_out(*calls))[1:]
+    busy_ids = results.pop(0) if start_datetime else None
+
+    cars = Car.objects.select_related(
+        'group', 'variant', 'location', 'fuel', 'transmission'
+    ).prefetch_related('images', 'features')
+    if pickup_location:
+        cars = cars.filter(location_id__in=results.pop(0))
+    if busy_ids:
+        cars = cars.exclude(id__in=busy_ids)
+    cars = [car async for car in cars]
+
+    serializer = CarSerializer(cars, many=True, context={'request': Request(request)})
+    return JsonResponse(serializer.data, safe=False)
+
+
+async def location_search(request):
+    query = request.GET.get('search', '').strip()
+    drf_request = Request(request)
+    results = []
+    if query:
+        # In memory once warm; the first call (or a version change) loads from the DB
+        results = await sync_to_async(location_autocomplete.search)(query, 50)
+    paginator = PageNumberPagination()
+    try:
+        page = paginator.paginate_queryset(results, drf_request)
+    except NotFound as exc:
+        return _not_found(str(exc.detail))
+    serializer = LocationSerializer(page, many=True, context={'request': drf_request})
+    return JsonResponse(paginator.get_paginated_response(serializer.data).data)
+
+
+async def get_temp_booking(request, temp_id):
+    if not isinstance(temp_id, uuid.UUID):
+        try:
+            temp_id = uuid.UUID(str(temp_id))
+        except ValueError:
+            return _not_found('Invalid UUID format')
+    data = await tempbookings.aget_data(temp_id)
+    if data is None:
+        return _not_found('Booking not found')
+    return JsonResponse(data)
+
+
+async def health_check(request):
+    """Health check that also pings the database and the cache, concurrently."""
+    def database_ok():
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        return True
+
+    async def cache_ok():
+        await cache.aset('car_rental:health', 1, 5)
+        return await cache.aget('car_rental:health') == 1
+
+    try:
+        db, cached = await asyncio.gather(fan_out(database_ok), cache_ok())
+        healthy = db[0] and cached
+    except Exception:
+        healthy = False
+    if not healthy:
+        return JsonResponse({"status": "error", "message": "Database or cache unavailable."}, status=503)
+    return JsonResponse({"status": "ok", "message": "API is healthy."})
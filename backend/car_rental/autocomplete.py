@@ -0,0 +1,213 @@
+"""
+In-memory autocomplete over Location name and address.
+
+Every word of a location's name and address goes into a sorted vocabulary,
+so a prefix lookup is two bisects (a flattened trie). When prefixes alone
+give too few results, a trigram index over the same vocabulary supplies
+substring and typo-tolerant matches. Results are ranked, the top ``k`` are
+kept in a small cache (popular prefixes repeat across users), and they are
+returned as unsaved Location instances, so a keystroke never touches the DB.
+
+Local writes are applied incrementally by signals.py; writes made by other
+workers are picked up through the Location change version.
+"""
+import heapq
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+
+from .models import Location
+from .versioning import get_version
+
+LOCATION_FIELDS = ('name', 'address', 'latitude', 'longitude', 'map_url')
+MIN_SIMILARITY = 0.35
+ADDRESS_PENALTY = 1.5
+RESULT_CACHE_SIZE = 2048
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return re.sub(r'[^0-9a-z]+', ' ', text.lower()).strip()
+
+
+def trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class LocationAutocomplete:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._version = None
+        self._reset()
+
+    def _reset(self):
+        self._rows = {}        # location id -> serializer fields
+        self._names = {}       # location id -> normalized name
+        self._words = {}       # location id -> {word: field} (0 name, 1 address)
+        self._vocab = []       # sorted distinct words
+        self._word_locs = {}   # word -> {location id: field}
+        self._grams = {}       # trigram -> set of words
+        self._gram_counts = {}  # word -> number of trigrams
+        self._results = {}     # (query, k) -> ranked ids, cleared on any change
+
+    # --- Maintenance ---
+
+    def _refresh(self):
+        version = get_version(Location)
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            self._reset()
+            rows = Location.objects.values_list('id', *LOCATION_FIELDS)
+            for pk, *values in rows.iterator(chunk_size=5000):
+                self._add(pk, dict(zip(LOCATION_FIELDS, values)))
+            self._version = version
+
+    def invalidate(self):
+        with self._lock:
+            self._reset()
+            self._version = None
+
+    def update_location(self, location):
+        with self._lock:
+            if self._version is None:
+                return  # cold: the first query loads everything anyway
+            self._remove(location.pk)
+            self._add(location.pk, {field: getattr(location, field) for field in LOCATION_FIELDS})
+            self._version = get_version(Location)
+
+    def remove_location(self, pk):
+        with self._lock:
+            if self._version is None:
+                return
+            self._remove(pk)
+            self._version = get_version(Location)
+
+    def _add(self, pk, row):
+        self._results.clear()
+        self._rows[pk] = row
+        self._names[pk] = normalize(row['name'])
+        words = {}
+        for word in normalize(row['address']).split():
+            words[word] = 1
+        for word in self._names[pk].split():
+            words[word] = 0
+        self._words[pk] = words
+        for word, field in words.items():
+            locs = self._word_locs.get(word)
+            if locs is None:
+                locs = self._word_locs[word] = {}
+                insort(self._vocab, word)
+                grams = trigrams(word)
+                self._gram_counts[word] = len(grams)
+                for gram in grams:
+                    self._grams.setdefault(gram, set()).add(word)
+            locs[pk] = field
+
+    def _remove(self, pk):
+        if pk not in self._rows:
+            return
+        self._results.clear()
+        del self._rows[pk]
+        del self._names[pk]
+        for word in self._words.pop(pk):
+            locs = self._word_locs[word]
+            del locs[pk]
+            if locs:
+                continue
+            del self._word_locs[word]
+            del self._vocab[bisect_left(self._vocab, word)]
+            del self._gram_counts[word]
+            for gram in trigrams(word):
+                words = self._grams[gram]
+                words.discard(word)
+                if not words:
+                    del self._grams[gram]
+
+    # --- Queries ---
+
+    def _word_matches(self, query_word, fuzzy):
+        """``{vocabulary word: penalty}`` for one query word; lower is better."""
+        matches = {}
+        vocab = self._vocab
+        i = bisect_left(vocab, query_word)
+        while i < len(vocab) and vocab[i].startswith(query_word):
+            matches[vocab[i]] = 0 if vocab[i] == query_word else 1
+            i += 1
+        if not fuzzy or len(query_word) < 3:
+            return matches
+        query_grams = trigrams(query_word)
+        shared = {}
+        for gram in query_grams:
+            for word in self._grams.get(gram, ()):
+                shared[word] = shared.get(word, 0) + 1
+        for word, count in shared.items():
+            if word in matches:
+                continue
+            if query_word in word:
+                matches[word] = 2
+                continue
+            similarity = count / (len(query_grams) + self._gram_counts[word] - count)
+            if similarity >= MIN_SIMILARITY:
+                matches[word] = 3 + (1 - similarity)
+        return matches
+
+    def _score(self, query, fuzzy):
+        per_word = [self._word_matches(word, fuzzy) for word in query.split()]
+        # Seed from the most selective query word, then check the remaining
+        # words against each candidate's own (few) words.
+        per_word.sort(key=lambda matches: sum(len(self._word_locs[w]) for w in matches))
+        scores = {}
+        for word, penalty in per_word[0].items():
+            for pk, field in self._word_locs[word].items():
+                score = penalty + field * ADDRESS_PENALTY
+                if score < scores.get(pk, float('inf')):
+                    scores[pk] = score
+        for matches in per_word[1:]:
+            narrowed = {}
+            for pk, score in scores.items():
+                best = min(
+                    (matches[word] + field * ADDRESS_PENALTY
+                     for word, field in self._words[pk].items() if word in matches),
+                    default=None,
+                )
+                # Every query word has to match something
+                if best is not None:
+                    narrowed[pk] = score + best
+            scores = narrowed
+        return scores
+
+    def search(self, text, k=10):
+        """Top ``k`` locations for ``text``, best first."""
+        self._refresh()
+        query = normalize(text)
+        if not query:
+            return []
+        with self._lock:
+            ranked = self._results.get((query, k))
+            if ranked is None:
+                ranked = self._rank(query, k)
+                if len(self._results) >= RESULT_CACHE_SIZE:
+                    self._results.pop(next(iter(self._results)))
+                self._results[(query, k)] = ranked
+            return [Location(id=pk, **self._rows[pk]) for pk in ranked]
+
+    def _rank(self, query, k):
+        scores = self._score(query, fuzzy=False)
+        if len(scores) < k:
+            scores = self._score(query, fuzzy=True)
+        names = self._names
+        for pk in scores:
+            if names[pk] == query:
+                scores[pk] -= 2
+            elif names[pk].startswith(query):
+                scores[pk] -= 1
+        return heapq.nsmallest(k, scores, key=lambda pk: (scores[pk], len(names[pk]), names[pk]))
+
+
+location_autocomplete = LocationAutocomplete()
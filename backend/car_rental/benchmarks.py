@@ -0,0 +1,480 @@
+"""
+Endpoint benchmarks driven through Django's test client.
+
+Each scenario issues one logical request (or a short flow) against whatever
+data is in the configured database; ``generate_fleet`` fills it at scale.
+Results are latency percentiles, throughput and SQL query counts per
+scenario, written as sorted JSON so two runs can be diffed directly.
+"""
+import json
+import platform
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from .models import Booking, Car, Location, Review
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class Scenario:
+    def __init__(self, name, run):
+        self.name = name
+        self.run = run  # run(client, rng) -> list of responses
+
+    def __repr__(self):
+        return f'<Scenario {self.name}>'
+
+
+def _token_for(user):
+    return Token.objects.get_or_create(user=user)[0].key
+
+
+def default_scenarios():
+    """The read paths the frontend hits most, plus the temp-booking flow."""
+    location_names = list(Location.objects.order_by('?').values_list('name', flat=True)[:200])
+    search_terms = sorted({name[:n] for name in location_names for n in (3, 5, 8)}) or ['ban']
+    now = timezone.now()
+
+    staff = User.objects.filter(is_staff=True).first()
+    if staff is None:
+        staff, _ = User.objects.get_or_create(username='bench_staff', defaults={'is_staff': True})
+    staff_auth = {'HTTP_AUTHORIZATION': f'Token {_token_for(staff)}'}
+    rider_id = Booking.objects.values_list('user_id', flat=True).first()
+    rider = User.objects.filter(pk=rider_id).first() or staff
+    rider_auth = {'HTTP_AUTHORIZATION': f'Token {_token_for(rider)}'}
+
+    def window(rng):
+        start = now + timedelta(hours=rng.randint(-24 * 30, 24 * 30))
+        return start, start + timedelta(hours=rng.randint(2, 72))
+
+    def cars_list(client, rng):
+        params = rng.choice([{}, {'ordering': 'base_fare'}, {'ordering': 'rating'}, {'car_type': 'SUV'}])
+        return [client.get('/api/cars/', params)]
+
+    def cars_available(client, rng):
+        start, end = window(rng)
+        params = {'start_datetime': start.isoformat(), 'end_datetime': end.isoformat()}
+        if location_names and rng.random() < 0.5:
+            params['pickup_location'] = rng.choice(location_names)
+        return [client.get('/api/cars/available/', params)]
+
+    def locations_search(client, rng):
+        return [client.get('/api/locations/', {'search': rng.choice(search_terms)})]
+
+    def bookings_staff(client, rng):
+        return [client.get('/api/bookings/', **staff_auth)]
+
+    def bookings_user(client, rng):
+        return [client.get('/api/bookings/', **rider_auth)]
+
+    def temp_booking_flow(client, rng):
+        start, end = window(rng)
+        created = client.post('/api/booking-temp/', {
+            'pickup_location': rng.choice(location_names) if location_names else 'Bengaluru',
+            'start_datetime': start.isoformat(),
+            'end_datetime': end.isoformat(),
+            'num_days': 1,
+        }, content_type='application/json')
+        responses = [created]
+        if created.status_code == 201:
+            responses.append(client.get(f"/api/booking-temp/{created.json()['temp_id']}/"))
+        return responses
+
+    return [
+        Scenario('cars_list', cars_list),
+        Scenario('cars_available', cars_available),
+        Scenario('locations_search', locations_search),
+        Scenario('bookings_staff', bookings_staff),
+        Scenario('bookings_user', bookings_user),
+        Scenario('temp_booking_flow', temp_booking_flow),
+    ]
+
+
+def run_scenario(scenario, client, rng, iterations, warmup):
+    for _ in range(warmup):
+        scenario.run(client, rng)
+    latencies = []
+    queries = []
+    statuses = {}
+    started = time.perf_counter()
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as ctx:
+            t0 = time.perf_counter()
+            responses = scenario.run(client, rng)
+            latencies.append((time.perf_counter() - t0) * 1000)
+        queries.append(len(ctx.captured_queries))
+        for response in responses:
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 3),
+            'p50': round(percentile(latencies, 50), 3),
+            'p90': round(percentile(latencies, 90), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'max': round(latencies[-1], 3),
+        },
+        'throughput_rps': round(iterations / elapsed, 2),
+        'queries': {'mean': round(sum(queries) / len(queries), 2), 'max': max(queries)},
+        'status_codes': statuses,
+    }
+
+
+def dataset_size():
+    return {
+        'cars': Car.objects.count(),
+        'locations': Location.objects.count(),
+        'bookings': Booking.objects.count(),
+        'reviews': Review.objects.count(),
+    }
+
+
+def run_benchmarks(scenarios, iterations=200, warmup=20, seed=0):
+    rng = random.Random(seed)
+    # The test client talks to "testserver"
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        client = Client()
+        results = {
+            scenario.name: run_scenario(scenario, client, rng, iterations, warmup)
+            for scenario in scenarios
+        }
+    return {
+        'meta': {
+            'dataset': dataset_size(),
+            'iterations': iterations,
+            'warmup': warmup,
+            'seed': seed,
+            'python': platform.python_version(),
+            'database': connection.vendor,
+        },
+        'endpoints': results,
+    }
+
+
+def write_report(report, path):
+    with open(path, 'w') as fh:
+        json.dump(report, fh, indent=2, sort_keys=True)
+        fh.write('\n')
+
+
+def booking_stress(cars, user, threads=8, attempts=50, seed=0):
+    """
+    Hammer the booking commit path from ``threads`` threads, each trying
+    ``attempts`` overlapping bookings on random cars out of ``cars``.
+    Returns commit/conflict counts, commits per second and any double
+    bookings found afterwards (should always be empty).
+    """
+    import threading
+
+    from django.db import close_old_connections, connections
+
+    from .bookings import ACTIVE_STATUSES, BookingConflict, commit_booking
+    from .serializers import BookingSerializer
+
+    base = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+    car_ids = [car.pk for car in cars]
+    counts = {'commits': 0, 'conflicts': 0, 'errors': 0}
+    counts_lock = threading.Lock()
+
+    def worker(n):
+        rng = random.Random(seed * 1000 + n)
+        local = {'commits': 0, 'conflicts': 0, 'errors': 0}
+        try:
+            for _ in range(attempts):
+                start = base + timedelta(hours=rng.randint(0, 48))
+                serializer = BookingSerializer(data={
+                    'car_id': rng.choice(car_ids),
+                    'start_datetime': start.isoformat(),
+                    'end_datetime': (start + timedelta(hours=rng.randint(1, 6))).isoformat(),
+                })
+                serializer.is_valid(raise_exception=True)
+                try:
+                    commit_booking(serializer, user=user)
+                    local['commits'] += 1
+                except BookingConflict:
+                    local['conflicts'] += 1
+                except Exception:
+                    local['errors'] += 1
+        finally:
+            connections.close_all()
+        with counts_lock:
+            for key, value in local.items():
+                counts[key] += value
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    close_old_connections()
+
+    double_bookings = []
+    for car_id in car_ids:
+        previous = None
+        bookings = Booking.objects.filter(
+            car_id=car_id, status__in=ACTIVE_STATUSES, start_datetime__gte=base,
+        ).order_by('start_datetime')
+        for booking in bookings:
+            if previous is not None and booking.start_datetime < previous.end_datetime:
+                double_bookings.append((car_id, previous.pk, booking.pk))
+            previous = booking
+
+    return {
+        **counts,
+        'threads': threads,
+        'seconds': round(elapsed, 3),
+        'commits_per_second': round(counts['commits'] / elapsed, 1) if elapsed else None,
+        'double_bookings': double_bookings,
+    }
+
+
+def async_endpoint_requests(count, seed=0):
+    """
+    ``{name: (sync_path, async_path, [params, ...])}`` for the endpoints with
+    an async twin; both sides replay the same ``count`` requests.
+    """
+    from .models import TempBooking
+
+    rng = random.Random(seed)
+    now = timezone.now()
+    location_names = list(Location.objects.order_by('pk').values_list('name', flat=True)[:200])
+    search_terms = sorted({name[:n] for name in location_names for n in (3, 5, 8)}) or ['ban']
+    temp = TempBooking.objects.create(
+        pickup_location=location_names[0] if location_names else 'Bengaluru', start_datetime=now,
+    )
+
+    def available():
+        start = now + timedelta(hours=rng.randint(-24 * 30, 24 * 30))
+        params = {
+            'start_datetime': start.isoformat(),
+            'end_datetime': (start + timedelta(hours=rng.randint(2, 72))).isoformat(),
+        }
+        if location_names and rng.random() < 0.5:
+            params['pickup_location'] = rng.choice(location_names)
+        return params
+
+    return {
+        'health': ('/api/health/', '/api/async/health/', [{}] * count),
+        'cars_available': (
+            '/api/cars/available/', '/api/async/cars/available/', [available() for _ in range(count)],
+        ),
+        'locations_search': (
+            '/api/locations/', '/api/async/locations/',
+            [{'search': rng.choice(search_terms)} for _ in range(count)],
+        ),
+        'temp_booking_get': (
+            f'/api/booking-temp/{temp.pk}/', f'/api/async/booking-temp/{temp.pk}/', [{}] * count,
+        ),
+    }
+
+
+def _summary(latencies, statuses, elapsed):
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+        },
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'status_codes': statuses,
+    }
+
+
+def run_wsgi(path, requests, concurrency):
+    """Replay ``requests`` through the WSGI handler from ``concurrency`` threads."""
+    import threading
+
+    from django.db import connections
+
+    pending = iter(requests)
+    pending_lock = threading.Lock()
+    latencies = []
+    statuses = {}
+    results_lock = threading.Lock()
+
+    def worker():
+        client = Client(raise_request_exception=False)
+        try:
+            while True:
+                with pending_lock:
+                    params = next(pending, None)
+                if params is None:
+                    return
+                t0 = time.perf_counter()
+                response = client.get(path, params)
+                elapsed_ms = (time.perf_counter() - t0) * 1000
+                with results_lock:
+                    latencies.append(elapsed_ms)
+                    statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return _summary(latencies, statuses, time.perf_counter() - started)
+
+
+def run_asgi(path, requests, concurrency):
+    """Replay ``requests`` through the ASGI handler with ``concurrency`` requests in flight."""
+    import asyncio
+
+    from django.test import AsyncClient
+
+    latencies = []
+    statuses = {}
+
+    async def main():
+        client = AsyncClient(raise_request_exception=False)
+        gate = asyncio.Semaphore(concurrency)
+
+        async def one(params):
+            async with gate:
+                t0 = time.perf_counter()
+                response = await client.get(path, params)
+                latencies.append((time.perf_counter() - t0) * 1000)
+                statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+        await asyncio.gather(*(one(params) for params in requests))
+
+    started = time.perf_counter()
+    asyncio.run(main())
+    return _summary(latencies, statuses, time.perf_counter() - started)
+
+
+def compare_wsgi_asgi(concurrency=64, requests=500, seed=0, only=None):
+    """
+    Throughput of each sync endpoint under WSGI against its async twin under
+    ASGI, at ``concurrency`` requests in flight. Both run in-process through
+    Django's handlers, so the numbers compare the request paths, not servers.
+    """
+    endpoints = async_endpoint_requests(requests, seed=seed)
+    results = {}
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        for name, (sync_path, async_path, params) in endpoints.items():
+            if only and name not in only:
+                continue
+            wsgi = run_wsgi(sync_path, params, concurrency)
+            asgi = run_asgi(async_path, params, concurrency)
+            results[name] = {
+                'wsgi': wsgi,
+                'asgi': asgi,
+                'asgi_speedup': (
+                    round(asgi['throughput_rps'] / wsgi['throughput_rps'], 2)
+                    if wsgi['throughput_rps'] and asgi['throughput_rps'] else None
+                ),
+            }
+    return {
+        'meta': {
+            'dataset': dataset_size(),
+            'concurrency': concurrency,
+            'requests': requests,
+            'seed': seed,
+            'python': platform.python_version(),
+            'database': connection.vendor,
+        },
+        'endpoints': results,
+    }
+
+
+def list_serializer_cases():
+    """``{name: (queryset with its view's joins/prefetches, DRF serializer, ValuesSerializer)}``."""
+    from .serializers import BookingSerializer, CarSerializer, ReviewSerializer
+    from .valueserializers import BookingValues, CarValues, ReviewValues
+
+    return {
+        'cars': (
+            Car.objects.select_related('group', 'variant', 'location', 'fuel', 'transmission')
+            .prefetch_related('images', 'features').order_by('id'),
+            CarSerializer, CarValues,
+        ),
+        'bookings': (
+            Booking.objects.select_related(
+                'user', 'trip_type', 'applied_promotion',
+                'car__group', 'car__variant', 'car__location', 'car__fuel', 'car__transmission',
+            ).prefetch_related('add_ons', 'car__images', 'car__features').order_by('-created_at', '-id'),
+            BookingSerializer, BookingValues,
+        ),
+        'reviews': (Review.objects.select_related('user').order_by('id'), ReviewSerializer, ReviewValues),
+    }
+
+
+def compare_list_serializers(sizes=(10, 100, 500), repeat=20, only=None):
+    """
+    CPU time (``time.process_time``) to fetch and render a page of ``size``
+    rows with the DRF serializer and with its values() twin, best of
+    ``repeat``. Both include their queries; SQLite runs in-process, so that
+    is CPU as well.
+    """
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+
+    from .catalog import get_catalog
+
+    request = Request(APIRequestFactory().get('/api/cars/'))
+    context = {'request': request}
+    get_catalog('addons').get()  # both paths read add-ons from the warm catalog
+
+    def best(render):
+        times = []
+        for _ in range(repeat):
+            started = time.process_time()
+            render()
+            times.append((time.process_time() - started) * 1000)
+        return round(min(times), 3)
+
+    def values_page(values_class, page):
+        renderer = values_class(context)
+        return renderer.render(renderer.values(page))
+
+    results = {}
+    # Absolute image URLs are built for "testserver"
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        for name, (queryset, serializer_class, values_class) in list_serializer_cases().items():
+            if only and name not in only:
+                continue
+            for size in sizes:
+                page = queryset[:size]
+                drf = best(lambda: serializer_class(list(page), many=True, context=context).data)
+                values = best(lambda: values_page(values_class, page))
+                results[f'{name}:{size}'] = {
+                    'rows': len(page),
+                    'drf_cpu_ms': drf,
+                    'values_cpu_ms': values,
+                    'speedup': round(drf / values, 2) if values else None,
+                }
+    return {
+        'meta': {
+            'dataset': dataset_size(),
+            'sizes': list(sizes),
+            'repeat': repeat,
+            'python': platform.python_version(),
+            'database': connection.vendor,
+        },
+        'lists': results,
+    }
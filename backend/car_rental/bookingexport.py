@@ -0,0 +1,166 @@
+"""
+Streaming booking export (CSV or NDJSON) for staff.
+
+Bookings are read by a single query as flat ``values_list()`` rows through a
+chunked ``.iterator()``, and each chunk is formatted and handed on (to the
+client or a file) before the next is read, so memory stays flat however
+many bookings are exported. Rows come in id order with the user, car, trip
+type and promotion flattened into columns; add-ons are left out, as they
+would cost a query per chunk.
+
+Filters (all optional): ``start_from``/``start_to`` on the trip start,
+``created_from``/``created_to`` on the booking time, and ``status`` (comma
+separated). ``*_from`` is inclusive and ``*_to`` exclusive for datetimes; a
+plain date covers that whole day in either bound.
+"""
+import csv
+import io
+import json
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.db.models import ExpressionWrapper, F, TextField
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Booking
+
+COLUMNS = [  # (header, values() lookup)
+    ('id', 'id'),
+    ('status', 'status'),
+    ('created_at', 'export_created_at'),
+    ('start_datetime', 'export_start_datetime'),
+    ('end_datetime', 'export_end_datetime'),
+    ('user', 'user__username'),
+    ('car_id', 'car_id'),
+    ('car', 'car__name'),
+    ('car_type', 'car__car_type'),
+    ('trip_type', 'trip_type__name'),
+    ('pickup_location', 'pickup_location'),
+    ('drop_location', 'drop_location'),
+    ('destination_location', 'destination_location'),
+    ('distance_km', 'distance_km'),
+    ('duration_hours', 'duration_hours'),
+    ('num_passengers', 'num_passengers'),
+    ('driver_required', 'driver_required'),
+    ('promotion', 'applied_promotion__code'),
+    ('fare_estimate', 'fare_estimate'),
+    ('final_price', 'final_price'),
+]
+HEADERS = [header for header, _ in COLUMNS]
+
+# Datetimes are read without Django's converter, which re-parses and
+# localizes every value: the driver's naive UTC value is formatted by _iso
+RAW_DATETIMES = {
+    f'export_{name}': ExpressionWrapper(F(name), output_field=TextField())
+    for name in ('created_at', 'start_datetime', 'end_datetime')
+}
+DATETIME_COLUMNS = [i for i, (_, lookup) in enumerate(COLUMNS) if lookup in RAW_DATETIMES]
+
+FORMATS = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+CHUNK_SIZE = 2000
+
+# parameter -> lookup
+RANGE_FILTERS = {
+    'start_from': 'start_datetime__gte',
+    'start_to': 'start_datetime__lt',
+    'created_from': 'created_at__gte',
+    'created_to': 'created_at__lt',
+}
+
+
+def parse_bound(name, value):
+    # Dates first: parse_datetime would take a date as its midnight
+    day = parse_date(value)
+    if day is not None:
+        if name.endswith('_to'):
+            day += timedelta(days=1)  # through the end of that day
+        moment = datetime.combine(day, time.min)
+    else:
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError('Expected an ISO date or datetime.')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def parse_filters(params):
+    """``(filters for Booking.objects.filter, {param: error})`` from string ``params``."""
+    filters, errors = {}, {}
+    for name, lookup in RANGE_FILTERS.items():
+        value = (params.get(name) or '').strip()
+        if value:
+            try:
+                filters[lookup] = parse_bound(name, value)
+            except ValueError as e:
+                errors[name] = str(e)
+    statuses = [status.strip() for status in (params.get('status') or '').split(',') if status.strip()]
+    if statuses:
+        unknown = set(statuses) - set(dict(Booking.STATUS_CHOICES))
+        if unknown:
+            errors['status'] = f"Unknown status: {', '.join(sorted(unknown))}."
+        filters['status__in'] = statuses
+    return filters, errors
+
+
+def export_rows(filters, chunk_size=CHUNK_SIZE):
+    """Row tuples (see COLUMNS) of the bookings matching ``filters``, streamed from one query."""
+    return (
+        Booking.objects.filter(**filters).order_by('pk').annotate(**RAW_DATETIMES)
+        .values_list(*(lookup for _, lookup in COLUMNS)).iterator(chunk_size=chunk_size)
+    )
+
+
+def _iso(value):
+    if value.tzinfo is None:  # the stored UTC value as the driver parsed it
+        return value.isoformat() + '+00:00'
+    return value.isoformat()
+
+
+def _chunks(rows, size):
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _formatted(row):
+    row = list(row)
+    for i in DATETIME_COLUMNS:
+        if row[i] is not None:
+            row[i] = _iso(row[i])
+    return row
+
+
+def csv_chunks(rows, chunk_size=CHUNK_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(HEADERS)
+    for chunk in _chunks(rows, chunk_size):
+        writer.writerows(map(_formatted, chunk))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()  # no bookings: just the header
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)  # as the API renders decimals
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def ndjson_chunks(rows, chunk_size=CHUNK_SIZE):
+    dumps = json.JSONEncoder(default=_json_default, separators=(',', ':')).encode
+    for chunk in _chunks(rows, chunk_size):
+        yield ''.join(dumps(dict(zip(HEADERS, _formatted(row)))) + '\n' for row in chunk)
+
+
+def stream(output, filters, chunk_size=CHUNK_SIZE):
+    """The export of the bookings matching ``filters`` as text chunks, in ``output`` format."""
+    chunks = csv_chunks if output == 'csv' else ndjson_chunks
+    return chunks(export_rows(filters, chunk_size), chunk_size)
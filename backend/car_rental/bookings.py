@@ -0,0 +1,71 @@
+"""
+Booking commit path: overlap check and insert as one unit per car.
+
+Writers for the same car are serialized twice over: by a striped in-process
+lock (so threads of one worker queue in Python instead of in the DB) and by
+a row lock on the Car inside the transaction (so workers in other processes
+queue on the database). Writers for different cars only share a stripe by
+hash collision, and never share the row lock.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Q
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .models import Booking, Car
+
+# Bookings in these states hold the car; cancelled ones do not.
+ACTIVE_STATUSES = (Booking.STATUS_PENDING, Booking.STATUS_CONFIRMED)
+LOCK_STRIPES = 256
+
+_car_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+
+class BookingConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The car is already booked for the requested time.'
+    default_code = 'booking_conflict'
+
+
+@contextmanager
+def car_lock(car_id):
+    with _car_locks[hash(car_id) % LOCK_STRIPES]:
+        yield
+
+
+def conflicting_bookings(car_id, start, end, exclude_pk=None):
+    """Active bookings of ``car_id`` overlapping [start, end); open-ended when end is None."""
+    overlap = Q(end_datetime__gt=start) | Q(end_datetime__isnull=True)
+    if end is not None:
+        overlap &= Q(start_datetime__lt=end)
+    bookings = Booking.objects.filter(overlap, car_id=car_id, status__in=ACTIVE_STATUSES)
+    if exclude_pk is not None:
+        bookings = bookings.exclude(pk=exclude_pk)
+    return bookings
+
+
+def commit_booking(serializer, **save_kwargs):
+    """
+    Save a validated BookingSerializer (create or update), raising
+    BookingConflict if the car is already held for any part of the window.
+    """
+    data = serializer.validated_data
+    instance = serializer.instance
+    car = data.get('car') or instance.car
+    start = data.get('start_datetime', getattr(instance, 'start_datetime', None))
+    end = data.get('end_datetime', getattr(instance, 'end_datetime', None))
+    new_status = data.get('status', getattr(instance, 'status', Booking.STATUS_PENDING))
+
+    if new_status not in ACTIVE_STATUSES:
+        return serializer.save(**save_kwargs)
+
+    with car_lock(car.pk), transaction.atomic():
+        # Row lock on the car for the rest of the transaction (a no-op on
+        # SQLite, where IMMEDIATE transactions already serialize writers).
+        list(Car.objects.select_for_update().filter(pk=car.pk).values_list('pk', flat=True))
+        if conflicting_bookings(car.pk, start, end, exclude_pk=getattr(instance, 'pk', None)).exists():
+            raise BookingConflict()
+        return serializer.save(**save_kwargs)
@@ -0,0 +1,239 @@
+"""
+Per-car availability calendar: one bitmap of booked 15-minute slots per car
+and UTC day (CarCalendarDay).
+
+A slot is booked when an active booking (see bookings.ACTIVE_STATUSES)
+overlaps any part of it, so the calendar rounds bookings out to whole
+slots. Booking signals re-derive the affected days of the car from its
+bookings in the same transaction as the write, which keeps overlapping
+bookings correct when one of them is cancelled. Bookings without an end
+cannot be drawn on a calendar; the availability queries check them
+separately.
+
+"Is car X free from Friday 10:00 to Sunday 18:00" is then an AND of three
+bitmaps with the window's slot masks. ``exclude_busy`` asks it fleet-wide
+for /cars/available/, quotes and ``Car.get_available_cars``; as the
+calendar lives in the database, every worker answers from the same rows.
+``rebuild`` redraws every calendar from Booking and ``check`` reports days
+that disagree with it.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.utils import timezone
+
+from .bookings import ACTIVE_STATUSES
+from .models import Booking, CarCalendarDay
+
+SLOT = timedelta(minutes=15)
+SLOTS_PER_DAY = 24 * 60 // 15
+BITMAP_BYTES = SLOTS_PER_DAY // 8
+DAY = timedelta(days=1)
+
+
+def _utc(value):
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value.astimezone(dt_timezone.utc)
+
+
+def _day_start(day):
+    return datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+
+
+def day_masks(start, end):
+    """``{day: mask}`` of the slots [start, end) touches, per UTC day."""
+    start, end = _utc(start), _utc(end)
+    masks = {}
+    day = start.date()
+    while end > _day_start(day):
+        day_start = _day_start(day)
+        first = max(start, day_start) - day_start
+        last = min(end, day_start + DAY) - day_start
+        if last > first:
+            lo = first // SLOT
+            hi = -(-last // SLOT)  # slots partly covered count as booked
+            masks[day] = ((1 << hi) - 1) ^ ((1 << lo) - 1)
+        day += DAY
+    return masks
+
+
+def to_bytes(bitmap):
+    return bitmap.to_bytes(BITMAP_BYTES, 'little')
+
+
+def from_bytes(slots):
+    return int.from_bytes(slots, 'little')
+
+
+def _active(bookings):
+    return bookings.filter(status__in=ACTIVE_STATUSES)
+
+
+def draw(rows, days=None):
+    """``{(car_id, day): bitmap}`` from ``(car_id, start, end)`` rows, limited to ``days`` if given."""
+    bitmaps = defaultdict(int)
+    for car_id, start, end in rows:
+        if end is None:
+            continue
+        for day, mask in day_masks(start, end).items():
+            if days is None or day in days:
+                bitmaps[car_id, day] |= mask
+    return bitmaps
+
+
+def refresh(car_id, days):
+    """Redraw ``days`` of ``car_id``'s calendar from its active bookings."""
+    days = set(days)
+    if not days:
+        return
+    lo, hi = _day_start(min(days)), _day_start(max(days)) + DAY
+    rows = _active(Booking.objects.filter(
+        car_id=car_id, start_datetime__lt=hi, end_datetime__gt=lo,
+    )).values_list('car_id', 'start_datetime', 'end_datetime')
+    bitmaps = draw(rows, days)
+    with transaction.atomic():
+        CarCalendarDay.objects.filter(car_id=car_id, day__in=days - {day for _, day in bitmaps}).delete()
+        _store(bitmaps)
+
+
+def _store(bitmaps, batch_size=1000, using='default'):
+    CarCalendarDay.objects.using(using).bulk_create(
+        [CarCalendarDay(car_id=car_id, day=day, slots=to_bytes(bitmap)) for (car_id, day), bitmap in bitmaps.items()],
+        batch_size=batch_size, update_conflicts=True, unique_fields=['car', 'day'], update_fields=['slots'],
+    )
+
+
+def booking_days(start, end):
+    if start is None or end is None:
+        return set()
+    # Instances may still hold the strings they were created with
+    to_python = Booking._meta.get_field('start_datetime').to_python
+    return set(day_masks(to_python(start), to_python(end)))
+
+
+def booking_changed(stored, booking=None):
+    """
+    Bring the calendar in line after a booking write. ``stored`` is the
+    row's ``(car_id, start, end)`` before the write (None for new rows),
+    ``booking`` the saved instance (None once deleted).
+    """
+    affected = defaultdict(set)
+    if stored is not None:
+        car_id, start, end = stored
+        affected[car_id] |= booking_days(start, end)
+    if booking is not None:
+        affected[booking.car_id] |= booking_days(booking.start_datetime, booking.end_datetime)
+    for car_id, days in affected.items():
+        refresh(car_id, days)
+
+
+# --- Queries ---
+
+def _inner_masks(start, end):
+    """``day_masks`` of the slots lying wholly inside [start, end)."""
+    start, end = _utc(start), _utc(end)
+    inner_start = start + (-(start - _day_start(start.date())) % SLOT)  # up to a slot boundary
+    inner_end = end - (end - _day_start(end.date())) % SLOT
+    return day_masks(inner_start, inner_end) if inner_start < inner_end else {}
+
+
+def _window(start, end):
+    start = _utc(start)
+    return start, (_utc(end) if end is not None else start + timedelta(microseconds=1))
+
+
+def _open_ended(end):
+    """Active bookings without an end that start before ``end``: they hold the car from then on."""
+    return _active(Booking.objects.filter(end_datetime__isnull=True, start_datetime__lt=end)).order_by()
+
+
+def _booked_car_ids(start, end, car_ids=None):
+    """
+    Cars with an active, ended booking overlapping [start, end), from the
+    bitmaps. A booked slot wholly inside the window settles it; cars booked
+    only in the window's partly covered edge slots are checked against
+    Booking, as the calendar rounds bookings out to whole slots.
+    """
+    masks, inner = day_masks(start, end), _inner_masks(start, end)
+    days = CarCalendarDay.objects.filter(day__in=masks)
+    if car_ids is not None:
+        days = days.filter(car_id__in=car_ids)
+    booked, edge = set(), set()
+    for car_id, day, slots in days.values_list('car_id', 'day', 'slots'):
+        hit = from_bytes(slots) & masks[day]
+        if hit & inner.get(day, 0):
+            booked.add(car_id)
+        elif hit:
+            edge.add(car_id)
+    edge -= booked
+    if edge:
+        booked.update(_active(Booking.objects.filter(
+            car_id__in=edge, start_datetime__lt=end, end_datetime__gt=start,
+        )).order_by().values_list('car_id', flat=True))
+    return booked
+
+
+def busy_car_ids(start, end=None, car_ids=None):
+    """
+    Cars with an active booking overlapping [start, end) (or covering the
+    instant ``start`` when ``end`` is None), optionally among ``car_ids``.
+    """
+    start, end = _window(start, end)
+    open_ended = _open_ended(end)
+    if car_ids is not None:
+        open_ended = open_ended.filter(car_id__in=car_ids)
+    return _booked_car_ids(start, end, car_ids) | set(open_ended.values_list('car_id', flat=True))
+
+
+def exclude_busy(cars, start, end=None):
+    """The ``cars`` queryset without the cars busy_car_ids would return (open-ended bookings as a subquery)."""
+    start, end = _window(start, end)
+    return cars.exclude(id__in=_booked_car_ids(start, end)).exclude(id__in=_open_ended(end).values('car_id'))
+
+
+def is_free(car_id, start, end):
+    return car_id not in busy_car_ids(start, end, car_ids=[car_id])
+
+
+# --- Maintenance ---
+
+def rebuild(batch_size=1000, using='default'):
+    """Redraw every calendar from Booking. Returns the number of day rows written."""
+    rows = _active(Booking.objects.using(using).filter(end_datetime__isnull=False)).values_list(
+        'car_id', 'start_datetime', 'end_datetime',
+    ).order_by().iterator(chunk_size=5000)
+    bitmaps = draw(rows)
+    with transaction.atomic(using=using):
+        CarCalendarDay.objects.using(using).all().delete()
+        _store(bitmaps, batch_size=batch_size, using=using)
+    return len(bitmaps)
+
+
+def check(car_ids=None, fix=False):
+    """
+    Compare the stored calendars with Booking. Returns ``(car_id, day,
+    expected, stored)`` for every day that differs (bitmaps as ints, 0 for
+    a missing row); with ``fix`` those days are redrawn.
+    """
+    bookings = _active(Booking.objects.filter(end_datetime__isnull=False))
+    stored_days = CarCalendarDay.objects.all()
+    if car_ids is not None:
+        bookings = bookings.filter(car_id__in=car_ids)
+        stored_days = stored_days.filter(car_id__in=car_ids)
+    expected = draw(bookings.values_list('car_id', 'start_datetime', 'end_datetime').order_by().iterator(chunk_size=5000))
+    stored = {(car_id, day): from_bytes(slots) for car_id, day, slots in stored_days.values_list('car_id', 'day', 'slots')}
+
+    problems = sorted(
+        (car_id, day, expected.get((car_id, day), 0), stored.get((car_id, day), 0))
+        for car_id, day in expected.keys() | stored.keys()
+        if expected.get((car_id, day), 0) != stored.get((car_id, day), 0)
+    )
+    if fix:
+        by_car = defaultdict(set)
+        for car_id, day, _, _ in problems:
+            by_car[car_id].add(day)
+        for car_id, days in by_car.items():
+            refresh(car_id, days)
+    return problems
@@ -0,0 +1,144 @@
+"""
+Facet counts for the car search filters, from a precomputed attribute table.
+
+Every car has one CarFacetValue row per value it carries for a facet: its
+car type, fuel, transmission, seats, AC, price band, rating band and each of
+its features. Counting every facet is then one GROUP BY over that table, so
+the cost does not grow with the number of facets.
+
+Counts are disjunctive: a facet's counts apply every active filter except
+its own, so with ``car_type=SUV`` the other car types still show how many
+cars they would give. That is still a single WHERE clause: for each
+filtered facet, a row either belongs to that facet or its car passes the
+facet's filters.
+
+Rows are redrawn by the Car, feature and review signals (see signals.py);
+``rebuild`` redraws them all after bulk loads.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Q
+from django_filters.constants import EMPTY_VALUES
+
+from .models import Car, CarFacetValue
+
+PRICE_BAND = 500  # price facet values are the lower bounds of base_fare bands this wide
+
+FACETS = ['car_type', 'fuel', 'transmission', 'seats', 'ac', 'price', 'rating', 'features']
+NUMERIC_FACETS = {'seats', 'price', 'rating'}  # listed by value rather than by count
+
+# CarFilter filter -> the facet it narrows
+FILTER_FACETS = {
+    'car_type': 'car_type',
+    'fuel': 'fuel',
+    'transmission': 'transmission',
+    'seats': 'seats',
+    'ac': 'ac',
+    'min_price': 'price',
+    'max_price': 'price',
+    'min_rating': 'rating',
+}
+
+CAR_COLUMNS = ['pk', 'car_type', 'fuel__name', 'transmission__type', 'seats', 'ac', 'base_fare', 'rating_avg']
+
+
+def draw(cars, facets=None):
+    """``(car_id, facet, value)`` for every car of the ``cars`` queryset, limited to ``facets`` if given."""
+    features = defaultdict(list)
+    rows = list(cars.values_list(*CAR_COLUMNS).order_by())
+    if facets is None or 'features' in facets:
+        links = Car.features.through.objects.using(cars.db).filter(car_id__in=[row[0] for row in rows])
+        for car_id, name in links.values_list('car_id', 'carfeature__name'):
+            features[car_id].append(name)
+
+    for car_id, car_type, fuel, transmission, seats, ac, base_fare, rating_avg in rows:
+        values = [
+            ('car_type', car_type),
+            ('fuel', fuel),
+            ('transmission', transmission),
+            ('seats', seats),
+            ('ac', 'true' if ac else 'false'),
+            ('price', int(base_fare // PRICE_BAND) * PRICE_BAND),
+            ('rating', int(rating_avg)),  # 0 until the first review
+        ] + [('features', name) for name in features[car_id]]
+        for facet, value in values:
+            if value is not None and (facets is None or facet in facets):
+                yield car_id, facet, str(value)
+
+
+def refresh(car_ids, facets=None):
+    """Redraw the facet rows of ``car_ids`` (only ``facets`` if given)."""
+    car_ids = set(car_ids)
+    if not car_ids:
+        return
+    stored = CarFacetValue.objects.filter(car_id__in=car_ids)
+    if facets is not None:
+        stored = stored.filter(facet__in=facets)
+    rows = [
+        CarFacetValue(car_id=car_id, facet=facet, value=value)
+        for car_id, facet, value in draw(Car.objects.filter(pk__in=car_ids), facets)
+    ]
+    with transaction.atomic():
+        stored.delete()
+        CarFacetValue.objects.bulk_create(rows)
+
+
+def rebuild(batch_size=1000, using='default'):
+    """Redraw every car's facet rows. Returns the number of rows written."""
+    written = 0
+    car_ids = list(Car.objects.using(using).order_by('pk').values_list('pk', flat=True))
+    with transaction.atomic(using=using):
+        CarFacetValue.objects.using(using).all().delete()
+        for i in range(0, len(car_ids), batch_size):
+            cars = Car.objects.using(using).filter(pk__in=car_ids[i:i + batch_size])
+            rows = [CarFacetValue(car_id=car_id, facet=facet, value=value) for car_id, facet, value in draw(cars)]
+            CarFacetValue.objects.using(using).bulk_create(rows, batch_size=batch_size)
+            written += len(rows)
+    return written
+
+
+def counts(filterset, cars=None):
+    """
+    ``{facet: [{'value', 'count'}, ...]}`` for a bound, valid CarFilter,
+    among ``cars`` (e.g. search results; all cars by default). Filters that
+    do not narrow a facet apply to every facet.
+    """
+    passing = {}  # facet (None: all of them) -> cars passing its filters
+    if cars is None:
+        cars = Car.objects.all()
+    else:
+        passing[None] = cars
+    for name, value in filterset.form.cleaned_data.items():
+        if value in EMPTY_VALUES:
+            continue
+        facet = FILTER_FACETS.get(name)
+        passing[facet] = filterset.filters[name].filter(passing.get(facet, cars), value)
+
+    condition = Q()
+    for facet, passed in passing.items():
+        in_filter = Q(car__in=passed.values('pk'))
+        condition &= in_filter if facet is None else Q(facet=facet) | in_filter
+    rows = (
+        CarFacetValue.objects.filter(condition)
+        .values_list('facet', 'value').annotate(count=Count('car_id')).order_by()
+    )
+
+    result = {facet: [] for facet in FACETS}
+    for facet, value, count in rows:
+        if facet in result:
+            result[facet].append({'value': _decode(facet, value), 'count': count})
+    for facet, values in result.items():
+        if facet in NUMERIC_FACETS:
+            values.sort(key=lambda item: item['value'])
+        else:
+            values.sort(key=lambda item: (-item['count'], item['value']))
+    return result
+
+
+def _decode(facet, value):
+    if facet in NUMERIC_FACETS:
+        return int(value)
+    if facet == 'ac':
+        return value == 'true'
+    return value
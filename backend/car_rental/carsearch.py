@@ -0,0 +1,111 @@
+"""
+Full-text search over the fleet with SQLite FTS5.
+
+The car_rental_car_search virtual table holds one document per car (rowid =
+car id): its name, description, address, engine, feature names and
+location name. Matches are ranked by bm25 with per-column weights, so a hit
+in the name outranks one in the description. Documents are rewritten from
+the live tables by the Car, feature and Location signals, in the writing
+transaction (see signals.py); ``rebuild`` rewrites them all after bulk loads.
+
+``CarSearchFilter`` applies ``?q=``: every word must match, as a prefix
+("swi airp" finds a Swift at the airport), and the cars are annotated with
+``search_rank`` to order by. The table is created by migration 0025, and by
+``ensure_table`` for databases built without migrations (the test database).
+"""
+import re
+
+from django.db import connection, connections, transaction
+from django.db.models import F
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Car, CarFeature, CarSearchEntry, Location
+
+TABLE = CarSearchEntry._meta.db_table
+COLUMNS = ['name', 'description', 'address', 'engine', 'features', 'location']
+WEIGHTS = [10.0, 1.0, 2.0, 2.0, 3.0, 5.0]
+MAX_WORDS = 8
+BATCH_SIZE = 500
+
+CREATE_SQL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+    f"{', '.join(COLUMNS)}, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    # Persistent default for the rank column
+    f"INSERT INTO {TABLE}({TABLE}, rank) VALUES ('rank', 'bm25({', '.join(map(str, WEIGHTS))})')",
+]
+DROP_SQL = f'DROP TABLE IF EXISTS {TABLE}'
+
+# Every car's document, from the live tables
+DOCUMENTS_SQL = f"""
+    SELECT car.id, car.name, COALESCE(car.description, ''), COALESCE(car.address, ''), car.engine,
+           COALESCE((SELECT group_concat(feature.name, ' ')
+                     FROM {Car.features.through._meta.db_table} link
+                     JOIN {CarFeature._meta.db_table} feature ON feature.id = link.carfeature_id
+                     WHERE link.car_id = car.id), ''),
+           COALESCE(location.name, '')
+    FROM {Car._meta.db_table} car
+    LEFT JOIN {Location._meta.db_table} location ON location.id = car.location_id
+"""
+INSERT_SQL = f"INSERT INTO {TABLE}(rowid, {', '.join(COLUMNS)}) {DOCUMENTS_SQL}"
+
+WORD = re.compile(r'\w+')
+
+
+def create_table(cursor):
+    for sql in CREATE_SQL:
+        cursor.execute(sql)
+
+
+def ensure_table(sender, using='default', **kwargs):
+    """post_migrate receiver: create and fill the table if the database lacks it."""
+    db = connections[using]
+    if db.vendor != 'sqlite' or TABLE in db.introspection.table_names():
+        return
+    with db.cursor() as cursor:
+        create_table(cursor)
+    rebuild(using=using)
+
+
+def refresh(car_ids):
+    """Rewrite the documents of ``car_ids``; deleted cars lose theirs."""
+    car_ids = sorted(set(car_ids))
+    with transaction.atomic(), connection.cursor() as cursor:
+        for i in range(0, len(car_ids), BATCH_SIZE):
+            batch = car_ids[i:i + BATCH_SIZE]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f'DELETE FROM {TABLE} WHERE rowid IN ({placeholders})', batch)
+            cursor.execute(f'{INSERT_SQL} WHERE car.id IN ({placeholders})', batch)
+
+
+def rebuild(using='default'):
+    """Rewrite every document. Returns the number of cars indexed."""
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+        cursor.execute(INSERT_SQL)
+        indexed = cursor.rowcount
+        cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('optimize')")
+    return indexed
+
+
+def match_expression(text):
+    """The FTS5 query for free text (every word, as a prefix), or None if it has no words."""
+    words = WORD.findall(text or '')[:MAX_WORDS]
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search(cars, text):
+    """``cars`` matching ``text``, annotated with ``search_rank``; unchanged if ``text`` has no words."""
+    expression = match_expression(text)
+    if expression is None:
+        return cars
+    return cars.filter(search_entry__document__match=expression).annotate(search_rank=F('search_entry__rank'))
+
+
+class CarSearchFilter(BaseFilterBackend):
+    """``?q=`` full-text search; combines with the other filter backends."""
+    search_param = 'q'
+
+    def filter_queryset(self, request, queryset, view):
+        return search(queryset, request.query_params.get(self.search_param))
@@ -0,0 +1,54 @@
+"""
+Process-wide cache of the small catalog tables (add-ons, packages, offers,
+policies, trip types). Each catalog is loaded and serialized once and served
+from memory until the model's change version moves on.
+"""
+import threading
+
+from .models import AddOn, Offer, Package, Policy, TripType
+from .serializers import (
+    AddOnSerializer, OfferSerializer, PackageSerializer, PolicySerializer, TripTypeSerializer,
+)
+from .versioning import get_version
+
+
+class Catalog:
+    def __init__(self, name, model, serializer_class, **filters):
+        self.name = name
+        self.model = model
+        self.serializer_class = serializer_class
+        self.filters = filters
+        self._lock = threading.Lock()
+        self._version = None
+        self._data = None
+
+    def get(self):
+        """Return ``(version, serialized rows)``; the rows must not be mutated."""
+        version = get_version(self.model)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    queryset = self.model.objects.filter(**self.filters).order_by('pk')
+                    self._data = list(self.serializer_class(queryset, many=True).data)
+                    self._version = version
+        return self._version, self._data
+
+    def etag(self, version):
+        return f'"{self.name}-{version}"'
+
+
+CATALOGS = {
+    catalog.name: catalog for catalog in [
+        Catalog('addons', AddOn, AddOnSerializer),
+        Catalog('packages', Package, PackageSerializer),
+        Catalog('offers', Offer, OfferSerializer, is_active=True),
+        Catalog('policies', Policy, PolicySerializer, is_active=True),
+        Catalog('triptypes', TripType, TripTypeSerializer),
+    ]
+}
+
+CATALOG_MODELS = [catalog.model for catalog in CATALOGS.values()]
+
+
+def get_catalog(name):
+    return CATALOGS[name]
@@ -0,0 +1,64 @@
+"""
+Conditional GET (ETag / Last-Modified) from per-model change versions.
+
+A resource's validators are derived from the versions of every model its
+representation reads (see versioning.py), never from the rendered body, so
+Django's ``condition`` can answer ``304 Not Modified`` before the view
+queries or serializes anything. Query parameters and host are part of the
+URL the client caches under, so one tag per resource covers every variant
+of a list. Last-Modified is the newest of those versions' issue times.
+"""
+import hashlib
+from functools import wraps
+
+from django.views.decorators.http import condition
+
+from .models import (
+    AddOn, Car, CarFeature, CarFuel, CarGroup, CarImage, CarTransmission, CarVariant, Location, Review,
+)
+from .versioning import get_versions, version_time
+
+# Everything CarSerializer renders (reviews via the rating aggregates on Car)
+CAR_MODELS = [
+    Car, CarImage, CarFeature, CarGroup, CarVariant, CarFuel, CarTransmission, Location, Review, AddOn,
+]
+
+
+def versions_etag(prefix, versions, *parts):
+    digest = hashlib.sha1('|'.join([*versions, *map(str, parts)]).encode()).hexdigest()[:20]
+    return f'"{prefix}-{digest}"'
+
+
+def versions_last_modified(versions):
+    times = [t for t in map(version_time, versions) if t is not None]
+    return max(times) if times else None
+
+
+def conditional(etag_func, last_modified_func=None):
+    """
+    ``condition`` for view methods: the validator functions are called as
+    ``func(view, request, *args, **kwargs)``, so they can read view state.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            def bind(func):
+                return (lambda request, *a, **kw: func(view, request, *a, **kw)) if func else None
+
+            handler = condition(etag_func=bind(etag_func), last_modified_func=bind(last_modified_func))(
+                lambda request, *a, **kw: method(view, request, *a, **kw)
+            )
+            return handler(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def model_conditional(prefix, models):
+    """``conditional`` with validators from the versions of ``models``."""
+    def etag(view, request, *args, **kwargs):
+        return versions_etag(prefix, get_versions(models))
+
+    def last_modified(view, request, *args, **kwargs):
+        return versions_last_modified(get_versions(models))
+
+    return conditional(etag, last_modified)
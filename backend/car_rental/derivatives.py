@@ -0,0 +1,89 @@
+"""
+Runs imaging.render for CarImage rows in a process pool.
+
+Uploads hand their new images to ``schedule``, which returns at once; each
+result is stored on ``CarImage.derivatives`` from the pool's callback thread
+when the worker finishes. ``build`` is the blocking batch form used by the
+backfill command. Workers are spawned rather than forked, since the server
+process is multi-threaded.
+"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .imaging import render
+from .models import CarImage
+from .versioning import bump_version
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def new_pool(workers=None):
+    return ProcessPoolExecutor(
+        max_workers=workers or getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', None),
+        mp_context=multiprocessing.get_context('spawn'),
+    )
+
+
+def pool():
+    """The process-wide pool used for uploads, started on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = new_pool()
+        return _executor
+
+
+def _store(pk, future):
+    try:
+        CarImage.objects.filter(pk=pk).update(derivatives=future.result())
+        bump_version(CarImage)
+    except Exception:
+        logger.exception("Could not build derivatives for CarImage %s", pk)
+    finally:
+        close_old_connections()
+
+
+def schedule(images):
+    """Build derivatives of saved ``images`` in the background; returns the futures."""
+    media_root = str(settings.MEDIA_ROOT)
+    futures = []
+    for image in images:
+        future = pool().submit(render, media_root, image.image.name)
+        future.add_done_callback(partial(_store, image.pk))
+        futures.append(future)
+    return futures
+
+
+def build(images, workers=None, force=False, batch_size=200):
+    """
+    Build derivatives of ``images`` in parallel and store them, blocking
+    until done. Images sharing a file are rendered once. Returns
+    ``(built, failed)`` counts.
+    """
+    media_root = str(settings.MEDIA_ROOT)
+    images = list(images)
+    names = sorted({image.image.name for image in images})
+    results = {}
+    with new_pool(workers) as executor:
+        futures = {name: executor.submit(render, media_root, name, force) for name in names}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception:
+                logger.exception("Could not build derivatives for %s", name)
+
+    built = [image for image in images if image.image.name in results]
+    for image in built:
+        image.derivatives = results[image.image.name]
+    CarImage.objects.bulk_update(built, ['derivatives'], batch_size=batch_size)
+    bump_version(CarImage)
+    return len(built), len(images) - len(built)
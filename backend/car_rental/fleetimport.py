@@ -0,0 +1,328 @@
+"""
+Bulk fleet import: upsert cars from CSV or JSON records.
+
+Every record is one car, keyed by its ``registration_number``: a car that
+already has the number is updated, otherwise one is created, so importing
+the same file twice changes nothing. Columns a record leaves out are left
+alone on existing cars; a new car needs at least the columns without a
+default (name, car_type, engine and mileage).
+
+Related rows are named, not numbered: ``location``, ``fuel``,
+``transmission`` (its type), ``color``, ``group`` and ``variant`` by name,
+and the list columns ``features`` and ``trip_types`` by names, ``images`` by
+storage names (JSON lists, ``;``-separated in CSV). Lookups are loaded once
+and resolved in memory; missing ones are created in bulk, except variants
+and trip types, which must exist. Feature and trip type lists replace the
+car's; images are added if missing and never removed.
+
+Cars are written with batched bulk_create and bulk_update (changed cars
+only), and list columns as through-table rows added and deleted in bulk.
+Bulk writes send no signals, so the import redraws the facet rows and
+search documents of the cars it touched and bumps the change versions
+itself.
+"""
+import csv
+import json
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import carfacets, carsearch
+from .conditional import CAR_MODELS
+from .models import (
+    Car, CarColor, CarFeature, CarFuel, CarGroup, CarImage, CarTransmission, CarVariant, Location, TripType,
+)
+from .versioning import bump_version
+
+KEY = 'registration_number'
+FIELDS = [
+    'name', 'description', 'address', 'car_type', 'model_year', 'engine', 'mileage', 'boot_space', 'wheels',
+    'hybrid_tech', 'seats', 'ac', 'luggage', 'is_fulfillment_center', 'base_fare', 'tax', 'unit_fare',
+    'unit_fare_after_km', 'price_per_km_extra', 'insurance',
+]
+# column -> (model, name field, created when missing)
+LOOKUPS = {
+    'location': (Location, 'name', True),
+    'fuel': (CarFuel, 'name', True),
+    'transmission': (CarTransmission, 'type', True),
+    'color': (CarColor, 'name', True),
+    'group': (CarGroup, 'name', True),
+    'variant': (CarVariant, 'name', False),
+}
+LISTS = {
+    'features': (CarFeature, 'name', True),
+    'trip_types': (TripType, 'name', False),
+}
+LIST_SEPARATOR = ';'
+TRUE_VALUES = {'1', 't', 'true', 'y', 'yes'}
+FALSE_VALUES = {'0', 'f', 'false', 'n', 'no'}
+QUERY_CHUNK = 500  # ids per IN (...) query
+
+
+class FleetImportError(Exception):
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} invalid records')
+        self.errors = errors
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.links_added = 0
+        self.links_removed = 0
+        self.images_added = 0
+        self.errors = []  # (record number, message)
+
+    def __str__(self):
+        return (
+            f'{self.created} created, {self.updated} updated, {self.unchanged} unchanged, '
+            f'{self.links_added} links added, {self.links_removed} removed, {self.images_added} images added, '
+            f'{len(self.errors)} invalid'
+        )
+
+
+# --- Reading ---
+
+def read_records(path, file_format=None):
+    """The records of a CSV or JSON file (a list of objects, or ``{"cars": [...]}``)."""
+    file_format = file_format or ('json' if path.lower().endswith('.json') else 'csv')
+    if file_format == 'json':
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        records = data.get('cars') if isinstance(data, dict) else data
+        if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+            raise ValueError('Expected a list of car objects.')
+        return records
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return list(csv.DictReader(f))
+
+
+def _names(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(LIST_SEPARATOR)
+    return [str(name).strip() for name in value if str(name).strip()]
+
+
+def _scalar(field, value):
+    if isinstance(value, str):
+        value = value.strip()
+        if field.get_internal_type() == 'BooleanField' and value.lower() in TRUE_VALUES | FALSE_VALUES:
+            value = value.lower() in TRUE_VALUES
+    if value in ('', None):
+        if field.null:
+            value = None
+        elif field.has_default():
+            value = field.get_default()
+        else:
+            value = ''
+    return field.clean(value, None)
+
+
+# --- Importing ---
+
+class FleetImport:
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.result = ImportResult()
+        self.rows = []  # (car id, cleaned record) once upserted
+        self.fields = {name: Car._meta.get_field(name) for name in FIELDS}
+        # Columns a new car cannot do without
+        self.required = [name for name, field in self.fields.items() if not field.blank and not field.has_default()]
+
+    def run(self, records, skip_invalid=False):
+        """
+        Upsert ``records``; raises FleetImportError before writing anything
+        if some are invalid, unless ``skip_invalid``. Call inside a transaction.
+        """
+        ids = self.resolve_lookups(records)
+        existing, shared = self.existing_cars({str(record.get(KEY) or '').strip() for record in records} - {''})
+        rows = self.clean(records, ids, existing, shared)
+        if self.result.errors and not skip_invalid:
+            raise FleetImportError(self.result.errors)
+        self.create_lookups(ids)
+        touched = self.upsert(rows, ids, existing)
+        touched |= self.set_lists(ids)
+        touched |= self.add_images()
+        self.refresh(touched)
+        return self.result
+
+    def resolve_lookups(self, records):
+        """``{column: {name: pk or None}}`` for every name used; None marks a lookup to create."""
+        ids = {}
+        for column, (model, name_field, _) in {**LOOKUPS, **LISTS}.items():
+            names = set()
+            for record in records:
+                if column in LISTS:
+                    names.update(_names(record.get(column)))
+                elif record.get(column) not in (None, ''):
+                    names.add(str(record[column]).strip())
+            if not names:
+                ids[column] = {}
+                continue
+            # The lowest pk wins where names repeat (groups, variants, trip types)
+            known = dict(model.objects.order_by('-pk').values_list(name_field, 'pk'))
+            ids[column] = {name: known.get(name) for name in names}
+        return ids
+
+    def clean(self, records, ids, existing, shared):
+        """``[(record number, key, {field: value}, {list column: [names]}, images)]`` for the valid records."""
+        rows = []
+        seen = set()
+        for number, record in enumerate(records, start=1):
+            key = str(record.get(KEY) or '').strip()
+            errors = []
+            if not key:
+                errors.append(f'{KEY} is required')
+            elif key in seen:
+                errors.append(f'{KEY} {key!r} appears more than once')
+            elif key in shared:
+                errors.append(f'{KEY} {key!r} matches several cars')
+            elif key not in existing:
+                errors += [f'{name} is required for a new car' for name in self.required if name not in record]
+            seen.add(key)
+
+            values = {}
+            for name, field in self.fields.items():
+                if name in record:
+                    try:
+                        values[name] = _scalar(field, record[name])
+                    except ValidationError as e:
+                        errors.append(f"{name}: {' '.join(e.messages)}")
+            for column, (_, _, creatable) in LOOKUPS.items():
+                if column in record:
+                    name = str(record[column] or '').strip()
+                    if name and ids[column][name] is None and not creatable:
+                        errors.append(f'unknown {column} {name!r}')
+                    values[Car._meta.get_field(column).attname] = name or None  # resolved after creation
+            lists = {}
+            for column, (_, _, creatable) in LISTS.items():
+                if column in record:
+                    lists[column] = _names(record[column])
+                    if not creatable:
+                        errors += [f'unknown {column} value {name!r}' for name in lists[column] if ids[column][name] is None]
+            images = _names(record['images']) if 'images' in record else None
+
+            if errors:
+                self.result.errors.append((number, '; '.join(errors)))
+            else:
+                rows.append((number, key, values, lists, images))
+        return rows
+
+    def create_lookups(self, ids):
+        for column, (model, name_field, creatable) in {**LOOKUPS, **LISTS}.items():
+            missing = sorted(name for name, pk in ids[column].items() if pk is None)
+            if creatable and missing:
+                created = model.objects.bulk_create([model(**{name_field: name}) for name in missing], batch_size=self.batch_size)
+                ids[column].update((getattr(obj, name_field), obj.pk) for obj in created)
+
+    def existing_cars(self, keys):
+        """``{registration number: values() row}``, reporting numbers several cars share."""
+        attnames = ['pk', KEY, *FIELDS, *(Car._meta.get_field(column).attname for column in LOOKUPS)]
+        found = {}
+        shared = set()
+        keys = sorted(keys)
+        for i in range(0, len(keys), QUERY_CHUNK):
+            for row in Car.objects.filter(**{f'{KEY}__in': keys[i:i + QUERY_CHUNK]}).values(*attnames).order_by('pk'):
+                if row[KEY] in found:
+                    shared.add(row[KEY])
+                found[row[KEY]] = row
+        return found, shared
+
+    def upsert(self, rows, ids, existing):
+        attname_columns = {Car._meta.get_field(column).attname: column for column in LOOKUPS}
+        to_create = []
+        to_update = defaultdict(list)  # fields -> cars to write them on
+        kept = []
+        for row in rows:
+            key, values = row[1], row[2]
+            for attname, column in attname_columns.items():
+                if attname in values and values[attname] is not None:
+                    values[attname] = ids[column][values[attname]]
+            current = existing.get(key)
+            if current is None:
+                car = Car(**{KEY: key}, **values)
+                to_create.append(car)
+                kept.append((car, row))
+                continue
+            if any(current[name] != value for name, value in values.items()):
+                to_update[frozenset(values)].append(Car(pk=current['pk'], **values))
+                self.result.updated += 1
+            else:
+                self.result.unchanged += 1
+            kept.append((Car(pk=current['pk']), row))
+
+        for i in range(0, len(to_create), self.batch_size):
+            Car.objects.bulk_create(to_create[i:i + self.batch_size])
+        self.result.created = len(to_create)
+        # Records naming the same columns share a bulk_update (CSV: all of them)
+        for fields, cars in to_update.items():
+            Car.objects.bulk_update(cars, sorted(fields), batch_size=self.batch_size)
+        self.rows = [(car.pk, row) for car, row in kept]
+        return {car.pk for car in to_create} | {car.pk for cars in to_update.values() for car in cars}
+
+    def set_lists(self, ids):
+        touched = set()
+        for column in LISTS:
+            field = Car._meta.get_field(column)
+            through = field.remote_field.through
+            car_column, target_column = field.m2m_field_name() + '_id', field.m2m_reverse_field_name() + '_id'
+            wanted = {car_id: {ids[column][name] for name in row[3][column]} for car_id, row in self.rows if column in row[3]}
+            car_ids = sorted(wanted)
+            current = defaultdict(dict)  # car -> {target: through row pk}
+            for i in range(0, len(car_ids), QUERY_CHUNK):
+                links = through.objects.filter(**{f'{car_column}__in': car_ids[i:i + QUERY_CHUNK]})
+                for pk, car_id, target_id in links.values_list('pk', car_column, target_column):
+                    current[car_id][target_id] = pk
+
+            added, removed = [], []
+            for car_id, targets in wanted.items():
+                have = current[car_id]
+                added += [through(**{car_column: car_id, target_column: target}) for target in targets - have.keys()]
+                removed += [pk for target, pk in have.items() if target not in targets]
+                if targets != have.keys():
+                    touched.add(car_id)
+            through.objects.bulk_create(added, batch_size=self.batch_size)
+            for i in range(0, len(removed), QUERY_CHUNK):
+                through.objects.filter(pk__in=removed[i:i + QUERY_CHUNK]).delete()
+            self.result.links_added += len(added)
+            self.result.links_removed += len(removed)
+        return touched
+
+    def add_images(self):
+        wanted = {car_id: row[4] for car_id, row in self.rows if row[4]}
+        car_ids = sorted(wanted)
+        have = defaultdict(set)
+        for i in range(0, len(car_ids), QUERY_CHUNK):
+            for car_id, name in CarImage.objects.filter(car_id__in=car_ids[i:i + QUERY_CHUNK]).values_list('car_id', 'image'):
+                have[car_id].add(name)
+        images = [
+            CarImage(car_id=car_id, image=name)
+            for car_id, names in wanted.items() for name in dict.fromkeys(names) if name not in have[car_id]
+        ]
+        CarImage.objects.bulk_create(images, batch_size=self.batch_size)
+        self.result.images_added = len(images)
+        return {image.car_id for image in images}
+
+    def refresh(self, car_ids):
+        """What the skipped signals would have done for ``car_ids``."""
+        if not car_ids:
+            return
+        car_ids = sorted(car_ids)
+        for i in range(0, len(car_ids), QUERY_CHUNK):
+            carfacets.refresh(car_ids[i:i + QUERY_CHUNK])
+        carsearch.refresh(car_ids)
+        transaction.on_commit(lambda: [bump_version(model) for model in {*CAR_MODELS, TripType}])
+
+
+def import_fleet(records, batch_size=1000, skip_invalid=False, dry_run=False):
+    """Upsert ``records`` atomically (rolled back with ``dry_run``); returns the ImportResult."""
+    with transaction.atomic():
+        result = FleetImport(batch_size).run(records, skip_invalid=skip_invalid)
+        if dry_run:
+            transaction.set_rollback(True)
+    return result
@@ -0,0 +1,136 @@
+"""
+Grid index over Location coordinates for "nearest pickup point" lookups.
+
+Points are bucketed into fixed-size lat/lng cells. A query only visits the
+cells under the search radius' bounding box (or, when the box spans more
+cells than hold points, the occupied cells inside it), drops points outside
+the box, and runs the Haversine formula on what is left, using radians and cosines
+precomputed at build time. The index rebuilds itself when the Location
+change version moves on (see versioning.py).
+"""
+import heapq
+import threading
+from math import asin, cos, degrees, floor, pi, radians, sin, sqrt
+
+from .models import Location
+from .versioning import get_version
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.195
+CELL_DEGREES = 0.25
+MAX_RADIUS_KM = 20016.0  # half the earth's circumference
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(radians, (lat1, lng1, lat2, lng2))
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a)))
+
+
+_COLUMNS = round(360 / CELL_DEGREES)
+
+
+def _column(col):
+    """Fold grid columns past the antimeridian back into [-180, 180)."""
+    return (col + _COLUMNS // 2) % _COLUMNS - _COLUMNS // 2
+
+
+def _cell(lat, lng):
+    return floor(lat / CELL_DEGREES), _column(floor(lng / CELL_DEGREES))
+
+
+class LocationGrid:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._cells = {}
+        self._size = 0
+
+    def _refresh(self):
+        version = get_version(Location)
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            cells = {}
+            rows = Location.objects.filter(
+                latitude__isnull=False, longitude__isnull=False
+            ).values_list('id', 'latitude', 'longitude')
+            for pk, lat, lng in rows.iterator(chunk_size=5000):
+                lat, lng = float(lat), float(lng)
+                lat_r = radians(lat)
+                cells.setdefault(_cell(lat, lng), []).append(
+                    (pk, lat, lng, lat_r, radians(lng), cos(lat_r))
+                )
+            self._cells = cells
+            self._size = sum(map(len, cells.values()))
+            self._version = version
+
+    def _candidates(self, lat, lng, radius_km):
+        """Points inside the bounding box of the search circle."""
+        dlat = radius_km / KM_PER_DEGREE
+        sin_d = sin(min(radius_km / EARTH_RADIUS_KM, pi / 2))
+        cos_lat = cos(radians(lat))
+        if abs(lat) + dlat >= 90 or sin_d >= cos_lat:
+            dlng = 180.0  # the circle reaches a pole: every longitude is in range
+        else:
+            dlng = degrees(asin(sin_d / cos_lat))
+        lat_lo, lat_hi = lat - dlat, lat + dlat
+        row_lo, row_hi = floor(lat_lo / CELL_DEGREES), floor(lat_hi / CELL_DEGREES)
+        if dlng >= 180:
+            cols = range(-_COLUMNS // 2, _COLUMNS // 2)
+        else:
+            cols = {
+                _column(col) for col in
+                range(floor((lng - dlng) / CELL_DEGREES), floor((lng + dlng) / CELL_DEGREES) + 1)
+            }
+        cells = self._cells
+        if (row_hi - row_lo + 1) * len(cols) > len(cells):
+            # A wide box: walk the occupied cells rather than the empty ones
+            boxed = (
+                points for (row, col), points in cells.items()
+                if row_lo <= row <= row_hi and col in cols
+            )
+        else:
+            boxed = (
+                cells[row, col] for row in range(row_lo, row_hi + 1) for col in cols if (row, col) in cells
+            )
+        for points in boxed:
+            for point in points:
+                if lat_lo <= point[1] <= lat_hi:
+                    yield point
+
+    def nearest(self, lat, lng, radius_km=None, limit=10):
+        """
+        ``[(location_id, distance_km), ...]`` closest first. Without a radius
+        the search widens until ``limit`` points, or all of them, are found.
+        """
+        self._refresh()
+        if radius_km is not None:
+            return self._within(lat, lng, min(radius_km, MAX_RADIUS_KM), limit)
+        radius_km = 10.0
+        while True:
+            found = self._within(lat, lng, radius_km, limit)
+            if len(found) >= min(limit, self._size) or radius_km >= MAX_RADIUS_KM:
+                return found
+            radius_km = min(radius_km * 4, MAX_RADIUS_KM)
+
+    def _within(self, lat, lng, radius_km, limit):
+        lat1 = radians(lat)
+        lng1 = radians(lng)
+        cos1 = cos(lat1)
+        # sin^2(d / 2R) threshold: compare before the asin/sqrt
+        limit_h = sin(min(radius_km / (2 * EARTH_RADIUS_KM), pi / 2)) ** 2
+        hits = []
+        for pk, _, _, lat2, lng2, cos2 in self._candidates(lat, lng, radius_km):
+            h = sin((lat2 - lat1) / 2) ** 2 + cos1 * cos2 * sin((lng2 - lng1) / 2) ** 2
+            if h <= limit_h:
+                hits.append((h, pk))
+        return [
+            (pk, 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(h))))
+            for h, pk in heapq.nsmallest(limit, hits)
+        ]
+
+
+location_grid = LocationGrid()
@@ -0,0 +1,73 @@
+"""
+Resized, re-encoded variants of car photos.
+
+Pure Pillow with no Django imports, so ``render`` can run in spawned pool
+worker processes (see derivatives.py). Every variant is written next to the
+other derivatives under MEDIA_ROOT/car_images/derived/, in each of FORMATS,
+named by the original's stem and a digest of its full storage name so
+``x.jpg`` and ``x.png`` (or same-named files in other folders) never share
+variants.
+"""
+import hashlib
+import os
+from pathlib import PurePosixPath
+
+from PIL import Image, ImageOps
+
+# (name, max width), largest first: each variant is resized from the previous one
+VARIANTS = (('full', 1600), ('card', 480), ('thumb', 160))
+FORMATS = (
+    ('jpeg', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    ('webp', 'webp', {'quality': 80, 'method': 4}),
+)
+DERIVED_DIR = 'car_images/derived'
+
+
+def derivative_name(name, variant, extension):
+    digest = hashlib.sha1(name.encode(), usedforsecurity=False).hexdigest()[:10]
+    return f'{DERIVED_DIR}/{PurePosixPath(name).stem}_{digest}_{variant}.{extension}'
+
+
+def _save(image, path, format, options):
+    tmp = f'{path}.tmp'
+    image.save(tmp, format=format, **options)
+    os.replace(tmp, path)  # readers never see a half-written file
+
+
+def _fresh(path, source_mtime):
+    try:
+        return os.path.getmtime(path) >= source_mtime
+    except OSError:
+        return False
+
+
+def render(media_root, name, force=False):
+    """
+    Write every variant of the image stored at ``name`` (relative to
+    ``media_root``) and return ``{variant: {'width', 'height', format: name}}``.
+    Variants newer than the original are kept unless ``force``.
+    """
+    source = os.path.join(media_root, name)
+    source_mtime = os.path.getmtime(source)
+    os.makedirs(os.path.join(media_root, DERIVED_DIR), exist_ok=True)
+
+    with Image.open(source) as original:
+        # Let the JPEG decoder downscale while decoding (much cheaper than a full decode)
+        largest = VARIANTS[0][1]
+        original.draft('RGB', (largest, largest * original.height // max(original.width, 1)))
+        image = ImageOps.exif_transpose(original).convert('RGB')
+
+    result = {}
+    for variant, max_width in VARIANTS:
+        if image.width > max_width:
+            height = max(1, round(image.height * max_width / image.width))
+            image = image.resize((max_width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        entry = {'width': image.width, 'height': image.height}
+        for format, extension, options in FORMATS:
+            derived = derivative_name(name, variant, extension)
+            path = os.path.join(media_root, derived)
+            if force or not _fresh(path, source_mtime):
+                _save(image, path, format.upper(), options)
+            entry[format] = derived
+        result[variant] = entry
+    return result
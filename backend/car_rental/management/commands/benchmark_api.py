@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from car_rental.benchmarks import default_scenarios, run_benchmarks, write_report
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the main API endpoints through the Django test client and write "
+        "latency percentiles, throughput and query counts to a JSON report. "
+        "Creates auth tokens and temp bookings in the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--only', nargs='*', help="Scenario names to run (default: all)")
+        parser.add_argument('--output', default='bench_output.json')
+
+    def handle(self, *args, **options):
+        scenarios = default_scenarios()
+        if options['only']:
+            unknown = set(options['only']) - {s.name for s in scenarios}
+            if unknown:
+                raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+            scenarios = [s for s in scenarios if s.name in options['only']]
+        report = run_benchmarks(
+            scenarios, iterations=options['iterations'], warmup=options['warmup'], seed=options['seed'],
+        )
+        write_report(report, options['output'])
+
+        self.stdout.write(f"{'scenario':<20} {'p50':>9} {'p95':>9} {'p99':>9} {'rps':>9} {'queries':>8}")
+        for name, result in report['endpoints'].items():
+            latency = result['latency_ms']
+            self.stdout.write(
+                f"{name:<20} {latency['p50']:>9.2f} {latency['p95']:>9.2f} {latency['p99']:>9.2f} "
+                f"{result['throughput_rps']:>9.1f} {result['queries']['mean']:>8.1f}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from car_rental.benchmarks import compare_wsgi_asgi, write_report
+
+ENDPOINTS = ('health', 'cars_available', 'locations_search', 'temp_booking_get')
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare throughput of the sync endpoints under WSGI with their async twins "
+        "(/api/async/...) under ASGI at high concurrency, and write a JSON report. "
+        "Creates one temp booking in the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--requests', type=int, default=500, help="Requests per endpoint and side")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--only', nargs='*', help="Endpoint names to run (default: all)")
+        parser.add_argument('--output', default='bench_asgi_output.json')
+
+    def handle(self, *args, **options):
+        if options['only']:
+            unknown = set(options['only']) - set(ENDPOINTS)
+            if unknown:
+                raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+        report = compare_wsgi_asgi(
+            concurrency=options['concurrency'], requests=options['requests'],
+            seed=options['seed'], only=options['only'],
+        )
+        write_report(report, options['output'])
+
+        self.stdout.write(f"{'endpoint':<18} {'wsgi rps':>9} {'asgi rps':>9} {'speedup':>8} {'wsgi p95':>9} {'asgi p95':>9}")
+        for name, result in report['endpoints'].items():
+            wsgi, asgi = result['wsgi'], result['asgi']
+            self.stdout.write(
+                f"{name:<18} {wsgi['throughput_rps']:>9.1f} {asgi['throughput_rps']:>9.1f} "
+                f"{result['asgi_speedup'] or 0:>7.2f}x {wsgi['latency_ms']['p95']:>9.2f} "
+                f"{asgi['latency_ms']['p95']:>9.2f}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from car_rental.benchmarks import compare_list_serializers, write_report
+
+LISTS = ('cars', 'bookings', 'reviews')
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the CPU time of rendering car, booking and review list pages with "
+        "the DRF serializers and with their values() twins, and write a JSON report."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 500], help="Rows per page")
+        parser.add_argument('--repeat', type=int, default=20, help="Runs per measurement (best is kept)")
+        parser.add_argument('--only', nargs='*', help="Lists to run (default: all)")
+        parser.add_argument('--output', default='bench_serializers_output.json')
+
+    def handle(self, *args, **options):
+        if options['only']:
+            unknown = set(options['only']) - set(LISTS)
+            if unknown:
+                raise CommandError(f"Unknown lists: {', '.join(sorted(unknown))}")
+
+        report = compare_list_serializers(sizes=options['sizes'], repeat=options['repeat'], only=options['only'])
+        write_report(report, options['output'])
+
+        self.stdout.write(f"{'list':<14} {'rows':>6} {'drf ms':>9} {'values ms':>10} {'speedup':>8}")
+        for name, result in report['lists'].items():
+            self.stdout.write(
+                f"{name:<14} {result['rows']:>6} {result['drf_cpu_ms']:>9.2f} "
+                f"{result['values_cpu_ms']:>10.2f} {result['speedup'] or 0:>7.2f}x"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
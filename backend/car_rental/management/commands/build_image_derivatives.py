@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from car_rental.derivatives import build
+from car_rental.models import CarImage
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate thumbnail/card/full JPEG and WebP variants of car images in a "
+        "process pool and store them on CarImage.derivatives. Only images without "
+        "variants are processed unless --force is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per CPU)")
+        parser.add_argument('--force', action='store_true', help="Rebuild every image and overwrite its files")
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        images = CarImage.objects.only('id', 'image').order_by('pk')
+        if not options['force']:
+            images = images.filter(derivatives={})
+        started = time.perf_counter()
+        built, failed = build(
+            images, workers=options['workers'], force=options['force'], batch_size=options['batch_size'],
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Built derivatives for {built} images in {elapsed:.1f}s"))
+        if failed:
+            self.stderr.write(f"{failed} images failed; see the log for details")
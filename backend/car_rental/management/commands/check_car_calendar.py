@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from car_rental.carcalendar import SLOTS_PER_DAY, check
+
+
+def _slots(bitmap):
+    return ''.join('#' if bitmap >> slot & 1 else '.' for slot in range(SLOTS_PER_DAY))
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare every car's availability calendar with its active bookings and "
+        "list the days that differ. Exits with an error if any do, unless --fix "
+        "redraws them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--car', type=int, nargs='*', dest='car_ids', help="Only these car ids")
+        parser.add_argument('--fix', action='store_true', help="Redraw the days that differ")
+
+    def handle(self, *args, **options):
+        problems = check(car_ids=options['car_ids'], fix=options['fix'])
+        for car_id, day, expected, stored in problems:
+            self.stdout.write(f"car {car_id} {day}\n  expected {_slots(expected)}\n  stored   {_slots(stored)}")
+        if not problems:
+            self.stdout.write(self.style.SUCCESS("Availability calendars match the bookings"))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f"Redrew {len(problems)} car-days"))
+        else:
+            raise CommandError(f"{len(problems)} car-days differ from the bookings (run with --fix to redraw them)")
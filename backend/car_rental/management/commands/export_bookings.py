@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from car_rental import bookingexport
+
+
+class Command(BaseCommand):
+    help = (
+        "Export bookings as CSV or NDJSON, streamed from one chunked query so memory "
+        "stays flat. Dates are ISO dates or datetimes; a date covers its whole day."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(bookingexport.FORMATS), default='csv')
+        parser.add_argument('--output', help="File to write (default: stdout)")
+        for name in bookingexport.RANGE_FILTERS:
+            parser.add_argument(f"--{name.replace('_', '-')}", dest=name)
+        parser.add_argument('--status', help="Comma-separated statuses")
+        parser.add_argument('--chunk-size', type=int, default=bookingexport.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        filters, errors = bookingexport.parse_filters(options)
+        if errors:
+            raise CommandError('; '.join(f'{name}: {error}' for name, error in errors.items()))
+        chunks = bookingexport.stream(options['format'], filters, options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as out:
+                out.writelines(chunks)
+            self.stderr.write(self.style.SUCCESS(f"Exported bookings to {options['output']}"))
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
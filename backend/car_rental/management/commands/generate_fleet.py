@@ -0,0 +1,225 @@
+import os
+import random
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from car_rental.conditional import CAR_MODELS
+from car_rental.models import (
+    AddOn, Booking, Car, CarColor, CarFeature, CarFuel, CarGroup, CarImage,
+    CarTransmission, CarVariant, Location, Review, TripType,
+)
+from car_rental.carcalendar import rebuild as rebuild_calendar
+from car_rental.carfacets import rebuild as rebuild_facets
+from car_rental.carsearch import rebuild as rebuild_search
+from car_rental.ratings import rebuild as rebuild_ratings
+from car_rental.versioning import bump_version
+
+CITIES = [
+    ('Bengaluru', 12.9716, 77.5946), ('Chennai', 13.0827, 80.2707),
+    ('Mumbai', 19.0760, 72.8777), ('Delhi', 28.7041, 77.1025),
+    ('Hyderabad', 17.3850, 78.4867), ('Pune', 18.5204, 73.8567),
+    ('Kolkata', 22.5726, 88.3639), ('Coimbatore', 11.0168, 76.9558),
+]
+AREAS = ['Airport', 'Central', 'Railway Station', 'Bus Stand', 'Tech Park', 'Mall', 'Metro', 'Market']
+MODELS = ['Swift', 'Dzire', 'Baleno', 'Ertiga', 'Creta', 'Innova', 'City', 'Nexon', 'XUV700', 'Verna']
+FEATURES = ['GPS', 'Bluetooth', 'Sunroof', 'Rear Camera', 'Cruise Control', 'USB Charging',
+            'Child Seat', 'Airbags', 'ABS', 'Apple CarPlay', 'Android Auto', 'Roof Rack']
+TRIP_TYPES = ['Hourly Rental', 'Outstation Rental', 'One Way', 'Round Trip']
+STATUSES = [Booking.STATUS_CONFIRMED] * 7 + [Booking.STATUS_PENDING] * 2 + [Booking.STATUS_CANCELLED]
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic fleet (locations, cars with features/images, users, reviews "
+        "and bookings) with bulk inserts, for benchmarking."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cars', type=int, default=1000)
+        parser.add_argument('--locations', type=int, default=200)
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--bookings', type=int, default=100000)
+        parser.add_argument('--reviews-per-car', type=int, default=5)
+        parser.add_argument('--images-per-car', type=int, default=3)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.tag = uuid.UUID(int=self.rng.getrandbits(128)).hex[:6]
+
+        with transaction.atomic():
+            lookups = self.create_lookups()
+            locations = self.create_locations(options['locations'])
+            cars = self.create_cars(options['cars'], locations, lookups, options['images_per_car'])
+            users = self.create_users(options['users'])
+        with transaction.atomic():
+            self.create_reviews(cars, users, options['reviews_per_car'])
+        self.create_bookings(cars, users, locations, lookups['trip_types'], options['bookings'])
+
+        rebuild_ratings(batch_size=self.batch_size)
+        rebuild_calendar(batch_size=self.batch_size)  # bookings were bulk-inserted without signals
+        rebuild_facets(batch_size=self.batch_size)  # after the ratings: rating bands come from them
+        rebuild_search()
+        for model in {Location, AddOn, TripType, *CAR_MODELS}:
+            bump_version(model)
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {len(locations)} locations, {len(cars)} cars, {len(users)} users, "
+            f"{options['bookings']} bookings (tag {self.tag})"
+        ))
+
+    def bulk(self, model, objs):
+        """bulk_create in batches; returns the created objects (with pks on SQLite/Postgres)."""
+        created = []
+        for i in range(0, len(objs), self.batch_size):
+            created += model.objects.bulk_create(objs[i:i + self.batch_size], batch_size=self.batch_size)
+        return created
+
+    def create_lookups(self):
+        lookups = {
+            'groups': [CarGroup.objects.get_or_create(name=name)[0] for name in ('Economy', 'Premium', 'Luxury')],
+            'variants': [
+                CarVariant.objects.get_or_create(name=name, defaults={'price_min': low, 'price_max': low * 2})[0]
+                for name, low in (('Sigma', 600), ('Delta', 800), ('Zeta', 1000), ('Alpha', 1300))
+            ],
+            'fuels': [CarFuel.objects.get_or_create(name=name)[0] for name in ('Petrol', 'Diesel', 'CNG', 'Electric')],
+            'transmissions': [CarTransmission.objects.get_or_create(type=name)[0] for name in ('Manual', 'Automatic')],
+            'colors': [CarColor.objects.get_or_create(name=name)[0] for name in ('White', 'Black', 'Silver', 'Red', 'Blue')],
+            'features': [CarFeature.objects.get_or_create(name=name)[0] for name in FEATURES],
+            'trip_types': [TripType.objects.get_or_create(name=name)[0] for name in TRIP_TYPES],
+        }
+        for code, name, price in (('GPS', 'GPS Navigation', 100), ('SEAT', 'Child Seat', 150), ('INS', 'Zero Dep Insurance', 300)):
+            AddOn.objects.get_or_create(code=code, defaults={'name': name, 'price': price})
+        return lookups
+
+    def create_locations(self, count):
+        rng = self.rng
+        objs = []
+        for i in range(count):
+            city, lat, lng = rng.choice(CITIES)
+            area = rng.choice(AREAS)
+            objs.append(Location(
+                name=f'{city} {area} {self.tag}-{i}',
+                address=f'{rng.randint(1, 999)} {area} Road, {city}',
+                latitude=Decimal(f'{lat + rng.uniform(-0.3, 0.3):.6f}'),
+                longitude=Decimal(f'{lng + rng.uniform(-0.3, 0.3):.6f}'),
+            ))
+        return self.bulk(Location, objs)
+
+    def create_cars(self, count, locations, lookups, images_per_car):
+        rng = self.rng
+        objs = []
+        for i in range(count):
+            car_type = rng.choice(['Hatchback', 'Sedan', 'SUV'])
+            base_fare = Decimal(rng.randrange(800, 4000, 50))
+            objs.append(Car(
+                name=rng.choice(MODELS),
+                description='Synthetic benchmark car',
+                car_type=car_type,
+                model_year=rng.randint(2018, 2025),
+                group=rng.choice(lookups['groups']),
+                variant=rng.choice(lookups['variants']),
+                registration_number=f'KA{rng.randint(1, 99):02d}-{self.tag}-{i}',
+                location=rng.choice(locations) if locations else None,
+                fuel=rng.choice(lookups['fuels']),
+                engine=f'{rng.choice([1.0, 1.2, 1.5, 2.0, 2.2])}L',
+                mileage=f'{rng.randint(12, 25)} km/l',
+                seats=7 if car_type == 'SUV' else 5,
+                ac=rng.random() < 0.9,
+                color=rng.choice(lookups['colors']),
+                transmission=rng.choice(lookups['transmissions']),
+                luggage=rng.randint(1, 4),
+                base_fare=base_fare,
+                tax=(base_fare * Decimal('0.05')).quantize(Decimal('0.01')),
+                unit_fare=Decimal(rng.randint(10, 25)),
+                insurance=Decimal(rng.choice([0, 99, 199])),
+            ))
+        cars = self.bulk(Car, objs)
+
+        # Point images at photos already in MEDIA_ROOT so they render
+        photo_dir = os.path.join(settings.MEDIA_ROOT, 'car_images')
+        photos = sorted(os.listdir(photo_dir)) if os.path.isdir(photo_dir) else []
+        feature_links = []
+        trip_links = []
+        images = []
+        FeatureLink = Car.features.through
+        TripLink = Car.trip_types.through
+        for car in cars:
+            for feature in rng.sample(lookups['features'], rng.randint(3, 8)):
+                feature_links.append(FeatureLink(car_id=car.pk, carfeature_id=feature.pk))
+            for trip_type in rng.sample(lookups['trip_types'], rng.randint(1, len(TRIP_TYPES))):
+                trip_links.append(TripLink(car_id=car.pk, triptype_id=trip_type.pk))
+            for n in range(images_per_car):
+                image = f'car_images/{rng.choice(photos)}' if photos else f'car_images/bench_{car.pk}_{n}.jpg'
+                images.append(CarImage(car_id=car.pk, image=image, alt_text=car.name))
+        self.bulk(FeatureLink, feature_links)
+        self.bulk(TripLink, trip_links)
+        self.bulk(CarImage, images)
+        return cars
+
+    def create_users(self, count):
+        objs = [User(username=f'bench_{self.tag}_{i}', password='!') for i in range(count)]
+        return self.bulk(User, objs)
+
+    def create_reviews(self, cars, users, per_car):
+        rng = self.rng
+        objs = []
+        for car in cars:
+            for _ in range(rng.randint(0, per_car * 2)):
+                objs.append(Review(
+                    car_id=car.pk,
+                    user=rng.choice(users) if users else None,
+                    rating=rng.choices([1, 2, 3, 4, 5], weights=[1, 2, 5, 10, 8])[0],
+                    comment='Synthetic review',
+                ))
+        self.bulk(Review, objs)
+
+    def create_bookings(self, cars, users, locations, trip_types, total):
+        """Per-car timelines of back-to-back bookings, inserted batch by batch."""
+        if not cars or not users:
+            return
+        rng = self.rng
+        now = timezone.now().replace(minute=0, second=0, microsecond=0)
+        per_car = max(1, total // len(cars))
+        cursor = {car.pk: now - timedelta(hours=per_car * 30) for car in cars}
+        batch = []
+        made = 0
+        while made < total:
+            car = cars[made % len(cars)]
+            start = cursor[car.pk] + timedelta(hours=rng.randint(1, 24))
+            hours = rng.randint(2, 72)
+            end = start + timedelta(hours=hours)
+            cursor[car.pk] = end
+            pickup = rng.choice(locations).name if locations else 'Unknown location'
+            batch.append(Booking(
+                user=rng.choice(users),
+                car_id=car.pk,
+                trip_type=rng.choice(trip_types),
+                pickup_location=pickup,
+                drop_location=pickup,
+                start_datetime=start,
+                end_datetime=end,
+                duration_hours=hours,
+                distance_km=rng.randint(10, 600),
+                num_passengers=rng.randint(1, 6),
+                fare_estimate=Decimal(rng.randrange(1000, 20000, 10)),
+                status=rng.choice(STATUSES),
+            ))
+            made += 1
+            if len(batch) >= self.batch_size:
+                with transaction.atomic():
+                    Booking.objects.bulk_create(batch, batch_size=self.batch_size)
+                batch = []
+                self.stdout.write(f"  {made}/{total} bookings", ending='\r')
+        if batch:
+            with transaction.atomic():
+                Booking.objects.bulk_create(batch, batch_size=self.batch_size)
+        self.stdout.write('')
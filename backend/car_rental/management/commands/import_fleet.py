@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from car_rental import fleetimport
+
+MAX_ERRORS_SHOWN = 20
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or update cars from CSV or JSON fleet files, keyed by registration number, "
+        "with bulk writes. Re-importing a file changes nothing. Lookups are given by name; "
+        "list columns (features, trip_types, images) are ';'-separated in CSV."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+')
+        parser.add_argument('--format', choices=['csv', 'json'], help="Default: from the file extension")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--skip-invalid', action='store_true', help="Import the valid records of a file with invalid ones")
+        parser.add_argument('--dry-run', action='store_true', help="Validate and count, then roll back")
+
+    def handle(self, *args, **options):
+        records = []
+        for path in options['paths']:
+            try:
+                records += fleetimport.read_records(path, options['format'])
+            except (OSError, ValueError) as e:
+                raise CommandError(f'{path}: {e}')
+        try:
+            result = fleetimport.import_fleet(
+                records, batch_size=options['batch_size'],
+                skip_invalid=options['skip_invalid'], dry_run=options['dry_run'],
+            )
+        except fleetimport.FleetImportError as e:
+            self.report_errors(e.errors)
+            raise CommandError(f'{e}; nothing was imported (use --skip-invalid to import the rest)')
+        self.report_errors(result.errors)
+        prefix = 'Dry run: ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(f"{prefix}Imported {len(records)} records: {result}"))
+
+    def report_errors(self, errors):
+        for number, message in errors[:MAX_ERRORS_SHOWN]:
+            self.stderr.write(f'record {number}: {message}')
+        if len(errors) > MAX_ERRORS_SHOWN:
+            self.stderr.write(f'... and {len(errors) - MAX_ERRORS_SHOWN} more')
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from car_rental.tempbookings import REAP_BATCH_SIZE, reap_expired
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete temp bookings older than TEMP_BOOKING_TTL in batches. "
+        "Safe to run from cron while the site is up."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=REAP_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        deleted = reap_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} temp bookings older than {settings.TEMP_BOOKING_TTL}s"
+        ))
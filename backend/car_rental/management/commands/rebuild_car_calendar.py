@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from car_rental.carcalendar import rebuild
+
+
+class Command(BaseCommand):
+    help = "Redraw every car's availability calendar (15-minute slot bitmaps) from its active bookings."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        written = rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt availability calendars: {written} car-days booked"))
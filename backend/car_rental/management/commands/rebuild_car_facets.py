@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from car_rental.carfacets import rebuild
+
+
+class Command(BaseCommand):
+    help = "Redraw the search facet values (type, fuel, price band, features, ...) of every car."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        written = rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt car search facets: {written} values"))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from car_rental import carfacets
+from car_rental.ratings import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute the review count, rating average and star histogram stored on every car."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = rebuild(batch_size=options['batch_size'])
+        carfacets.rebuild(batch_size=options['batch_size'])  # rating bands follow the averages
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating aggregates for {updated} cars"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from car_rental.carsearch import rebuild
+
+
+class Command(BaseCommand):
+    help = "Rewrite the full-text search document (name, description, features, location, ...) of every car."
+
+    def handle(self, *args, **options):
+        indexed = rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the car search index: {indexed} cars"))
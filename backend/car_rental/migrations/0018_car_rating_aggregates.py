@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:07
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_rating_aggregates(apps, schema_editor):
+    Car = apps.get_model('car_rental', 'Car')
+    Review = apps.get_model('car_rental', 'Review')
+    stars = ['stars_1', 'stars_2', 'stars_3', 'stars_4', 'stars_5']
+    cars = {}
+    rows = Review.objects.values('car_id', 'rating').annotate(n=Count('id')).order_by()
+    for row in rows:
+        car = cars.setdefault(row['car_id'], {'reviews_count': 0, 'rating_sum': 0})
+        car['reviews_count'] += row['n']
+        car['rating_sum'] += row['rating'] * row['n']
+        if 1 <= row['rating'] <= 5:
+            star = stars[row['rating'] - 1]
+            car[star] = car.get(star, 0) + row['n']
+    for car_id, values in cars.items():
+        values['rating_avg'] = values['rating_sum'] / values['reviews_count']
+        Car.objects.filter(pk=car_id).update(**values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('car_rental', '0017_alter_tempbooking_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='rating_avg',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='reviews_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='stars_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='stars_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='stars_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='stars_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='stars_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_rating_aggregates, migrations.RunPython.noop),
+    ]
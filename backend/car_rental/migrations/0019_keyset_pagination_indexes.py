@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('car_rental', '0018_car_rating_aggregates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['created_at', 'id'], name='booking_created_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='booking_user_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['base_fare', 'id'], name='car_fare_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['rating_avg', 'id'], name='car_rating_keyset_idx'),
+        ),
+    ]
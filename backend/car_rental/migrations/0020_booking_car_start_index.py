@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('car_rental', '0019_keyset_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['car', 'start_datetime'], name='booking_car_start_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('car_rental', '0020_booking_car_start_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tempbooking',
+            index=models.Index(fields=['created_at'], name='tempbooking_created_idx'),
+        ),
+    ]
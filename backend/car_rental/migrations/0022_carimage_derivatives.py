@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('car_rental', '0021_tempbooking_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carimage',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_calendars(apps, schema_editor):
+    from car_rental import carcalendar
+    carcalendar.rebuild(using=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('car_rental', '0022_carimage_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarCalendarDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('slots', models.BinaryField(max_length=12)),
+                ('car', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_days', to='car_rental.car')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'car'], name='car_calendar_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('car', 'day'), name='car_calendar_day_unique')],
+            },
+        ),
+        migrations.RunPython(fill_calendars, migrations.RunPython.noop),
+    ]
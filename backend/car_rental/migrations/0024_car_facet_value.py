@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_facet_values(apps, schema_editor):
+    from car_rental import carfacets
+    carfacets.rebuild(using=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('car_rental', '0023_car_calendar_day'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarFacetValue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(max_length=16)),
+                ('value', models.CharField(max_length=100)),
+                ('car', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facet_values', to='car_rental.car')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['facet', 'value', 'car'], name='car_facet_value_idx')],
+                'constraints': [models.UniqueConstraint(fields=('car', 'facet', 'value'), name='car_facet_value_unique')],
+            },
+        ),
+        migrations.RunPython(fill_facet_values, migrations.RunPython.noop),
+    ]
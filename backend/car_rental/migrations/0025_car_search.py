@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:49
+
+import car_rental.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_search_table(apps, schema_editor):
+    from car_rental import carsearch
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        carsearch.create_table(cursor)
+    carsearch.rebuild(using=schema_editor.connection.alias)
+
+
+def drop_search_table(apps, schema_editor):
+    from car_rental import carsearch
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(carsearch.DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('car_rental', '0024_car_facet_value'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarSearchEntry',
+            fields=[
+                ('car', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='car_rental.car')),
+                ('document', car_rental.models.FullTextField(db_column='car_rental_car_search')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'car_rental_car_search',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('car_rental', '0025_car_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['registration_number'], name='car_registration_idx'),
+        ),
+    ]
@@ -1,6 +1,5 @@
 from django.db import models
 from django.conf import settings
-from django.db.models import Q
 from django.contrib.auth.models import User
 from django.db import models
 import uuid
@@ -114,13 +113,33 @@ class Car(models.Model):
     price_per_km_extra = models.DecimalField(max_digits=6, decimal_places=2, default=12)
     insurance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 
+    # Review aggregates, maintained by the Review signals (see signals.py) and
+    # rebuilt by `manage.py rebuild_car_ratings`.
+    reviews_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_avg = models.FloatField(default=0)  # 0 until the first review
+    stars_1 = models.PositiveIntegerField(default=0)
+    stars_2 = models.PositiveIntegerField(default=0)
+    stars_3 = models.PositiveIntegerField(default=0)
+    stars_4 = models.PositiveIntegerField(default=0)
+    stars_5 = models.PositiveIntegerField(default=0)
+
     def __str__(self):
         loc = self.location.name if self.location else ""
         return f'{self.name} {self.model_year} ({loc})'
 
+    class Meta:
+        indexes = [
+            # Keyset pagination on (base_fare, id) and (rating_avg, id)
+            models.Index(fields=['base_fare', 'id'], name='car_fare_keyset_idx'),
+            models.Index(fields=['rating_avg', 'id'], name='car_rating_keyset_idx'),
+            # Upsert key of the fleet import (see fleetimport.py)
+            models.Index(fields=['registration_number'], name='car_registration_idx'),
+        ]
+
     @classmethod
     def get_available_cars(cls, rental_data):
-        from .models import Booking
+        from .carcalendar import exclude_busy
 
         rental_type = rental_data.get('trip_type')
         pickup_location = rental_data.get('pickup_location')
@@ -133,15 +152,7 @@ class Car(models.Model):
 
         cars_qs = cls.objects.all()
 
-        conflicting_bookings = Booking.objects.filter(
-            car__in=cars_qs,
-            status=Booking.STATUS_CONFIRMED,
-        ).filter(
-            Q(start_datetime__lte=end_datetime, end_datetime__gte=start_datetime) |
-            Q(start_datetime__lte=start_datetime, end_datetime__isnull=True)
-        ).values('car_id')
-
-        cars_available = cars_qs.exclude(id__in=conflicting_bookings)
+        cars_available = exclude_busy(cars_qs, start_datetime, end_datetime)
 
         if rental_type in ['Hourly Rental', 'Outstation Rental', 'One Way', 'Round Trip']:
             cars_available = cars_available.filter(location__name__iexact=pickup_location)
@@ -155,6 +166,8 @@ class CarImage(models.Model):
     car = models.ForeignKey('Car', on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='car_images/')
     alt_text = models.CharField(max_length=255, blank=True)
+    # {variant: {'width', 'height', 'jpeg', 'webp'}}, filled by derivatives.py
+    derivatives = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return f"Image for {self.car.name}"
@@ -248,6 +261,13 @@ class Booking(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination on (created_at, id), staff-wide and per user
+            models.Index(fields=['created_at', 'id'], name='booking_created_keyset_idx'),
+            models.Index(fields=['user', 'created_at', 'id'], name='booking_user_keyset_idx'),
+            # Overlap check when committing a booking
+            models.Index(fields=['car', 'start_datetime'], name='booking_car_start_idx'),
+        ]
 
 class Policy(models.Model):
     text = models.CharField(max_length=256)
@@ -288,4 +308,87 @@ class TempBooking(models.Model):
     package = models.CharField(max_length=50, blank=True, null=True)
     driver_required = models.BooleanField(default=True)
     num_days = models.PositiveIntegerField(default=1)
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # The reaper deletes by age (see tempbookings.py)
+            models.Index(fields=['created_at'], name='tempbooking_created_idx'),
+        ]
+
+
+class CarCalendarDay(models.Model):
+    """
+    Booked 15-minute slots of one car on one UTC day, as a bitmap (bit i =
+    slot i, little-endian). Only days with a booked slot have a row; kept in
+    step with Booking by carcalendar.py.
+    """
+    car = models.ForeignKey('Car', on_delete=models.CASCADE, related_name='calendar_days')
+    day = models.DateField()
+    slots = models.BinaryField(max_length=12)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['car', 'day'], name='car_calendar_day_unique'),
+        ]
+        indexes = [
+            # Fleet-wide lookups scan one window of days for every car
+            models.Index(fields=['day', 'car'], name='car_calendar_day_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.car_id} on {self.day}'
+
+
+class CarFacetValue(models.Model):
+    """
+    One value a car carries for a search facet (its fuel, its price band, one
+    of its features, ...). The car search facet counts are a GROUP BY over
+    these rows; kept in step with Car by carfacets.py.
+    """
+    car = models.ForeignKey('Car', on_delete=models.CASCADE, related_name='facet_values')
+    facet = models.CharField(max_length=16)
+    value = models.CharField(max_length=100)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['car', 'facet', 'value'], name='car_facet_value_unique'),
+        ]
+        indexes = [
+            # Covers the facet count query
+            models.Index(fields=['facet', 'value', 'car'], name='car_facet_value_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.car_id} {self.facet}={self.value}'
+
+
+class FullTextField(models.TextField):
+    """The hidden column named after an FTS5 table; takes ``__match`` lookups."""
+
+
+@FullTextField.register_lookup
+class FullTextMatch(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', [*lhs_params, *rhs_params]
+
+
+class CarSearchEntry(models.Model):
+    """
+    A car's row in the full-text index: an FTS5 virtual table (rowid = car
+    id) created by migration 0025 and written by carsearch.py. Django only
+    joins it, for ``?q=`` searches.
+    """
+    car = models.OneToOneField(
+        'Car', on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid', related_name='search_entry',
+    )
+    document = FullTextField(db_column='car_rental_car_search')
+    rank = models.FloatField()  # bm25 with the column weights of carsearch.py; lower is better
+
+    class Meta:
+        managed = False
+        db_table = 'car_rental_car_search'
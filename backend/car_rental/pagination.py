@@ -0,0 +1,152 @@
+"""
+Keyset ("seek") pagination.
+
+Pages are addressed by the sort key of the last row seen instead of an
+OFFSET, and no COUNT(*) is issued, so page 10,000 costs the same as page 1
+as long as a composite index matches the ordering. Responses therefore keep
+``next``, ``previous`` and ``results`` from the page-number format but carry
+no ``count``. Unlike DRF's
+CursorPagination the cursor holds the full (value, id) key, so runs of rows
+sharing a value (e.g. many cars at the same base fare) need no offset either.
+
+Views declare the ordering as ``keyset_ordering = ('-created_at', '-id')``
+or compute it in ``get_keyset_ordering(request)``. The last field must be
+unique and every field must be non-null. Fields may be annotations of the
+queryset (e.g. ``search_rank``).
+"""
+import base64
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE', 10)
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        if hasattr(view, 'get_keyset_ordering'):
+            self.ordering = tuple(view.get_keyset_ordering(request))
+        else:
+            self.ordering = tuple(view.keyset_ordering)
+        self.fields = [name.lstrip('-') for name in self.ordering]
+        model = queryset.model
+
+        cursor = self.decode_cursor(request, model)
+        reverse = False
+        if cursor is not None:
+            position, reverse = cursor
+            queryset = queryset.filter(self.seek_q(position, reverse))
+        order = [self.flip(name) for name in self.ordering] if reverse else list(self.ordering)
+
+        # One extra row tells us whether there is another page in this direction
+        rows = list(queryset.order_by(*order)[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.page = rows
+        self.has_next = has_more if not reverse else cursor is not None
+        self.has_previous = (cursor is not None) if not reverse else has_more
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    @staticmethod
+    def flip(name):
+        return name[1:] if name.startswith('-') else '-' + name
+
+    def seek_q(self, position, reverse):
+        """Rows strictly after ``position`` (before it when paging backwards)."""
+        q = Q()
+        equal = {}
+        for name, value in zip(self.ordering, position):
+            descending = name.startswith('-') != reverse
+            field = name.lstrip('-')
+            lookup = 'lt' if descending else 'gt'
+            q |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        return q
+
+    # --- Cursor encoding ---
+
+    def key_of(self, row):
+        if isinstance(row, dict):  # values() rows
+            return [row[field] for field in self.fields]
+        return [getattr(row, field) for field in self.fields]
+
+    def encode_cursor(self, row, reverse):
+        values = [value if isinstance(value, (int, float)) else str(value) for value in self.key_of(row)]
+        payload = json.dumps({'k': values, 'r': int(reverse)}, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+            values = payload['k']
+            if len(values) != len(self.fields):
+                raise ValueError
+            position = [self.to_python(model, field, value) for field, value in zip(self.fields, values)]
+            return position, bool(payload.get('r'))
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def to_python(model, field, value):
+        try:
+            return model._meta.get_field(field).to_python(value)
+        except FieldDoesNotExist:
+            return value  # an annotation, e.g. a search rank: JSON already restored it
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
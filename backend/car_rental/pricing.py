@@ -0,0 +1,191 @@
+"""
+Fare quotes for a whole candidate set of cars at once.
+
+The pricing fields of every candidate car are fetched with one values_list()
+query into parallel columns of integer paise. Trip-level terms (duration,
+distance, trip type, package, add-ons, promotion) are resolved once, and
+each fare component is then a single pass over the columns rather than a
+method call per Car. Integer paise keep every sum exact.
+
+Fare rules, per car:
+
+* rental: without a package, ``base_fare`` per started day (at least one).
+  With a package, ``base_fare`` buys the package and each started hour
+  beyond ``package.hours`` costs ``base_fare / package.hours``.
+* distance: round trips count the distance twice. Without a package, km
+  beyond ``unit_fare_after_km`` cost ``unit_fare`` each; with a package, km
+  beyond ``package.kms`` cost ``price_per_km_extra`` each.
+* add-ons: the sum of the chosen add-on prices, the same for every car.
+* insurance and tax: the car's flat amounts.
+* promotion: its flat ``discount_amount``, capped at the pre-tax subtotal.
+
+total = rental + distance + add-ons + insurance - discount + tax
+"""
+import math
+from decimal import Decimal
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from .catalog import get_catalog
+from .promotions import promotion_index
+
+PRICE_FIELDS = (
+    'id', 'base_fare', 'tax', 'unit_fare', 'unit_fare_after_km', 'price_per_km_extra', 'insurance',
+)
+ROUND_TRIP_NAMES = {'round_trip', 'roundtrip'}
+
+
+def to_paise(amount):
+    return int(Decimal(amount) * 100)
+
+
+def format_paise(paise):
+    sign = '-' if paise < 0 else ''
+    paise = abs(paise)
+    return f'{sign}{paise // 100}.{paise % 100:02d}'
+
+
+class Trip:
+    """The trip-level terms of a quote, resolved once for all cars."""
+
+    def __init__(self, start=None, end=None, distance_km=0, trip_type=None,
+                 package=None, add_ons=(), promotion=None):
+        self.start = start
+        self.end = end
+        self.distance_km = distance_km
+        self.trip_type = trip_type  # catalog row or None
+        self.package = package      # catalog row or None
+        self.add_ons = list(add_ons)  # catalog rows
+        self.promotion = promotion  # Promotion or None
+
+        hours = (end - start).total_seconds() / 3600 if start and end else 0
+        self.hours = max(0, math.ceil(hours))
+        self.days = max(1, math.ceil(self.hours / 24))
+        trip_name = (trip_type or {}).get('name', '').lower().replace(' ', '_').replace('-', '_')
+        self.billable_km = math.ceil(distance_km * (2 if trip_name in ROUND_TRIP_NAMES else 1))
+        self.add_ons_paise = sum(to_paise(add_on['price']) for add_on in self.add_ons)
+        self.discount_paise = to_paise(promotion.discount_amount) if promotion else 0
+
+    def summary(self):
+        return {
+            'start_datetime': self.start,
+            'end_datetime': self.end,
+            'hours': self.hours,
+            'days': self.days,
+            'billable_km': self.billable_km,
+            'trip_type': self.trip_type,
+            'package': self.package,
+            'add_ons': [add_on['code'] for add_on in self.add_ons],
+            'promo_code': self.promotion.code if self.promotion else None,
+        }
+
+
+def _catalog_row(name, value, *keys):
+    for row in get_catalog(name).get()[1]:
+        if any(str(row[key]).lower() == value.lower() for key in keys):
+            return row
+    return None
+
+
+def trip_from_params(params):
+    """Build a Trip from query parameters, raising ValidationError on bad input."""
+    errors = {}
+    start = end = None
+    if params.get('start_datetime'):
+        start = parse_datetime(params['start_datetime'])
+        if start is None:
+            errors['start_datetime'] = 'Invalid datetime.'
+        elif timezone.is_naive(start):
+            start = timezone.make_aware(start)
+    if params.get('end_datetime'):
+        end = parse_datetime(params['end_datetime'])
+        if end is None:
+            errors['end_datetime'] = 'Invalid datetime.'
+        elif timezone.is_naive(end):
+            end = timezone.make_aware(end)
+    if start and end and end <= start:
+        errors['end_datetime'] = 'Must be after start_datetime.'
+
+    try:
+        distance_km = float(params.get('distance_km') or 0)
+        if not 0 <= distance_km < 100000:
+            raise ValueError
+    except ValueError:
+        errors['distance_km'] = 'Must be a non-negative number of km.'
+        distance_km = 0
+
+    trip_type = package = None
+    if params.get('trip_type'):
+        trip_type = _catalog_row('triptypes', params['trip_type'], 'id', 'name')
+        if trip_type is None:
+            errors['trip_type'] = 'Unknown trip type.'
+    if params.get('package'):
+        package = _catalog_row('packages', params['package'], 'id', 'label')
+        if package is None:
+            errors['package'] = 'Unknown package.'
+
+    add_ons = []
+    codes = [code for code in params.get('add_ons', '').split(',') if code.strip()]
+    for code in codes:
+        add_on = _catalog_row('addons', code.strip(), 'code')
+        if add_on is None:
+            errors['add_ons'] = f'Unknown add-on {code.strip()!r}.'
+        else:
+            add_ons.append(add_on)
+
+    promotion = None
+    if params.get('promo_code'):
+        promotion, error = promotion_index.check(params['promo_code'], at=start)
+        if error:
+            errors['promo_code'] = error
+
+    if errors:
+        raise ValidationError(errors)
+    return Trip(start, end, distance_km, trip_type, package, add_ons, promotion)
+
+
+def quote_columns(rows, trip):
+    """
+    Price ``rows`` of PRICE_FIELDS tuples for ``trip``. Returns a dict of
+    parallel columns (car ids and paise per component).
+    """
+    if not rows:
+        return {'id': [], 'rental': [], 'distance': [], 'add_ons': [], 'insurance': [],
+                'discount': [], 'tax': [], 'total': []}
+    ids, base, tax, unit, free_km, per_km_extra, insurance = zip(*rows)
+    base = [to_paise(value) for value in base]
+    km = trip.billable_km
+
+    if trip.package:
+        included_hours = trip.package['hours'] or 1
+        extra_hours = max(0, trip.hours - trip.package['hours'])
+        extra_km = max(0, km - trip.package['kms'])
+        rental = [b - (-b * extra_hours // included_hours) for b in base]
+        distance = [to_paise(rate) * extra_km for rate in per_km_extra]
+    else:
+        rental = [b * trip.days for b in base]
+        distance = [to_paise(rate) * max(0, km - free) for rate, free in zip(unit, free_km)]
+
+    insurance = [to_paise(value) for value in insurance]
+    tax = [to_paise(value) for value in tax]
+    add_ons = trip.add_ons_paise
+    subtotal = [r + d + i + add_ons for r, d, i in zip(rental, distance, insurance)]
+    discount = [min(trip.discount_paise, s) for s in subtotal]
+    total = [s - off + t for s, off, t in zip(subtotal, discount, tax)]
+    return {
+        'id': list(ids), 'rental': rental, 'distance': distance, 'add_ons': [add_ons] * len(ids),
+        'insurance': insurance, 'discount': discount, 'tax': tax, 'total': total,
+    }
+
+
+def quote(cars, trip):
+    """Quotes for every car in the ``cars`` queryset, in its order, as API rows."""
+    columns = quote_columns(list(cars.values_list(*PRICE_FIELDS)), trip)
+    names = [name for name in columns if name != 'id']
+    formatted = [[format_paise(value) for value in columns[name]] for name in names]
+    return [
+        {'car_id': car_id, **dict(zip(names, values))}
+        for car_id, *values in zip(columns['id'], *formatted)
+    ]
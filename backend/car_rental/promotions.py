@@ -0,0 +1,68 @@
+"""
+In-memory promotion lookup by code and validity window.
+
+Every active promotion is loaded once per Promotion change version (see
+versioning.py), keyed by code. The loaded set is authoritative for its
+version, so an unknown or inactive code is rejected from memory: that is
+the negative cache, and brute-forcing codes never reaches the database.
+The validity window is then checked on the loaded promotion.
+"""
+import threading
+
+from django.utils import timezone
+
+from .models import Promotion
+from .versioning import get_version
+
+INVALID = 'Invalid promo code'
+EXPIRED = 'Promo code has expired'
+NOT_YET_VALID = 'Promo code is not valid yet'
+
+
+def normalize_code(code):
+    return (code or '').strip().upper()
+
+
+class PromotionIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._by_code = {}     # code -> Promotion
+
+    def _refresh(self):
+        version = get_version(Promotion)
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            promotions = list(Promotion.objects.filter(is_active=True))
+            self._by_code = {normalize_code(promo.code): promo for promo in promotions}
+            self._version = version
+
+    def check(self, code, at=None):
+        """
+        ``(promotion, None)`` if ``code`` is active and valid at ``at``
+        (default now), else ``(None, reason)``. Never queries the database
+        once the index is loaded for the current version.
+        """
+        self._refresh()
+        code = normalize_code(code)
+        promo = self._by_code.get(code)
+        if promo is None:
+            return None, INVALID
+        at = at or timezone.now()
+        if timezone.is_naive(at):
+            at = timezone.make_aware(at)
+        if at < promo.valid_from:
+            return None, NOT_YET_VALID
+        if at > promo.valid_until:
+            return None, EXPIRED
+        return promo, None
+
+    def get(self, code, at=None):
+        """The promotion for ``code`` if it is valid at ``at``, else None."""
+        return self.check(code, at)[0]
+
+
+promotion_index = PromotionIndex()
@@ -0,0 +1,102 @@
+"""
+Declarative SQL query budgets for API views.
+
+Views declare how many queries each action may run::
+
+    class CarViewSet(viewsets.ModelViewSet):
+        query_budgets = {'list': 3, 'retrieve': 3}
+
+    @query_budget(get=1)
+    @api_view(['GET'])
+    def get_temp_booking(request, temp_id): ...
+
+``check_endpoint`` then requests an endpoint at several data sizes and
+reports when the query count exceeds the budget or grows with the data,
+listing the SQL grouped by normalized shape so the N+1 stands out.
+"""
+import re
+from collections import Counter
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+
+def query_budget(**budgets):
+    """Attach per-action (or per-HTTP-method) budgets to a view class or function."""
+    def decorate(view):
+        view.query_budgets = {**getattr(view, 'query_budgets', {}), **budgets}
+        return view
+    return decorate
+
+
+def budget_for(path, method):
+    """The declared budget for ``method path``, or None if the view has none."""
+    match = resolve(path.split('?')[0])
+    func = match.func
+    budgets = getattr(func, 'query_budgets', None)
+    if budgets is None:
+        budgets = getattr(getattr(func, 'cls', None), 'query_budgets', {})
+    method = method.lower()
+    # Viewsets map HTTP methods to actions ('get' -> 'list' / 'retrieve' / ...)
+    action = getattr(func, 'actions', {}).get(method)
+    if action in budgets:
+        return budgets[action]
+    return budgets.get(method)
+
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN \((?:\s*\?\s*,?)+\)', re.IGNORECASE)
+
+
+def normalize_sql(sql):
+    """Replace literals so queries differing only in parameters share one shape."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def shapes(captured_queries):
+    return Counter(normalize_sql(query['sql']) for query in captured_queries)
+
+
+def format_shapes(counter, limit=10):
+    lines = [f'{count:>5} x {shape[:300]}' for shape, count in counter.most_common(limit)]
+    if len(counter) > limit:
+        lines.append(f'  ... {len(counter) - limit} more shapes')
+    return '\n'.join(lines)
+
+
+def capture(request):
+    """Run ``request()`` and return (response, captured queries)."""
+    with CaptureQueriesContext(connection) as ctx:
+        response = request()
+    return response, ctx.captured_queries
+
+
+def check_endpoint(name, method, path, measurements):
+    """
+    ``measurements`` is ``[(data_size, captured_queries), ...]`` for one
+    endpoint. Returns a list of human-readable problems (empty when within budget).
+    """
+    budget = budget_for(path, method)
+    problems = []
+    if budget is None:
+        return [f'{name}: no query budget declared for {method} {path}']
+    counts = [(size, len(queries)) for size, queries in measurements]
+    worst_size, worst = max(counts, key=lambda item: item[1])
+    if worst > budget:
+        problems.append(
+            f'{name}: {worst} queries at size {worst_size}, budget is {budget}\n'
+            + format_shapes(shapes(dict(measurements)[worst_size]))
+        )
+    (small_size, small), (large_size, large) = counts[0], counts[-1]
+    if large > small:
+        grown = shapes(dict(measurements)[large_size]) - shapes(dict(measurements)[small_size])
+        problems.append(
+            f'{name}: query count grows with data ({small} at size {small_size}, '
+            f'{large} at size {large_size}); extra queries:\n' + format_shapes(grown)
+        )
+    return problems
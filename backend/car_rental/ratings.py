@@ -0,0 +1,69 @@
+"""
+Maintenance of the review aggregates stored on Car
+(reviews_count, rating_sum, rating_avg and the stars_1..stars_5 histogram).
+"""
+from django.db.models import Case, Count, F, FloatField, Value, When
+from django.db.models.functions import Cast
+
+from .models import Car, Review
+from .versioning import bump_version
+
+STAR_FIELDS = ['stars_1', 'stars_2', 'stars_3', 'stars_4', 'stars_5']
+
+
+def apply_review(car_id, rating, sign):
+    """
+    Add (sign=1) or remove (sign=-1) one review in a single UPDATE, so
+    concurrent reviews of the same car cannot lose increments. Every
+    right-hand side below sees the row's values from before the update.
+    """
+    new_count = F('reviews_count') + sign
+    new_sum = F('rating_sum') + sign * rating
+    changes = {
+        'reviews_count': new_count,
+        'rating_sum': new_sum,
+        'rating_avg': Case(
+            When(reviews_count=-sign, then=Value(0.0)),  # last review removed
+            default=Cast(new_sum, FloatField()) / new_count,
+            output_field=FloatField(),
+        ),
+    }
+    if 1 <= rating <= 5:
+        star = STAR_FIELDS[rating - 1]
+        changes[star] = F(star) + sign
+    cars = Car.objects.filter(pk=car_id)
+    if sign < 0:
+        cars = cars.filter(reviews_count__gt=0)
+    cars.update(**changes)
+
+
+def rebuild(batch_size=1000):
+    """Recompute every car's aggregates from Review. Returns the number of cars updated."""
+    stats = {}
+    rows = Review.objects.values('car_id', 'rating').annotate(n=Count('id')).order_by()
+    for row in rows:
+        car = stats.setdefault(row['car_id'], {'reviews_count': 0, 'rating_sum': 0, **dict.fromkeys(STAR_FIELDS, 0)})
+        car['reviews_count'] += row['n']
+        car['rating_sum'] += row['rating'] * row['n']
+        if 1 <= row['rating'] <= 5:
+            car[STAR_FIELDS[row['rating'] - 1]] += row['n']
+
+    fields = ['reviews_count', 'rating_sum', 'rating_avg'] + STAR_FIELDS
+    empty = {'reviews_count': 0, 'rating_sum': 0, **dict.fromkeys(STAR_FIELDS, 0)}
+    updated = 0
+    batch = []
+    for car in Car.objects.only('id').order_by('pk').iterator(chunk_size=batch_size):
+        values = stats.get(car.pk, empty)
+        for name, value in values.items():
+            setattr(car, name, value)
+        car.rating_avg = values['rating_sum'] / values['reviews_count'] if values['reviews_count'] else 0
+        batch.append(car)
+        if len(batch) >= batch_size:
+            Car.objects.bulk_update(batch, fields)
+            updated += len(batch)
+            batch = []
+    if batch:
+        Car.objects.bulk_update(batch, fields)
+        updated += len(batch)
+    bump_version(Car)  # bulk_update sends no signals
+    return updated
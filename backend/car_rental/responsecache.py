@@ -0,0 +1,134 @@
+"""
+Shared response cache for list endpoints, keyed by normalized query parameters.
+
+The car listing is requested with the same few filter combinations over
+and over. Responses are stored in Django's cache under the normalized
+parameters: filter values are cleaned by the view's FilterSet, so ``1000``
+and ``1000.00`` share an entry, and empty parameters are dropped. Requests
+with parameters the cache does not know are never cached.
+
+Each entry is tagged with the generation it was built from, a digest of the
+change versions of every model in the response (see versioning.py), so any
+write to those models makes every entry stale at once. Stale entries are
+revalidated by one request at a time: the request that wins the refresh
+lock rebuilds the entry, and concurrent requests keep serving the stale
+copy for up to ``LIST_CACHE_MAX_STALE`` seconds after the change instead of
+all hitting the database. Stale copies carry their own ETag and
+Last-Modified, so clients never keep them past the next revalidation.
+"""
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from .conditional import versions_etag, versions_last_modified
+from .versioning import get_versions
+
+CACHE_STATUS_HEADER = 'X-Cache'  # hit, stale or miss
+
+
+class ListResponseCache:
+    def __init__(self, name, models, filterset_class=None, params=()):
+        self.name = name
+        self.models = models
+        self.filterset_class = filterset_class
+        # Parameters that change the response besides the filters (ordering, paging, ...)
+        self.params = set(params)
+
+    def timeout(self):
+        return getattr(settings, 'LIST_CACHE_TIMEOUT', 600)
+
+    def max_stale(self):
+        return getattr(settings, 'LIST_CACHE_MAX_STALE', 30)
+
+    def normalized_params(self, request):
+        """Sorted ``(name, value)`` pairs identifying the response, or None if it must not be cached."""
+        params = {name: value.strip() for name, value in request.query_params.items() if value.strip()}
+        if any(len(request.query_params.getlist(name)) > 1 for name in params):
+            return None
+        filter_names = set(self.filterset_class.base_filters) if self.filterset_class else set()
+        if set(params) - filter_names - self.params:
+            return None
+
+        filters = {name: value for name, value in params.items() if name in filter_names}
+        if filters:
+            form = self.filterset_class(filters, queryset=self.filterset_class._meta.model.objects.none()).form
+            if not form.is_valid():
+                return None  # let the view report the error
+            params.update({name: _canonical(form.cleaned_data[name]) for name in filters})
+        return sorted(params.items())
+
+    def key(self, request, params):
+        # Links and image URLs in the body are absolute
+        origin = request.build_absolute_uri('/')
+        digest = hashlib.sha1(f'{origin}?{urlencode(params)}'.encode()).hexdigest()
+        return f'car_rental:list-cache:{self.name}:{digest}'
+
+    def respond(self, request, build):
+        """
+        The cached response for ``request``, or ``build()``'s (a DRF
+        Response) after caching it.
+        """
+        if request.method not in ('GET', 'HEAD') or not self.timeout():
+            return build()
+        params = self.normalized_params(request)
+        if params is None:
+            return build()
+        key = self.key(request, params)
+        versions = get_versions(self.models)
+        generation = versions_etag(self.name, versions)
+
+        entry = cache.get(key)
+        if entry is not None and entry['generation'] == generation:
+            return self.cached_response(entry, 'hit')
+
+        lock = f'{key}:refresh'
+        if cache.add(lock, 1, timeout=60):
+            try:
+                response = build()
+                if response.status_code == 200:
+                    cache.set(key, {
+                        'generation': generation,
+                        'last_modified': versions_last_modified(versions),
+                        'data': response.data,
+                    }, timeout=self.timeout())
+                response[CACHE_STATUS_HEADER] = 'miss'
+                return response
+            finally:
+                cache.delete(lock)
+
+        # Someone else is rebuilding this entry
+        changed_at = versions_last_modified(versions)
+        if entry is not None and changed_at and (timezone.now() - changed_at).total_seconds() <= self.max_stale():
+            return self.cached_response(entry, 'stale')
+        if entry is None:
+            # Cold key: give the first request a moment rather than piling on
+            deadline = time.monotonic() + min(self.max_stale(), 2)
+            while time.monotonic() < deadline and cache.get(lock) is not None:
+                time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None and entry['generation'] == generation:
+                return self.cached_response(entry, 'hit')
+        response = build()
+        response[CACHE_STATUS_HEADER] = 'miss'
+        return response
+
+    def cached_response(self, entry, status):
+        response = Response(entry['data'])
+        # The entry's own validators: a stale copy must not carry the current ETag
+        response['ETag'] = entry['generation']
+        if entry['last_modified'] is not None:
+            response['Last-Modified'] = http_date(entry['last_modified'].timestamp())
+        response[CACHE_STATUS_HEADER] = status
+        return response
+
+
+def _canonical(value):
+    if hasattr(value, 'normalize'):  # Decimal: 1000.00 -> 1E+3 -> '1000'
+        return format(value.normalize(), 'f')
+    return str(value)
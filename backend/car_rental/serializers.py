@@ -20,6 +20,7 @@ from .models import (
     CarTransmission
 )
 from .serializers import CarTransmission
+from .shaping import SparseFieldsMixin
 
 
 class CarFeatureSerializer(serializers.ModelSerializer):
@@ -42,11 +43,15 @@ class LocationSerializer(serializers.ModelSerializer):
         fields = ['name', 'address', 'latitude', 'longitude', 'map_url', 'distance_from_user']
 
     def get_distance_from_user(self, obj):
+        # Set by the nearest-locations lookup, which already knows the distance
+        if getattr(obj, 'distance_km', None) is not None:
+            return round(obj.distance_km, 2)
         request = self.context.get('request')
         user_lat = request.query_params.get('lat')
         user_lon = request.query_params.get('lng')
         if user_lat and user_lon:
-            return round(obj.distance_to(float(user_lat), float(user_lon)), 2)
+            distance = obj.distance_to(float(user_lat), float(user_lon))
+            return round(distance, 2) if distance is not None else None
         return None
 
 
@@ -76,9 +81,32 @@ class PromotionSerializer(serializers.ModelSerializer):
         fields = ['id', 'code', 'description', 'discount_amount', 'is_active', 'valid_from', 'valid_until']
 
 class CarImageSerializer(serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = CarImage
-        fields = ['id', 'image', 'alt_text']
+        fields = ['id', 'image', 'alt_text', 'srcset']
+
+    def get_srcset(self, obj):
+        request = self.context.get('request')
+        storage = obj.image.storage
+
+        def url(name):
+            url = storage.url(name)
+            return request.build_absolute_uri(url) if request else url
+
+        return image_srcset(obj.derivatives, url)
+
+
+def image_srcset(derivatives, url):
+    """``{variant: {'width', 'height', 'jpeg': url, 'webp': url}}``; empty until built."""
+    return {
+        variant: {
+            key: url(value) if key in ('jpeg', 'webp') else value
+            for key, value in entry.items()
+        }
+        for variant, entry in derivatives.items()
+    }
 
 
 class CarTransmissionSerializer(serializers.ModelSerializer):
@@ -86,13 +114,12 @@ class CarTransmissionSerializer(serializers.ModelSerializer):
         model = CarTransmission
         fields = ['id', 'type']
 
-class CarSerializer(serializers.ModelSerializer):
+class CarSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     group = CarGroupSerializer(read_only=True)
     variant = CarVariantSerializer(read_only=True)
     add_ons = serializers.SerializerMethodField()
     features = serializers.SlugRelatedField(many=True, read_only=True, slug_field='name')
     rating = serializers.SerializerMethodField()
-    reviews_count = serializers.SerializerMethodField()
     images = CarImageSerializer(many=True, read_only=True)
     fuel = CarFuelSerializer(read_only=True)
     location = LocationSerializer()
@@ -106,17 +133,27 @@ class CarSerializer(serializers.ModelSerializer):
             'luggage','fuel', 'is_fulfillment_center', 'transmission' ,'features', 'add_ons','tax','insurance','rating', 'reviews_count'
         ]
 
+    # ?expand= controls these; ?fields= shapes the queryset (see shaping.py)
+    expandable_fields = ('group', 'variant', 'location', 'fuel', 'transmission', 'images', 'add_ons')
+    field_dependencies = {'rating': ['reviews_count', 'rating_avg'], 'add_ons': []}
+
+    def collapse_field(self, name, field):
+        if name == 'add_ons':
+            return serializers.SerializerMethodField(method_name='get_add_on_ids')
+        return super().collapse_field(name, field)
+
     def get_add_ons(self, obj):
         # You could filter add-ons by car or location if needed
-        return AddOnSerializer(AddOn.objects.all(), many=True).data
+        from .catalog import get_catalog
+        return get_catalog('addons').get()[1]
+
+    def get_add_on_ids(self, obj):
+        return [add_on['id'] for add_on in self.get_add_ons(obj)]
+
     def get_rating(self, obj):
-        reviews = obj.reviews.all()
-        if not reviews:
+        if not obj.reviews_count:
             return None
-        return round(sum([r.rating for r in reviews]) / len(reviews), 1)
-
-    def get_reviews_count(self, obj):
-        return obj.reviews.count()
+        return round(obj.rating_avg, 1)
 
     def get_image_url(self, obj):
         if obj.image_urls and isinstance(obj.image_urls, list):
@@ -150,9 +187,12 @@ class TripTypeSerializer(serializers.ModelSerializer):
         fields = ['id', 'name']
 
 
-class BookingSerializer(serializers.ModelSerializer):
+class BookingSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = ('car', 'trip_type', 'add_ons', 'applied_promotion')
+
     user = serializers.StringRelatedField(read_only=True)
     car = CarSerializer(read_only=True)
+    car_id = serializers.PrimaryKeyRelatedField(source='car', queryset=Car.objects.all(), write_only=True)
     trip_type = TripTypeSerializer(read_only=True)
     add_ons = AddOnSerializer(many=True, read_only=True)
     applied_promotion = PromotionSerializer(read_only=True)
@@ -163,6 +203,7 @@ class BookingSerializer(serializers.ModelSerializer):
             'id',
             'user',
             'car',
+            'car_id',
             'trip_type',
             'pickup_location',
             'pickup_lat',
@@ -186,6 +227,13 @@ class BookingSerializer(serializers.ModelSerializer):
             'created_at',
         ]
 
+    def validate(self, attrs):
+        start = attrs.get('start_datetime', getattr(self.instance, 'start_datetime', None))
+        end = attrs.get('end_datetime', getattr(self.instance, 'end_datetime', None))
+        if start and end and end <= start:
+            raise serializers.ValidationError({'end_datetime': 'End must be after start.'})
+        return attrs
+
 
 class PackageSerializer(serializers.ModelSerializer):
     class Meta:
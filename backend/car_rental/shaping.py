@@ -0,0 +1,182 @@
+"""
+Sparse fieldsets (``?fields=``) and expansion control (``?expand=``).
+
+``fields`` lists the fields to return, with dotted names reaching into
+nested serializers (``fields=id,status,car.name``). ``expand`` lists the
+relations rendered as nested objects (``expand=car,car.location``); once it
+is given, every other expandable relation collapses to its primary key(s).
+Without either parameter responses are unchanged; a name in ``fields`` that
+the serializer does not render is a validation error (400).
+
+The view side turns the pruned serializer into a queryset plan, so fields
+that are not returned are not selected, joined or prefetched either.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+
+def parse_names(value):
+    """``'a, b.c'`` -> ``{'a', 'b.c'}``; None when the parameter is absent."""
+    if value is None:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def _nested(names, prefix):
+    if names is None:
+        return None
+    prefix += '.'
+    return {name[len(prefix):] for name in names if name.startswith(prefix)}
+
+
+def _target(field):
+    return field.child if isinstance(field, serializers.ListSerializer) else field
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin taking ``fields=`` / ``expand=`` (sets of names, None
+    for all). ``expandable_fields`` are the nested relations ``expand``
+    controls; ``field_dependencies`` names the model attributes that
+    method fields read, for the queryset plan.
+    """
+    expandable_fields = ()
+    field_dependencies = {}
+    field_prefix = ''  # dotted path of a nested serializer, for error messages
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requested_fields = fields
+        self.requested_expand = expand
+
+    def collapse_field(self, name, field):
+        """The field rendered when relation ``name`` is not expanded."""
+        return serializers.PrimaryKeyRelatedField(
+            source=field.source, many=isinstance(field, serializers.ListSerializer), read_only=True,
+        )
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested, expand = self.requested_fields, self.requested_expand
+        if requested is not None:
+            keep = {name.split('.', 1)[0] for name in requested}
+            readable = [name for name, field in fields.items() if not field.write_only]
+            unknown = sorted(keep - set(readable))
+            if unknown:
+                prefix = self.field_prefix
+                raise serializers.ValidationError({'fields': [
+                    f"Unknown field(s) {', '.join(prefix + name for name in unknown)}; "
+                    f"choose from {', '.join(prefix + name for name in readable)}."
+                ]})
+            for name in list(fields):
+                if name not in keep and not fields[name].write_only:
+                    del fields[name]
+        for name in self.expandable_fields:
+            if expand is not None and name in fields and name not in expand:
+                fields[name] = self.collapse_field(name, fields[name])
+        for name, field in fields.items():
+            target = _target(field)
+            if isinstance(target, SparseFieldsMixin):
+                nested = _nested(requested, name)
+                target.requested_fields = nested or None
+                target.requested_expand = _nested(expand, name)
+                target.field_prefix = f'{self.field_prefix}{name}.'
+        return fields
+
+
+class QueryPlan:
+    """Columns, joins and prefetches a serializer's output needs."""
+
+    def __init__(self):
+        self.only = set()
+        self.select = set()
+        self.prefetch = set()
+        self.complete = True  # False if some field's data needs could not be worked out
+
+    def apply(self, queryset, extra_only=()):
+        if self.select:
+            queryset = queryset.select_related(*sorted(self.select))
+        if self.prefetch:
+            queryset = queryset.prefetch_related(*sorted(self.prefetch))
+        if self.complete:
+            queryset = queryset.only(*sorted(self.only | set(extra_only)))
+        return queryset
+
+
+def plan_for(serializer, model, plan=None, prefix=''):
+    """Fill a QueryPlan for everything ``serializer`` (already shaped) renders from ``model``."""
+    plan = plan or QueryPlan()
+    plan.only.add(prefix + model._meta.pk.name)
+    dependencies = getattr(serializer, 'field_dependencies', {})
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if name in dependencies:
+            sources = dependencies[name]
+        elif field.source == '*' or isinstance(field, serializers.SerializerMethodField):
+            plan.complete = False
+            continue
+        else:
+            sources = [field.source]
+        for source in sources:
+            _plan_source(plan, model, source, _target(field), prefix)
+    return plan
+
+
+def _plan_source(plan, model, source, target, prefix):
+    try:
+        model_field = model._meta.get_field(source.split('.', 1)[0])
+    except FieldDoesNotExist:
+        plan.complete = False
+        return
+    path = prefix + model_field.name
+    if not model_field.is_relation:
+        plan.only.add(path)
+    elif model_field.many_to_one or (model_field.one_to_one and model_field.concrete):
+        plan.only.add(path)
+        if isinstance(target, serializers.PrimaryKeyRelatedField):
+            return  # the id column is enough
+        plan.select.add(path)
+        if isinstance(target, SparseFieldsMixin):
+            plan_for(target, model_field.related_model, plan, path + '__')
+        else:
+            plan.only.update(
+                f'{path}__{f.name}' for f in model_field.related_model._meta.concrete_fields
+            )
+    else:
+        # Reverse and many-to-many relations: one extra query each
+        plan.prefetch.add(path)
+
+
+class ShapedViewMixin:
+    """
+    View mixin applying ``?fields=`` / ``?expand=`` to the serializer and
+    the queryset of GET requests. ``shaped_queryset(queryset)`` replaces the
+    view's select_related/prefetch_related/only with what the shaped
+    serializer needs; ``plan_extra_only`` are columns the view itself reads
+    (e.g. pagination keys).
+    """
+    plan_extra_only = ()
+
+    def shape_params(self):
+        if self.request is None or self.request.method not in ('GET', 'HEAD'):
+            return None, None
+        params = self.request.query_params
+        return parse_names(params.get('fields')), parse_names(params.get('expand'))
+
+    def get_serializer(self, *args, **kwargs):
+        fields, expand = self.shape_params()
+        kwargs.setdefault('fields', fields)
+        kwargs.setdefault('expand', expand)
+        return super().get_serializer(*args, **kwargs)
+
+    def shaped_queryset(self, queryset, default):
+        """``default(queryset)`` unless the request shapes its output."""
+        fields, expand = self.shape_params()
+        if fields is None and expand is None:
+            return default(queryset)
+        serializer = self.get_serializer_class()(
+            fields=fields, expand=expand, context=self.get_serializer_context(),
+        )
+        plan = plan_for(serializer, queryset.model)
+        return plan.apply(queryset, extra_only=self.plan_extra_only)
@@ -0,0 +1,169 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .autocomplete import location_autocomplete
+from . import carcalendar, carfacets, carsearch
+from .catalog import CATALOG_MODELS
+from .conditional import CAR_MODELS
+from .models import Booking, Car, CarFeature, CarFuel, CarTransmission, Location, Promotion, Review
+from .ratings import apply_review
+from .versioning import bump_version
+
+
+
+# --- Availability calendar ---
+# Redrawn inside the booking's transaction, so it commits or rolls back with it.
+
+@receiver(pre_save, sender=Booking)
+def booking_before_save(sender, instance, **kwargs):
+    instance._stored_booking = None
+    if instance.pk:
+        instance._stored_booking = Booking.objects.filter(pk=instance.pk).values_list(
+            'car_id', 'start_datetime', 'end_datetime', 'status',
+        ).first()
+
+
+@receiver(post_save, sender=Booking)
+def booking_calendar_saved(sender, instance, **kwargs):
+    stored = getattr(instance, '_stored_booking', None)
+    if stored == (instance.car_id, instance.start_datetime, instance.end_datetime, instance.status):
+        return
+    carcalendar.booking_changed(stored[:3] if stored else None, instance)
+
+
+@receiver(post_delete, sender=Booking)
+def booking_calendar_deleted(sender, instance, **kwargs):
+    carcalendar.booking_changed((instance.car_id, instance.start_datetime, instance.end_datetime))
+
+
+# --- Car rating aggregates ---
+
+@receiver(pre_save, sender=Review)
+def review_before_save(sender, instance, **kwargs):
+    # Remember what the row held, so an edit can be applied as remove + add
+    instance._stored_review = None
+    if instance.pk:
+        instance._stored_review = Review.objects.filter(pk=instance.pk).values_list('car_id', 'rating').first()
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, **kwargs):
+    stored = getattr(instance, '_stored_review', None)
+    if stored == (instance.car_id, instance.rating):
+        return
+    if stored is not None:
+        apply_review(stored[0], stored[1], -1)
+    apply_review(instance.car_id, instance.rating, 1)
+    carfacets.refresh({instance.car_id, stored[0]} if stored else {instance.car_id}, facets=['rating'])
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    apply_review(instance.car_id, instance.rating, -1)
+    carfacets.refresh([instance.car_id], facets=['rating'])
+
+
+# --- Search facets and full-text index ---
+# Rewritten in the writing transaction, like the calendar.
+
+@receiver(post_save, sender=Car)
+def car_search_rows_saved(sender, instance, **kwargs):
+    carfacets.refresh([instance.pk])
+    carsearch.refresh([instance.pk])
+
+
+@receiver(post_delete, sender=Car)
+def car_search_rows_deleted(sender, instance, **kwargs):
+    # Facet rows cascade, but the cascaded reviews' receivers redraw the
+    # rating facet while the car row still exists: clear it again
+    carfacets.refresh([instance.pk])
+    carsearch.refresh([instance.pk])
+
+
+@receiver(m2m_changed, sender=Car.features.through)
+def car_feature_links_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        car_ids = [instance.pk] if action in ('post_add', 'post_remove', 'post_clear') else []
+    elif action == 'pre_clear':
+        instance._linked_car_ids = list(instance.cars.values_list('pk', flat=True))
+        car_ids = []
+    elif action == 'post_clear':
+        car_ids = instance._linked_car_ids
+    else:
+        car_ids = pk_set if action in ('post_add', 'post_remove') else []
+    if car_ids:
+        carfacets.refresh(car_ids, facets=['features'])
+        carsearch.refresh(car_ids)
+
+
+# Models whose names the cars show: model -> (Car lookup, facet, in search documents)
+CAR_LABEL_MODELS = {
+    CarFuel: ('fuel', 'fuel', False),
+    CarTransmission: ('transmission', 'transmission', False),
+    CarFeature: ('features', 'features', True),
+    Location: ('location', None, True),
+}
+
+
+def labelled_car_ids(sender, instance):
+    return list(Car.objects.filter(**{CAR_LABEL_MODELS[sender][0]: instance}).values_list('pk', flat=True))
+
+
+def car_label_before_delete(sender, instance, **kwargs):
+    # The cars lose the value (SET_NULL / cascaded links) before post_delete
+    instance._linked_car_ids = labelled_car_ids(sender, instance)
+
+
+def car_label_changed(sender, instance, created=False, **kwargs):
+    # A renamed fuel, feature, location, ... changes what its cars show
+    if created:
+        return
+    car_ids = getattr(instance, '_linked_car_ids', None)
+    if car_ids is None:
+        car_ids = labelled_car_ids(sender, instance)
+    _, facet, searched = CAR_LABEL_MODELS[sender]
+    if facet is not None:
+        carfacets.refresh(car_ids, facets=[facet])
+    if searched:
+        carsearch.refresh(car_ids)
+
+
+for model in CAR_LABEL_MODELS:
+    pre_delete.connect(car_label_before_delete, sender=model, dispatch_uid=f'car-label-before-delete-{model.__name__}')
+    post_save.connect(car_label_changed, sender=model, dispatch_uid=f'car-label-save-{model.__name__}')
+    post_delete.connect(car_label_changed, sender=model, dispatch_uid=f'car-label-delete-{model.__name__}')
+
+
+# --- Change versions ---
+
+def bump_model_version(sender, **kwargs):
+    # After commit, so no worker reloads rows that could still roll back
+    transaction.on_commit(lambda: bump_version(sender))
+
+
+VERSIONED_MODELS = list(dict.fromkeys(CATALOG_MODELS + [Location, Promotion] + CAR_MODELS))
+
+for model in VERSIONED_MODELS:
+    post_save.connect(bump_model_version, sender=model, dispatch_uid=f'version-save-{model.__name__}')
+    post_delete.connect(bump_model_version, sender=model, dispatch_uid=f'version-delete-{model.__name__}')
+
+
+@receiver(m2m_changed, sender=Car.features.through)
+def car_features_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(lambda: bump_version(Car))
+
+
+# --- Location autocomplete ---
+# Connected after the version receivers, so these run once the bump is done.
+
+@receiver(post_save, sender=Location)
+def location_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: location_autocomplete.update_location(instance))
+
+
+@receiver(post_delete, sender=Location)
+def location_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: location_autocomplete.remove_location(pk))
@@ -0,0 +1,130 @@
+"""
+Temp booking store: TTL, read-through cache and reaper.
+
+A TempBooking lives for ``settings.TEMP_BOOKING_TTL`` seconds after it is
+created. Its serialized form is cached under its UUID when it is created
+and whenever a read misses, with the cache entry expiring together with the
+row. The row is never updated, so the cache needs no invalidation. Expired
+rows read as missing and are deleted in batches by ``reap_expired`` (run by
+``manage.py reap_temp_bookings`` or by the optional in-process reaper).
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import TempBooking
+from .serializers import TempBookingSerializer
+
+logger = logging.getLogger(__name__)
+
+REAP_BATCH_SIZE = 1000
+
+
+def ttl():
+    return timedelta(seconds=settings.TEMP_BOOKING_TTL)
+
+
+def _key(temp_id):
+    return f'car_rental:temp-booking:{temp_id}'
+
+
+def _remaining_seconds(booking, now=None):
+    expires_at = booking.created_at + ttl()
+    return int((expires_at - (now or timezone.now())).total_seconds())
+
+
+def remember(booking):
+    """Cache ``booking`` until it expires; returns its serialized data."""
+    data = dict(TempBookingSerializer(booking).data)
+    remaining = _remaining_seconds(booking)
+    if remaining > 0:
+        cache.set(_key(booking.pk), data, remaining)
+    return data
+
+
+def _unexpired():
+    return TempBooking.objects.filter(created_at__gte=timezone.now() - ttl())
+
+
+def get_data(temp_id):
+    """Serialized temp booking ``temp_id``, or None if missing or expired."""
+    data = cache.get(_key(temp_id))
+    if data is not None:
+        return data
+    booking = _unexpired().filter(pk=temp_id).first()
+    return remember(booking) if booking is not None else None
+
+
+async def aget_data(temp_id):
+    """Async ``get_data``."""
+    data = await cache.aget(_key(temp_id))
+    if data is not None:
+        return data
+    booking = await _unexpired().filter(pk=temp_id).afirst()
+    if booking is None:
+        return None
+    data = dict(TempBookingSerializer(booking).data)
+    remaining = _remaining_seconds(booking)
+    if remaining > 0:
+        await cache.aset(_key(booking.pk), data, remaining)
+    return data
+
+
+def reap_expired(batch_size=REAP_BATCH_SIZE, now=None):
+    """Delete expired temp bookings, ``batch_size`` rows per statement. Returns the count."""
+    cutoff = (now or timezone.now()) - ttl()
+    expired = TempBooking.objects.filter(created_at__lt=cutoff)
+    total = 0
+    while True:
+        batch = list(expired.values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return total
+        total += TempBooking.objects.filter(pk__in=batch).delete()[0]
+
+
+class Reaper:
+    """Runs ``reap_expired`` every ``interval`` seconds in a daemon thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = None
+
+    def start(self, interval):
+        with self._lock:
+            if self._stop is not None:
+                return
+            self._stop = stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    deleted = reap_expired()
+                    if deleted:
+                        logger.info("Reaped %d expired temp bookings", deleted)
+                except Exception:
+                    logger.exception("Temp booking reaper failed")
+                finally:
+                    close_old_connections()
+
+        threading.Thread(target=run, name='temp-booking-reaper', daemon=True).start()
+
+    def stop(self):
+        with self._lock:
+            if self._stop is not None:
+                self._stop.set()
+                self._stop = None
+
+
+reaper = Reaper()
+
+
+def start_reaper():
+    """Start the in-process reaper if ``TEMP_BOOKING_REAP_INTERVAL`` is set."""
+    interval = getattr(settings, 'TEMP_BOOKING_REAP_INTERVAL', None)
+    if interval:
+        reaper.start(interval)
@@ -1,3 +1,1382 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import random
+import shutil
+import tempfile
+import uuid
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from . import carcalendar, carfacets, carsearch
+from .autocomplete import location_autocomplete
+from .benchmarks import booking_stress
+from .fleetimport import FleetImportError, import_fleet
+from .geo import location_grid
+from .imaging import render
+from .models import (
+    AddOn, Booking, Car, CarCalendarDay, CarFacetValue, CarFeature, CarFuel, CarGroup, CarImage, CarTransmission,
+    CarVariant, Location, Offer, Package, Promotion, Review, TempBooking, TripType,
+)
+from .promotions import promotion_index
+from .querybudget import capture, check_endpoint
+from .serializers import CarSerializer
+from .versioning import CACHE_ALIAS, _key, bump_version, get_version
+from .views import BookingViewSet, CarViewSet, ReviewViewSet
+
+
+def clear_caches():
+    """Forget cached data and change versions, as flushed test data sends no signals."""
+    for each in caches.all():
+        each.clear()
+
+
+def streamed(response):
+    """``response`` with its streaming content read (into ``response.streamed_text``)."""
+    response.streamed_text = b''.join(response.streaming_content).decode()
+    return response
+
+
+class TempMediaMixin:
+    """Run each test with MEDIA_ROOT in a fresh temporary directory (``self.media_root``)."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+
+def make_fleet(size):
+    """Add ``size`` cars with every relation CarSerializer renders filled in."""
+    group, _ = CarGroup.objects.get_or_create(name='Compact')
+    variant, _ = CarVariant.objects.get_or_create(name='Zeta', price_min=100, price_max=200)
+    fuel, _ = CarFuel.objects.get_or_create(name='Petrol')
+    transmission, _ = CarTransmission.objects.get_or_create(type='Manual')
+    features = [CarFeature.objects.get_or_create(name=f'Feature {i}')[0] for i in range(3)]
+    AddOn.objects.get_or_create(code='GPS', defaults={'name': 'GPS', 'price': 50})
+    offset = Car.objects.count()
+    cars = []
+    for i in range(offset, offset + size):
+        location = Location.objects.create(name=f'Location {i}', latitude=12.9, longitude=77.5)
+        car = Car.objects.create(
+            name=f'Car {i}', car_type='SUV', engine='1.2L', mileage='20 km/l',
+            group=group, variant=variant, fuel=fuel, transmission=transmission,
+            location=location, base_fare=100 + i,
+        )
+        car.features.set(features)
+        CarImage.objects.create(car=car, image=f'car_images/{i}.jpg')
+        CarImage.objects.create(car=car, image=f'car_images/{i}_b.jpg')
+        Review.objects.create(car=car, rating=4)
+        Review.objects.create(car=car, rating=5)
+        cars.append(car)
+    return cars
+
+
+@override_settings(LIST_CACHE_TIMEOUT=0)  # count the queries behind every request
+class VersioningTests(TestCase):
+    def test_bumps_are_seen_by_every_worker(self):
+        before = get_version(Promotion)
+        bump_version(Promotion)
+        bumped = get_version(Promotion)
+        self.assertNotEqual(bumped, before)
+
+        # Not kept in the per-process cache: with a cold one, and through
+        # another worker's own connection to the versions store, the bump shows
+        cache.clear()
+        self.assertEqual(get_version(Promotion), bumped)
+        self.assertEqual(caches.create_connection(CACHE_ALIAS).get(_key(Promotion)), bumped)
+
+    def test_kept_apart_from_the_dev_server(self):
+        # clear_caches() must not wipe the versions a running dev server reads
+        self.assertFalse(Path(caches[CACHE_ALIAS]._dir).is_relative_to(settings.BASE_DIR))
+
+
+class CarQueryCountTests(TestCase):
+    def setUp(self):
+        clear_caches()
+
+    def query_count(self, url, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_car_list_query_count_is_constant(self):
+        make_fleet(2)
+        self.query_count('/api/cars/')  # warm the add-on catalog
+        small = self.query_count('/api/cars/')
+        # count, cars, images, features
+        self.assertLessEqual(small, 4)
+        make_fleet(8)
+        self.assertEqual(self.query_count('/api/cars/'), small)
+
+    def test_available_query_count_is_constant(self):
+        make_fleet(2)
+        self.query_count('/api/cars/available/')
+        small = self.query_count('/api/cars/available/')
+        self.assertLessEqual(small, 3)
+        make_fleet(12)
+        self.assertEqual(self.query_count('/api/cars/available/'), small)
+
+    def test_detail_query_count(self):
+        car = make_fleet(1)[0]
+        self.assertLessEqual(self.query_count(f'/api/cars/{car.pk}/'), 4)
+
+    def test_rating_annotations_match_reviews(self):
+        make_fleet(1)
+        data = self.client.get('/api/cars/').json()['results'][0]
+        self.assertEqual(data['rating'], 4.5)
+        self.assertEqual(data['reviews_count'], 2)
+        self.assertEqual(len(data['images']), 2)
+        self.assertEqual(len(data['add_ons']), 1)
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        clear_caches()
+
+    def test_catalog_served_from_memory_until_changed(self):
+        Package.objects.create(label='4 hr / 40 km', hours=4, kms=40)
+        first = self.client.get('/api/packages/')
+        self.assertEqual(first.json()['count'], 1)
+        with self.assertNumQueries(0):
+            again = self.client.get('/api/packages/')
+        self.assertEqual(again['ETag'], first['ETag'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Package.objects.create(label='8 hr / 80 km', hours=8, kms=80)
+        changed = self.client.get('/api/packages/')
+        self.assertEqual(changed.json()['count'], 2)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+
+    def test_offers_only_lists_active(self):
+        Offer.objects.create(code='CABTRIP', desc='200 OFF', is_active=True)
+        Offer.objects.create(code='OLD', desc='Expired', is_active=False)
+        response = self.client.get('/api/offers/')
+        self.assertEqual([o['code'] for o in response.json()], ['CABTRIP'])
+        self.assertIn('ETag', response)
+
+
+class NearestLocationsTests(TestCase):
+    def setUp(self):
+        clear_caches()
+
+    def test_matches_brute_force_haversine(self):
+        rng = random.Random(4)
+        for i in range(300):
+            Location.objects.create(
+                name=f'Point {i}',
+                latitude=round(rng.uniform(-60, 60), 6),
+                longitude=round(rng.uniform(-179.9, 179.9), 6),
+            )
+        for lat, lng, radius in [(12.97, 77.59, 3000), (0, 179.95, 2500), (59, -10, None)]:
+            params = {'lat': lat, 'lng': lng, 'limit': 15}
+            if radius:
+                params['radius'] = radius
+            response = self.client.get('/api/locations/nearest/', params)
+            self.assertEqual(response.status_code, 200)
+            expected = sorted(
+                (loc.distance_to(lat, lng), loc.name) for loc in Location.objects.all()
+            )
+            if radius:
+                expected = [e for e in expected if e[0] <= radius]
+            expected = expected[:15]
+            got = [(row['distance_from_user'], row['name']) for row in response.json()]
+            self.assertEqual([name for _, name in got], [name for _, name in expected])
+            for (dist, _), (exp, _) in zip(got, expected):
+                self.assertAlmostEqual(dist, exp, places=1)
+
+    def test_unbounded_search_stops_once_every_point_is_found(self):
+        for i, (lat, lng) in enumerate([(12.97, 77.59), (12.98, 77.60), (12.99, 77.58)]):
+            Location.objects.create(name=f'Point {i}', latitude=lat, longitude=lng)
+        with mock.patch.object(location_grid, '_within', wraps=location_grid._within) as within:
+            found = location_grid.nearest(12.97, 77.59, limit=10)
+        self.assertEqual(len(found), 3)
+        self.assertEqual(within.call_count, 1)  # not widened to the far side of the earth
+        # A box wider than the occupied cells walks those instead
+        self.assertEqual(len(location_grid.nearest(-60, -100, radius_km=20000)), 3)
+
+    def test_rejects_bad_coordinates(self):
+        self.assertEqual(self.client.get('/api/locations/nearest/').status_code, 400)
+        response = self.client.get('/api/locations/nearest/', {'lat': 95, 'lng': 0})
+        self.assertEqual(response.status_code, 400)
+
+
+class LocationAutocompleteTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        for name, address in [
+            ('Bangalore Airport', 'Kempegowda International Airport, Devanahalli'),
+            ('Bangalore City Railway Station', 'Gubbi Thotadappa Road'),
+            ('Mysore Palace', 'Sayyaji Rao Road, Mysuru'),
+            ('Chennai Central', 'Park Town'),
+        ]:
+            Location.objects.create(name=name, address=address)
+
+    def search(self, text):
+        response = self.client.get('/api/locations/', {'search': text})
+        self.assertEqual(response.status_code, 200)
+        return [row['name'] for row in response.json()['results']]
+
+    def test_prefix_ranked_and_no_queries(self):
+        self.search('ban')  # build the index
+        with self.assertNumQueries(0):
+            names = self.search('ban')
+        self.assertEqual(names, ['Bangalore Airport', 'Bangalore City Railway Station'])
+        self.assertEqual(self.search('bangalore rail'), ['Bangalore City Railway Station'])
+
+    def test_substring_address_and_typos(self):
+        self.assertEqual(self.search('galore air'), ['Bangalore Airport'])
+        self.assertEqual(self.search('kempegowda'), ['Bangalore Airport'])
+        self.assertEqual(self.search('mysor palce'), ['Mysore Palace'])
+        self.assertEqual(self.search('xyzzy'), [])
+
+    def test_incremental_updates(self):
+        self.search('chen')
+        with self.captureOnCommitCallbacks(execute=True):
+            location = Location.objects.get(name='Chennai Central')
+            location.name = 'Chennai Egmore'
+            location.save()
+        self.assertEqual(self.search('chennai'), ['Chennai Egmore'])
+        with self.captureOnCommitCallbacks(execute=True):
+            location.delete()
+        self.assertEqual(self.search('chennai'), [])
+
+
+class RatingAggregateTests(TestCase):
+    def assertAggregates(self, car, count, avg, stars):
+        car.refresh_from_db()
+        self.assertEqual(car.reviews_count, count)
+        self.assertEqual(car.rating_avg, avg)
+        self.assertEqual([car.stars_1, car.stars_2, car.stars_3, car.stars_4, car.stars_5], stars)
+
+    def test_reviews_keep_aggregates_current(self):
+        car, other = make_fleet(2)  # two reviews each: 4 and 5
+        self.assertAggregates(car, 2, 4.5, [0, 0, 0, 1, 1])
+
+        review = car.reviews.get(rating=4)
+        review.rating = 1
+        review.save()
+        self.assertAggregates(car, 2, 3.0, [1, 0, 0, 0, 1])
+
+        review.car = other
+        review.save()
+        self.assertAggregates(car, 1, 5.0, [0, 0, 0, 0, 1])
+        self.assertAggregates(other, 3, 10 / 3, [1, 0, 0, 1, 1])
+
+        car.reviews.get().delete()
+        self.assertAggregates(car, 0, 0, [0, 0, 0, 0, 0])
+
+    def test_rebuild_command_repairs_drift(self):
+        car = make_fleet(1)[0]
+        Car.objects.filter(pk=car.pk).update(reviews_count=7, rating_avg=1.0, stars_1=7)
+        call_command('rebuild_car_ratings', stdout=StringIO())
+        self.assertAggregates(car, 2, 4.5, [0, 0, 0, 1, 1])
+
+    def test_rating_sort_and_filter(self):
+        cars = make_fleet(3)
+        Review.objects.create(car=cars[1], rating=5)
+        Review.objects.create(car=cars[2], rating=1)
+        response = self.client.get('/api/cars/', {'ordering': 'rating'})
+        self.assertEqual([c['id'] for c in response.json()['results']], [cars[1].pk, cars[0].pk, cars[2].pk])
+        response = self.client.get('/api/cars/', {'min_rating': 4.5})
+        self.assertEqual({c['id'] for c in response.json()['results']}, {cars[0].pk, cars[1].pk})
+
+
+class KeysetPaginationTests(TestCase):
+    def walk(self, url, params, token=None):
+        headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+        pages = []
+        response = self.client.get(url, params, **headers)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            self.assertNotIn('count', body)
+            pages.append([row['id'] for row in body['results']])
+            if not body['next']:
+                break
+            response = self.client.get(body['next'], **headers)
+        # And back again through the previous links
+        back = []
+        while body['previous']:
+            body = self.client.get(body['previous'], **headers).json()
+            back.insert(0, [row['id'] for row in body['results']])
+        self.assertEqual(back, pages[:-1])
+        return [pk for page in pages for pk in page]
+
+    def test_cars_with_tied_fares(self):
+        cars = make_fleet(13)
+        Car.objects.filter(pk__in=[c.pk for c in cars[:9]]).update(base_fare=500)
+        ids = self.walk('/api/cars/', {'ordering': 'base_fare', 'page_size': 4})
+        expected = list(Car.objects.order_by('base_fare', 'id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        ids = self.walk('/api/cars/', {'ordering': '-base_fare', 'page_size': 4})
+        self.assertEqual(ids, expected[::-1])
+
+    def test_user_booking_history(self):
+        car = make_fleet(1)[0]
+        user = User.objects.create(username='rider')
+        other = User.objects.create(username='other')
+        now = timezone.now()
+        for i in range(11):
+            Booking.objects.create(user=user, car=car, start_datetime=now)
+            Booking.objects.create(user=other, car=car, start_datetime=now)
+        # Same created_at for several rows: the id breaks the tie
+        Booking.objects.filter(user=user).update(created_at=now)
+        token = Token.objects.create(user=user)
+        ids = self.walk('/api/bookings/', {'page_size': 3}, token=token.key)
+        self.assertEqual(ids, list(
+            Booking.objects.filter(user=user).order_by('-created_at', '-id').values_list('id', flat=True)
+        ))
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/cars/', {'cursor': 'bogus'}).status_code, 404)
+
+
+@override_settings(LIST_CACHE_TIMEOUT=0)  # count the queries behind every request
+class QueryBudgetTests(TestCase):
+    """Every endpoint stays within its declared budget at any data size."""
+    sizes = [1, 4, 10]
+
+    def grow_to(self, size):
+        user = User.objects.get(username='rider')
+        make_fleet(size - Car.objects.count())
+        for car in Car.objects.filter(booking__isnull=True):
+            Booking.objects.create(user=user, car=car, start_datetime=timezone.now())
+
+    def endpoints(self):
+        Promotion.objects.get_or_create(code='BUDGET', defaults={
+            'description': 'budget', 'discount_amount': 100,
+            'valid_from': '2020-01-01T00:00Z', 'valid_until': '2040-01-01T00:00Z',
+        })
+        car = Car.objects.order_by('pk').first()
+        booking = Booking.objects.order_by('pk').first()
+        temp = TempBooking.objects.create(pickup_location='Location 0', start_datetime='2030-01-01T10:00Z')
+        auth = {'HTTP_AUTHORIZATION': f'Token {self.token}'}
+        get = self.client.get
+        return [
+            ('cars list', 'GET', '/api/cars/', lambda: get('/api/cars/')),
+            ('car detail', 'GET', f'/api/cars/{car.pk}/', lambda: get(f'/api/cars/{car.pk}/')),
+            ('cars available', 'GET', '/api/cars/available/', lambda: get(
+                '/api/cars/available/', {'start_datetime': '2030-01-01T10:00Z', 'end_datetime': '2030-01-02T10:00Z'})),
+            ('bookings list', 'GET', '/api/bookings/', lambda: get('/api/bookings/', **auth)),
+            ('booking detail', 'GET', f'/api/bookings/{booking.pk}/', lambda: get(f'/api/bookings/{booking.pk}/', **auth)),
+            ('reviews list', 'GET', '/api/reviews/', lambda: get('/api/reviews/', {'car': car.pk})),
+            ('car quote', 'GET', '/api/cars/quote/', lambda: get(
+                '/api/cars/quote/', {'start_datetime': '2030-01-01T10:00Z', 'end_datetime': '2030-01-02T10:00Z',
+                                     'distance_km': 40, 'add_ons': 'GPS', 'promo_code': 'BUDGET'})),
+            ('promo validate', 'POST', '/api/promotions/validate_code/', lambda: self.client.post(
+                '/api/promotions/validate_code/', {'code': 'BUDGET'})),
+            ('location search', 'GET', '/api/locations/', lambda: get('/api/locations/', {'search': 'loc'})),
+            ('temp booking create', 'POST', '/api/booking-temp/', lambda: self.client.post(
+                '/api/booking-temp/', {'pickup_location': 'Location 0', 'start_datetime': '2030-01-01T10:00Z'})),
+            ('temp booking get', 'GET', f'/api/booking-temp/{temp.pk}/', lambda: get(f'/api/booking-temp/{temp.pk}/')),
+            ('car availability', 'GET', f'/api/cars/{car.pk}/availability/', lambda: get(
+                f'/api/cars/{car.pk}/availability/',
+                {'start_datetime': '2030-01-01T10:00Z', 'end_datetime': '2030-01-03T18:00Z'})),
+            ('booking export', 'GET', '/api/bookings/export/', lambda: streamed(get(
+                '/api/bookings/export/', {'created_from': '2020-01-01'}, HTTP_AUTHORIZATION=f'Token {self.staff_token}'))),
+            ('car facets', 'GET', '/api/cars/facets/', lambda: get(
+                '/api/cars/facets/', {'car_type': 'SUV', 'max_price': 5000, 'fuel': 'petrol'})),
+        ]
+
+    def test_endpoints_within_budget(self):
+        clear_caches()
+        user = User.objects.create(username='rider')
+        self.token = Token.objects.create(user=user).key
+        self.staff_token = Token.objects.create(user=User.objects.create(username='staff', is_staff=True)).key
+
+        measurements = {}
+        for size in self.sizes:
+            self.grow_to(size)
+            for name, method, path, request in self.endpoints():
+                request()  # warm the in-memory caches
+                response, queries = capture(request)
+                self.assertLess(response.status_code, 300, name)
+                measurements.setdefault(name, (method, path, []))[2].append((size, queries))
+
+        problems = []
+        for name, (method, path, results) in measurements.items():
+            problems += check_endpoint(name, method, path, results)
+        if problems:
+            self.fail('\n\n'.join(problems))
+
+
+class FareQuoteTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.cars = make_fleet(2)
+        Car.objects.filter(pk=self.cars[0].pk).update(
+            base_fare=1000, tax='90.50', unit_fare=12, unit_fare_after_km=10, insurance=150,
+        )
+        Car.objects.filter(pk=self.cars[1].pk).update(
+            base_fare=1500, tax=0, unit_fare=15, unit_fare_after_km=20, price_per_km_extra=20, insurance=0,
+        )
+        TripType.objects.create(name='round_trip')
+        Package.objects.create(label='4 hr / 40 km', hours=4, kms=40)
+        now = timezone.now()
+        Promotion.objects.create(code='SAVE300', description='300 off', discount_amount=300,
+                                 valid_from=now - timedelta(days=1), valid_until=now + timedelta(days=30))
+        Promotion.objects.create(code='OLD', description='expired', discount_amount=300,
+                                 valid_from=now - timedelta(days=30), valid_until=now - timedelta(days=1))
+        self.start = now + timedelta(days=1)
+
+    def quote(self, **params):
+        params.setdefault('start_datetime', self.start.isoformat())
+        params.setdefault('end_datetime', (self.start + timedelta(hours=30)).isoformat())
+        response = self.client.get('/api/cars/quote/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return {row['car_id']: row for row in response.json()['quotes']}
+
+    def test_daily_fare_with_distance_add_ons_and_promo(self):
+        first, second = self.quote(distance_km=25, add_ons='gps', promo_code='save300').values()
+        # 2 days x 1000 + 15 km x 12 + 50 GPS + 150 insurance - 300 + 90.50 tax
+        self.assertEqual(first['rental'], '2000.00')
+        self.assertEqual(first['distance'], '180.00')
+        self.assertEqual(first['total'], '2170.50')
+        # 2 days x 1500 + 5 km x 15 + 50 GPS - 300
+        self.assertEqual(second['total'], '2825.00')
+
+    def test_round_trip_and_package(self):
+        quotes = self.quote(distance_km=25, trip_type='round_trip')
+        self.assertEqual(quotes[self.cars[0].pk]['distance'], '480.00')  # 40 km over 10
+        quotes = self.quote(
+            distance_km=55, package='4 hr / 40 km',
+            end_datetime=(self.start + timedelta(hours=5, minutes=10)).isoformat(),
+        )
+        # package + 2 started hours at 1500 / 4, 15 km over the package at 20
+        self.assertEqual(quotes[self.cars[1].pk]['rental'], '2250.00')
+        self.assertEqual(quotes[self.cars[1].pk]['distance'], '300.00')
+
+    def test_discount_capped_and_booked_cars_excluded(self):
+        Car.objects.filter(pk=self.cars[0].pk).update(base_fare=100, insurance=0)
+        Booking.objects.create(user=User.objects.create(username='rider'), car=self.cars[1],
+                               start_datetime=self.start, end_datetime=self.start + timedelta(hours=1))
+        quotes = self.quote(promo_code='SAVE300')
+        self.assertEqual(list(quotes), [self.cars[0].pk])
+        self.assertEqual(quotes[self.cars[0].pk]['discount'], '200.00')
+        self.assertEqual(quotes[self.cars[0].pk]['total'], '90.50')
+
+    def test_naive_datetimes_are_in_the_current_time_zone(self):
+        naive = self.start.replace(tzinfo=None)
+        quotes = self.quote(
+            start_datetime=naive.isoformat(), end_datetime=(self.start + timedelta(hours=30)).isoformat(),
+            promo_code='SAVE300',
+        )
+        self.assertEqual(quotes[self.cars[0].pk]['discount'], '300.00')
+
+    def test_rejects_bad_terms(self):
+        response = self.client.get('/api/cars/quote/', {
+            'promo_code': 'OLD', 'package': 'nope', 'add_ons': 'GPS,XX', 'distance_km': '-3',
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'promo_code', 'package', 'add_ons', 'distance_km'})
+
+
+class PromotionIndexTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        now = timezone.now()
+        day = timedelta(days=1)
+        for code, start, end, active in [
+            ('LIVE', now - day, now + day, True),
+            ('OLD', now - 3 * day, now - day, True),
+            ('SOON', now + day, now + 3 * day, True),
+            ('OFF', now - day, now + day, False),
+        ]:
+            Promotion.objects.create(code=code, description=code, discount_amount=100,
+                                     valid_from=start, valid_until=end, is_active=active)
+
+    def validate(self, code):
+        return self.client.post('/api/promotions/validate_code/', {'code': code})
+
+    def test_window_checks_without_queries(self):
+        self.validate('LIVE')  # load the index
+        with self.assertNumQueries(0):
+            live = self.validate('live')
+            expired = self.validate('OLD')
+            early = self.validate('SOON')
+            inactive = self.validate('OFF')
+            unknown = [self.validate(f'GUESS{i}') for i in range(20)]
+        self.assertEqual(live.status_code, 200)
+        self.assertEqual(live.json()['promo']['code'], 'LIVE')
+        self.assertEqual(expired.json()['error'], 'Promo code has expired')
+        self.assertEqual(early.json()['error'], 'Promo code is not valid yet')
+        self.assertEqual(inactive.json()['error'], 'Invalid promo code')
+        self.assertEqual({r.status_code for r in unknown}, {400})
+
+    def test_naive_moments_are_in_the_current_time_zone(self):
+        naive = timezone.now().replace(tzinfo=None)
+        self.assertEqual(promotion_index.check('LIVE', at=naive)[0].code, 'LIVE')
+        self.assertEqual(promotion_index.check('SOON', at=naive + timedelta(days=2))[0].code, 'SOON')
+
+    def test_refreshes_on_change(self):
+        self.assertEqual(self.validate('OFF').status_code, 400)
+        with self.captureOnCommitCallbacks(execute=True):
+            promo = Promotion.objects.get(code='OFF')
+            promo.is_active = True
+            promo.save()
+        self.assertEqual(self.validate('OFF').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            promo.delete()
+        self.assertEqual(self.validate('OFF').status_code, 400)
+
+
+class TempBookingStoreTests(TestCase):
+    def setUp(self):
+        clear_caches()
+
+    def create(self):
+        response = self.client.post('/api/booking-temp/', {
+            'pickup_location': 'Location 0', 'start_datetime': '2030-01-01T10:00Z',
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.json()['temp_id']
+
+    def test_reads_served_from_cache(self):
+        temp_id = self.create()
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/api/booking-temp/{temp_id}/')
+        self.assertEqual(response.json()['pickup_location'], 'Location 0')
+        clear_caches()
+        with self.assertNumQueries(1):
+            self.client.get(f'/api/booking-temp/{temp_id}/')
+        with self.assertNumQueries(0):
+            self.client.get(f'/api/booking-temp/{temp_id}/')
+
+    def test_expired_bookings_are_missing_and_reaped(self):
+        old_ids = [self.create() for _ in range(5)]
+        TempBooking.objects.filter(pk__in=old_ids).update(created_at=timezone.now() - timedelta(days=2))
+        fresh_id = self.create()
+        clear_caches()
+        self.assertEqual(self.client.get(f'/api/booking-temp/{old_ids[0]}/').status_code, 404)
+
+        call_command('reap_temp_bookings', '--batch-size', '2', stdout=StringIO())
+        self.assertEqual(list(TempBooking.objects.values_list('pk', flat=True)), [uuid.UUID(fresh_id)])
+        self.assertEqual(self.client.get(f'/api/booking-temp/{fresh_id}/').status_code, 200)
+
+
+class ImageDerivativeTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(self.media_root, 'car_images'))
+        Image.new('RGB', (2400, 1600), 'red').save(os.path.join(self.media_root, 'car_images', 'big.jpg'))
+        Image.new('RGB', (300, 200), 'blue').save(os.path.join(self.media_root, 'car_images', 'small.png'))
+
+    def test_backfill_builds_variants_and_srcset(self):
+        car = make_fleet(1)[0]
+        car.images.all().delete()
+        big = CarImage.objects.create(car=car, image='car_images/big.jpg')
+        CarImage.objects.create(car=car, image='car_images/small.png')
+        call_command('build_image_derivatives', '--workers', '2', stdout=StringIO())
+
+        big.refresh_from_db()
+        self.assertEqual(
+            {name: entry['width'] for name, entry in big.derivatives.items()},
+            {'full': 1600, 'card': 480, 'thumb': 160},
+        )
+        self.assertEqual(big.derivatives['card']['height'], 320)
+        with Image.open(os.path.join(self.media_root, big.derivatives['thumb']['webp'])) as thumb:
+            self.assertEqual((thumb.format, thumb.size), ('WEBP', (160, 107)))
+        small = CarImage.objects.get(image='car_images/small.png')
+        self.assertEqual(small.derivatives['full']['width'], 300)  # never upscaled
+
+        image = self.client.get(f'/api/cars/{car.pk}/').json()['images'][0]
+        self.assertEqual(
+            image['srcset']['card']['jpeg'], f"http://testserver/media/{big.derivatives['card']['jpeg']}",
+        )
+
+    def test_same_stem_images_keep_their_own_variants(self):
+        os.makedirs(os.path.join(self.media_root, 'other'))
+        Image.new('RGB', (300, 200), 'green').save(os.path.join(self.media_root, 'car_images', 'big.png'))
+        Image.new('RGB', (200, 100), 'green').save(os.path.join(self.media_root, 'other', 'big.jpg'))
+        variants = [render(self.media_root, name) for name in ['car_images/big.jpg', 'car_images/big.png', 'other/big.jpg']]
+        self.assertEqual([entry['full']['width'] for entry in variants], [1600, 300, 200])
+        self.assertEqual(len({entry['card']['jpeg'] for entry in variants}), 3)
+        with Image.open(os.path.join(self.media_root, variants[0]['full']['jpeg'])) as full:
+            self.assertEqual(full.size, (1600, 1067))
+
+
+class CarImageUploadTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        staff = User.objects.create(username='staff', is_staff=True)
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=staff).key}'}
+        self.car = make_fleet(1)[0]
+
+    def photo(self, name, format='JPEG'):
+        buffer = BytesIO()
+        Image.new('RGB', (64, 48), 'green').save(buffer, format=format)
+        buffer.seek(0)
+        buffer.name = name
+        return buffer
+
+    def test_bulk_upload_reports_per_file(self):
+        bogus = BytesIO(b'not an image')
+        bogus.name = 'notes.jpg'
+        files = [self.photo('front.jpg'), self.photo('side.png', 'PNG'), bogus, self.photo('front.jpg')]
+        with mock.patch('car_rental.views.derivatives.schedule') as schedule, \
+                CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(
+                f'/api/cars/{self.car.pk}/images/', {'images': files, 'other': self.photo('x.jpg')}, **self.auth,
+            )
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual(body['status'], 'partial')
+        self.assertEqual([r['file'] for r in body['results']], ['front.jpg', 'side.png', 'notes.jpg', 'front.jpg'])
+        self.assertEqual([r['ok'] for r in body['results']], [True, True, False, True])
+        self.assertEqual(body['results'][2]['error'], 'Not a valid image.')
+        self.assertNotEqual(body['results'][0]['image'], body['results'][3]['image'])
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(len(schedule.call_args[0][0]), 3)
+
+        stored = sorted(os.listdir(os.path.join(self.media_root, 'car_images')))
+        self.assertEqual(len(stored), 3)  # bogus file and the non-image field were not kept
+        self.assertEqual(self.car.images.count(), 5)
+
+    def test_requires_staff(self):
+        response = self.client.post(f'/api/cars/{self.car.pk}/images/', {'images': [self.photo('a.jpg')]})
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'car_images')))
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.car = make_fleet(2)[0]
+
+    def revalidate(self, url, first):
+        with self.assertNumQueries(0):
+            return self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+
+    def test_car_list_and_detail(self):
+        for url in ['/api/cars/', '/api/cars/?ordering=base_fare', f'/api/cars/{self.car.pk}/']:
+            first = self.client.get(url)
+            self.assertEqual(first.status_code, 200)
+            self.assertIn('Last-Modified', first)
+            self.assertEqual(self.revalidate(url, first).status_code, 304)
+
+        first = self.client.get('/api/cars/')
+        for change in [
+            lambda: Car.objects.filter(pk=self.car.pk).get().save(),
+            lambda: Review.objects.create(car=self.car, rating=1),
+            lambda: self.car.features.clear(),
+            lambda: CarImage.objects.filter(car=self.car).first().delete(),
+        ]:
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            changed = self.client.get('/api/cars/', HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(changed.status_code, 200)
+            self.assertNotEqual(changed['ETag'], first['ETag'])
+            first = changed
+
+    def test_catalogs(self):
+        Package.objects.create(label='4 hr / 40 km', hours=4, kms=40)
+        Offer.objects.create(code='CABTRIP', desc='200 OFF', is_active=True)
+        for url in ['/api/packages/', '/api/offers/']:
+            first = self.client.get(url)
+            self.assertEqual(self.revalidate(url, first).status_code, 304)
+        first = self.client.get('/api/packages/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Package.objects.create(label='8 hr / 80 km', hours=8, kms=80)
+        self.assertEqual(self.client.get('/api/packages/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_temp_booking(self):
+        temp_id = self.client.post('/api/booking-temp/', {
+            'pickup_location': 'Location 0', 'start_datetime': '2030-01-01T10:00Z',
+        }).json()['temp_id']
+        url = f'/api/booking-temp/{temp_id}/'
+        first = self.client.get(url)
+        self.assertEqual(self.revalidate(url, first).status_code, 304)
+        since = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(since.status_code, 304)
+
+
+@override_settings(LIST_CACHE_TIMEOUT=0)  # count the queries behind every request
+class SparseFieldsTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.car = make_fleet(2)[0]
+        user = User.objects.create(username='rider')
+        self.booking = Booking.objects.create(user=user, car=self.car, start_datetime=timezone.now())
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=user).key}'}
+        self.client.get('/api/cars/')  # warm the add-on catalog
+
+    def get(self, url, params=None, **extra):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params or {}, **extra)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), ctx.captured_queries
+
+    def test_fields_prune_output_and_queries(self):
+        full, _ = self.get(f'/api/cars/{self.car.pk}/')
+        data, queries = self.get(f'/api/cars/{self.car.pk}/', {'fields': 'id,name,base_fare,rating'})
+        self.assertEqual(data, {key: full[key] for key in ('id', 'name', 'base_fare', 'rating')})
+        # no joins, no image/feature prefetches, and only the columns rendered
+        self.assertEqual(len(queries), 1)
+        sql = queries[0]['sql']
+        self.assertNotIn('JOIN', sql)
+        self.assertNotIn('"description"', sql)
+
+        page, queries = self.get('/api/cars/', {'fields': 'id,images', 'ordering': 'base_fare', 'page_size': 1})
+        self.assertEqual(set(page['results'][0]), {'id', 'images'})
+        self.assertEqual(len(queries), 2)  # cars, images
+        self.assertIsNotNone(page['next'])
+
+    def test_expand_collapses_relations_to_ids(self):
+        full, _ = self.get(f'/api/cars/{self.car.pk}/')
+        data, queries = self.get(f'/api/cars/{self.car.pk}/', {'expand': 'location'})
+        self.assertEqual(data['location'], full['location'])
+        self.assertEqual(data['group'], self.car.group_id)
+        self.assertEqual(data['images'], sorted(image['id'] for image in full['images']))
+        self.assertEqual(data['add_ons'], list(AddOn.objects.values_list('id', flat=True)))
+        self.assertEqual(data['features'], full['features'])
+        self.assertNotIn('car_group', ' '.join(query['sql'] for query in queries))
+
+    def test_booking_dotted_fields(self):
+        url = f'/api/bookings/{self.booking.pk}/'
+        full, _ = self.get(url, **self.auth)
+        data, queries = self.get(url, {'fields': 'id,status,car.name,car.location'}, **self.auth)
+        self.assertEqual(data, {
+            'id': full['id'], 'status': full['status'],
+            'car': {'name': full['car']['name'], 'location': full['car']['location']},
+        })
+        self.assertEqual(len(queries), 2)  # token, booking joined to car and location
+
+        data, _ = self.get(url, {'fields': 'car', 'expand': 'car'}, **self.auth)
+        self.assertEqual(data['car']['group'], self.car.group_id)
+        data, _ = self.get('/api/bookings/', {'fields': 'id,car'}, **self.auth)
+        self.assertEqual(data['results'], [{'id': self.booking.pk, 'car': full['car']}])
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get('/api/cars/', {'fields': 'id,bogus'})
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.json()['fields'][0].startswith('Unknown field(s) bogus; choose from id, name,'))
+        response = self.client.get(f'/api/bookings/{self.booking.pk}/', {'fields': 'id,car.bogus'}, **self.auth)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('car.bogus; choose from car.id,', response.json()['fields'][0])
+
+    def test_default_output_unchanged(self):
+        data, _ = self.get(f'/api/cars/{self.car.pk}/')
+        self.assertEqual(set(data), set(CarSerializer.Meta.fields))
+        self.assertIsInstance(data['group'], dict)
+
+
+@override_settings(LIST_CACHE_TIMEOUT=0)  # count the queries behind every request
+class ValuesSerializerTests(TestCase):
+    """The values() list path renders exactly what the DRF serializers do."""
+
+    def setUp(self):
+        clear_caches()
+        cars = make_fleet(3)
+        Location.objects.filter(pk=cars[0].location_id).update(address='MG Road', map_url='https://maps.example/1')
+        Car.objects.filter(pk=cars[1].pk).update(location=None, group=None, description='Quiet')
+        Car.objects.filter(pk=cars[2].pk).update(reviews_count=3, rating_avg=4.333)
+        CarImage.objects.filter(car=cars[0]).update(derivatives={
+            'thumb': {'width': 160, 'height': 90, 'jpeg': 'car_images/derived/0_thumb.jpg',
+                      'webp': 'car_images/derived/0_thumb.webp'},
+        })
+        AddOn.objects.create(code='SEAT', name='Child seat', price='99.50')
+        staff = User.objects.create(username='staff', is_staff=True, first_name='Asha', last_name='Rao')
+        rider = User.objects.create(username='rider', first_name='Ravi')
+        promo = Promotion.objects.create(code='SAVE', description='save', discount_amount='100.00',
+                                         valid_from=timezone.now(), valid_until=timezone.now())
+        trip = TripType.objects.create(name='hourly')
+        booking = Booking.objects.create(
+            user=rider, car=cars[0], start_datetime=timezone.now(), trip_type=trip, applied_promotion=promo,
+            pickup_lat='12.900000', fare_estimate='1234.5',
+        )
+        booking.add_ons.set(AddOn.objects.all())
+        Booking.objects.create(user=staff, car=cars[1], start_datetime=timezone.now())
+        Review.objects.create(car=cars[0], user=staff, rating=3, comment='ok')
+        Review.objects.create(car=cars[0], user=rider, rating=2)
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=staff).key}'}
+
+    def both(self, view, url, params=None, **extra):
+        fast = self.client.get(url, params or {}, **extra)
+        with mock.patch.object(view, 'values_serializer_class', None):
+            slow = self.client.get(url, params or {}, **extra)
+        self.assertEqual(fast.status_code, 200)
+        self.assertEqual(slow.status_code, 200)
+        return fast.json(), slow.json()
+
+    def test_parity(self):
+        cases = [
+            (CarViewSet, '/api/cars/', {}),
+            (CarViewSet, '/api/cars/', {'lat': '13.0', 'lng': '77.6', 'ordering': '-base_fare', 'page_size': 2}),
+            (CarViewSet, '/api/cars/', {'ordering': 'rating'}),
+            (CarViewSet, '/api/cars/', {'car_type': 'SUV', 'min_price': 101}),
+            (BookingViewSet, '/api/bookings/', {}),
+            (ReviewViewSet, '/api/reviews/', {}),
+            (ReviewViewSet, '/api/reviews/', {'car': Car.objects.order_by('pk')[0].pk}),
+        ]
+        for view, url, params in cases:
+            with self.subTest(url=url, params=params):
+                fast, slow = self.both(view, url, params, **self.auth)
+                self.assertEqual(fast, slow)
+                self.assertTrue(fast['results'])
+
+    def test_queries_stay_constant(self):
+        self.client.get('/api/cars/')
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/cars/')
+        # cars, images, features
+        self.assertEqual(len(ctx.captured_queries), 3)
+
+
+class ListResponseCacheTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.cars = make_fleet(3)
+
+    def get(self, params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/cars/', params)
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_hits_share_normalized_params(self):
+        first, _ = self.get({'min_price': '101', 'car_type': 'SUV'})
+        self.assertEqual(first['X-Cache'], 'miss')
+        again, queries = self.get({'car_type': 'SUV', 'min_price': '101.00', 'ac': ''})
+        self.assertEqual(again['X-Cache'], 'hit')
+        self.assertEqual(queries, 0)
+        self.assertEqual(again.json(), first.json())
+        self.assertEqual(again['ETag'], first['ETag'])
+        self.assertEqual(self.get({'car_type': 'SUV', 'min_price': '102'})[0]['X-Cache'], 'miss')
+        # unknown or repeated parameters bypass the cache
+        self.assertNotIn('X-Cache', self.get({'car_type': 'SUV', 'debug': '1'})[0])
+        self.assertNotIn('X-Cache', self.client.get('/api/cars/?seats=2&seats=4'))
+
+    def rename(self, car, name):
+        car.name = name
+        car.save()
+
+    def test_changes_rebuild_entries(self):
+        first, _ = self.get({})
+        for change in [
+            lambda: self.rename(self.cars[0], 'Renamed'),
+            lambda: CarImage.objects.create(car=self.cars[1], image='car_images/new.jpg'),
+            lambda: Review.objects.create(car=self.cars[2], rating=1),
+            lambda: Location.objects.filter(pk=self.cars[0].location_id).get().save(),
+        ]:
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            rebuilt, queries = self.get({})
+            self.assertEqual(rebuilt['X-Cache'], 'miss')
+            self.assertGreater(queries, 0)
+            self.assertNotEqual(rebuilt['ETag'], first['ETag'])
+            first = rebuilt
+        self.assertEqual(first.json()['results'][0]['name'], 'Renamed')
+
+    def test_stale_while_revalidating(self):
+        first, _ = self.get({'ordering': 'base_fare'})
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(car=self.cars[0], rating=1)
+        # Another request holds the refresh lock: serve the old copy with its own validators
+        request = Request(APIRequestFactory().get('/api/cars/', {'ordering': 'base_fare'}))
+        cache.add(CarViewSet.list_cache.key(request, [('ordering', 'base_fare')]) + ':refresh', 1)
+        stale, queries = self.get({'ordering': 'base_fare'})
+        self.assertEqual(stale['X-Cache'], 'stale')
+        self.assertEqual(queries, 0)
+        self.assertEqual(stale['ETag'], first['ETag'])
+
+        with override_settings(LIST_CACHE_MAX_STALE=-1):
+            self.assertEqual(self.get({'ordering': 'base_fare'})[0]['X-Cache'], 'miss')
+
+
+@override_settings(LIST_CACHE_TIMEOUT=0)
+class CarFacetTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.cars = make_fleet(3)
+        sedan = Car.objects.get(pk=self.cars[0].pk)  # with its rating aggregates
+        sedan.car_type = 'Sedan'
+        sedan.base_fare = 700
+        sedan.transmission = CarTransmission.objects.create(type='Automatic')
+        sedan.save()
+
+    def facets(self, **params):
+        response = self.client.get('/api/cars/facets/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def counts(self, facets, name):
+        return {item['value']: item['count'] for item in facets['facets'][name]}
+
+    def test_counts_leave_out_their_own_filter(self):
+        data = self.facets()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(self.counts(data, 'car_type'), {'SUV': 2, 'Sedan': 1})
+        self.assertEqual(self.counts(data, 'transmission'), {'Manual': 2, 'Automatic': 1})
+        self.assertEqual(self.counts(data, 'price'), {0: 2, 500: 1})
+        self.assertEqual(self.counts(data, 'rating'), {4: 3})
+        self.assertEqual(self.counts(data, 'ac'), {True: 3})
+        self.assertEqual(self.counts(data, 'features'), {'Feature 0': 3, 'Feature 1': 3, 'Feature 2': 3})
+
+        data = self.facets(car_type='suv', max_price=500)
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(self.counts(data, 'car_type'), {'SUV': 2})  # the sedan fails max_price
+        self.assertEqual(self.counts(data, 'price'), {0: 2})
+        self.assertEqual(self.counts(data, 'fuel'), {'Petrol': 2})
+
+        data = self.facets(transmission='Automatic')
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(self.counts(data, 'transmission'), {'Manual': 2, 'Automatic': 1})
+        self.assertEqual(self.counts(data, 'car_type'), {'Sedan': 1})
+
+        self.assertEqual(self.client.get('/api/cars/facets/', {'seats': 'many'}).status_code, 400)
+
+    def test_rows_follow_writes(self):
+        car = self.cars[1]
+        Review.objects.create(car=car, rating=1)
+        car.features.remove(CarFeature.objects.get(name='Feature 0'))
+        CarFeature.objects.get(name='Feature 1').cars.clear()
+        CarFeature.objects.filter(name='Feature 2').update(name='Feature Two')  # no signals
+        feature = CarFeature.objects.get(name='Feature Two')
+        feature.name = 'Feature 2+'
+        feature.save()
+        CarFuel.objects.get(name='Petrol').delete()
+
+        data = self.facets()
+        self.assertEqual(self.counts(data, 'rating'), {3: 1, 4: 2})
+        self.assertEqual(self.counts(data, 'features'), {'Feature 0': 2, 'Feature 2+': 3})
+        self.assertEqual(self.counts(data, 'fuel'), {})
+
+        stored = sorted(CarFacetValue.objects.values_list('car_id', 'facet', 'value'))
+        carfacets.rebuild()
+        self.assertEqual(sorted(CarFacetValue.objects.values_list('car_id', 'facet', 'value')), stored)
+
+
+@override_settings(LIST_CACHE_TIMEOUT=0)
+class CarSearchTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.swift, self.creta, self.city = make_fleet(3)
+        self.swift.name = 'Swift'
+        self.swift.save()
+        self.creta.name = 'Creta'
+        self.creta.description = 'Roomy, smooth on the highway, better than a Swift'
+        self.creta.save()
+        self.city.location.name = 'Chennai Airport'
+        self.city.location.save()
+
+    def search(self, **params):
+        response = self.client.get('/api/cars/', params)
+        self.assertEqual(response.status_code, 200)
+        return [car['name'] for car in response.json()['results']]
+
+    def test_ranked_prefix_search(self):
+        self.assertEqual(self.search(q='swift'), ['Swift', 'Creta'])  # name hits first
+        self.assertEqual(self.search(q='SWI'), ['Swift', 'Creta'])
+        self.assertEqual(self.search(q='chen airp'), ['Car 2'])
+        self.assertEqual(len(self.search(q='feature')), 3)
+        self.assertEqual(self.search(q='"; DROP TABLE'), [])
+        self.assertEqual(len(self.search(q='  ')), 3)  # no words: no search
+
+    def test_combines_with_filters_ordering_and_paging(self):
+        Car.objects.filter(pk=self.creta.pk).update(base_fare=50)  # no signals
+        self.assertEqual(self.search(q='swift', ordering='base_fare'), ['Creta', 'Swift'])
+        self.assertEqual(self.search(q='swift', max_price=80), ['Creta'])
+        self.assertEqual(self.search(q='swift', fields='id,name'), ['Swift', 'Creta'])
+
+        first = self.client.get('/api/cars/', {'q': 'swift', 'page_size': 1}).json()
+        self.assertEqual([car['name'] for car in first['results']], ['Swift'])
+        second = self.client.get(first['next']).json()
+        self.assertEqual([car['name'] for car in second['results']], ['Creta'])
+        self.assertIsNone(second['next'])
+
+        facets = self.client.get('/api/cars/facets/', {'q': 'swift'}).json()
+        self.assertEqual(facets['count'], 2)
+        self.assertEqual(facets['facets']['car_type'], [{'value': 'SUV', 'count': 2}])
+
+    def test_index_follows_writes(self):
+        feature = CarFeature.objects.get(name='Feature 0')
+        feature.name = 'Sunroof'
+        feature.save()
+        self.assertEqual(len(self.search(q='sunroof')), 3)
+        self.swift.features.remove(feature)
+        feature.cars.remove(self.creta)
+        self.assertEqual(self.search(q='sunroof'), ['Car 2'])
+        Location.objects.get(pk=self.city.location_id).delete()
+        self.assertEqual(self.search(q='chennai'), [])
+        self.swift.delete()
+        self.assertEqual(self.search(q='swift'), ['Creta'])
+        self.assertEqual(carsearch.rebuild(), 2)
+        self.assertEqual(self.search(q='swift'), ['Creta'])
+
+
+class CarCalendarTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.car, self.other = make_fleet(2)
+        self.user = User.objects.create(username='rider')
+
+    def book(self, start, end, car=None, status='confirmed'):
+        return Booking.objects.create(
+            user=self.user, car=car or self.car, start_datetime=start, end_datetime=end, status=status,
+        )
+
+    def slots(self, car, day):
+        row = CarCalendarDay.objects.filter(car=car, day=date.fromisoformat(day)).first()
+        bitmap = carcalendar.from_bytes(row.slots) if row else 0
+        return [slot for slot in range(96) if bitmap >> slot & 1]
+
+    def free(self, start, end, car=None):
+        response = self.client.get(f'/api/cars/{(car or self.car).pk}/availability/', {
+            'start_datetime': start, 'end_datetime': end,
+        })
+        self.assertEqual(response.status_code, 200)
+        return response.json()['available']
+
+    def test_bookings_round_out_to_slots(self):
+        self.book('2030-01-04T10:05Z', '2030-01-04T10:20Z')
+        self.assertEqual(self.slots(self.car, '2030-01-04'), [40, 41])
+        self.book('2030-01-04T23:30Z', '2030-01-05T00:15Z')
+        self.assertEqual(self.slots(self.car, '2030-01-04'), [40, 41, 94, 95])
+        self.assertEqual(self.slots(self.car, '2030-01-05'), [0])
+
+    def test_incremental_updates(self):
+        first = self.book('2030-01-04T10:00Z', '2030-01-06T18:00Z')
+        second = self.book('2030-01-05T09:00Z', '2030-01-05T12:00Z')
+        self.assertEqual(len(self.slots(self.car, '2030-01-05')), 96)
+
+        # Cancelling one of two overlapping bookings keeps the other's slots
+        first.status = 'cancelled'
+        first.save()
+        self.assertEqual(self.slots(self.car, '2030-01-05'), list(range(36, 48)))
+        self.assertEqual(self.slots(self.car, '2030-01-04'), [])
+
+        second.car = self.other
+        second.save()
+        self.assertEqual(self.slots(self.car, '2030-01-05'), [])
+        self.assertEqual(self.slots(self.other, '2030-01-05'), list(range(36, 48)))
+        second.delete()
+        self.assertEqual(self.slots(self.other, '2030-01-05'), [])
+        self.assertEqual(carcalendar.check(), [])
+
+    def test_availability_endpoint(self):
+        self.book('2030-01-05T09:00Z', '2030-01-05T12:00Z')
+        self.book('2030-01-10T09:00Z', '2030-01-10T12:00Z', status='cancelled')
+        self.assertFalse(self.free('2030-01-04T10:00Z', '2030-01-06T18:00Z'))
+        self.assertTrue(self.free('2030-01-05T12:00Z', '2030-01-06T18:00Z'))
+        self.assertTrue(self.free('2030-01-04T10:00Z', '2030-01-05T09:00Z'))
+        self.assertTrue(self.free('2030-01-10T09:00Z', '2030-01-10T12:00Z'))
+        self.assertTrue(self.free('2030-01-04T10:00Z', '2030-01-06T18:00Z', car=self.other))
+
+        # No end: busy from its start on
+        self.book('2030-02-01T00:00Z', None, car=self.other)
+        self.assertFalse(self.free('2031-01-01T00:00Z', '2031-01-02T00:00Z', car=self.other))
+        self.assertTrue(self.free('2030-01-01T00:00Z', '2030-01-02T00:00Z', car=self.other))
+
+        url = f'/api/cars/{self.car.pk}/availability/'
+        self.assertEqual(self.client.get(url, {'start_datetime': '2030-01-05T09:00Z'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {
+            'start_datetime': '2030-01-05T09:00Z', 'end_datetime': '2030-01-05T08:00Z',
+        }).status_code, 400)
+        # A bound without an offset is in the current time zone (UTC)
+        self.assertFalse(self.client.get(url, {
+            'start_datetime': '2030-01-05T11:00', 'end_datetime': '2030-01-05T13:00Z',
+        }).json()['available'])
+        self.assertEqual(self.client.get('/api/cars/999999/availability/', {
+            'start_datetime': '2030-01-05T09:00Z', 'end_datetime': '2030-01-05T10:00Z',
+        }).status_code, 404)
+
+    def test_available_and_quote_read_the_calendar(self):
+        window = {'start_datetime': '2030-01-05T10:00Z', 'end_datetime': '2030-01-05T11:00Z'}
+        booking = self.book('2030-01-05T09:00Z', '2030-01-05T12:00Z')
+        self.assertEqual([car['id'] for car in self.client.get('/api/cars/available/', window).json()], [self.other.pk])
+        quotes = self.client.get('/api/cars/quote/', {**window, 'distance_km': 10}).json()['quotes']
+        self.assertEqual([quote['car_id'] for quote in quotes], [self.other.pk])
+
+        # Whatever wrote the calendar, every process reads the same rows
+        Booking.objects.filter(pk=booking.pk).update(status='cancelled')  # no signals
+        carcalendar.check(fix=True)
+        self.assertEqual(len(self.client.get('/api/cars/available/', window).json()), 2)
+
+    def test_window_edges_are_exact(self):
+        self.book('2030-01-04T10:05Z', '2030-01-04T10:20Z')  # slots 10:00 and 10:15
+        self.assertTrue(self.free('2030-01-04T10:20Z', '2030-01-04T11:00Z'))
+        self.assertTrue(self.free('2030-01-04T09:00Z', '2030-01-04T10:05Z'))
+        self.assertFalse(self.free('2030-01-04T10:19Z', '2030-01-04T10:21Z'))
+        self.assertFalse(self.free('2030-01-04T09:00Z', '2030-01-04T12:00Z'))
+        # No end: the instant
+        self.assertEqual(carcalendar.busy_car_ids(parse_datetime('2030-01-04T10:10Z')), {self.car.pk})
+        self.assertEqual(carcalendar.busy_car_ids(parse_datetime('2030-01-04T10:20Z')), set())
+
+    def test_check_and_rebuild(self):
+        booking = self.book('2030-01-05T09:00Z', '2030-01-05T12:00Z')
+        Booking.objects.filter(pk=booking.pk).update(end_datetime='2030-01-05T13:00Z')  # no signals
+        CarCalendarDay.objects.create(car=self.other, day='2030-01-07', slots=carcalendar.to_bytes(1))
+
+        problems = carcalendar.check()
+        self.assertEqual([(car_id, str(day)) for car_id, day, _, _ in problems], [
+            (self.car.pk, '2030-01-05'), (self.other.pk, '2030-01-07'),
+        ])
+        with self.assertRaises(CommandError):
+            call_command('check_car_calendar', stdout=StringIO())
+        call_command('check_car_calendar', '--fix', stdout=StringIO())
+        self.assertEqual(carcalendar.check(), [])
+        self.assertEqual(self.slots(self.car, '2030-01-05'), list(range(36, 52)))
+
+        CarCalendarDay.objects.all().delete()
+        self.assertEqual(carcalendar.rebuild(), 1)
+        self.assertEqual(carcalendar.check(), [])
+
+
+class BookingExportTests(TestCase):
+    def setUp(self):
+        car, = make_fleet(1)
+        rider = User.objects.create(username='rider')
+        self.staff = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=User.objects.create(username="staff", is_staff=True)).key}'}
+        self.rider = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=rider).key}'}
+        for day, status in [(1, 'confirmed'), (2, 'cancelled'), (3, 'pending')]:
+            Booking.objects.create(
+                user=rider, car=car, start_datetime=f'2030-01-0{day}T10:00Z', end_datetime=f'2030-01-0{day}T18:00Z',
+                status=status, final_price='1500.50',
+            )
+
+    def export(self, **params):
+        response = self.client.get('/api/bookings/export/', params, **self.staff)
+        self.assertEqual(response.status_code, 200)
+        return streamed(response)
+
+    def test_csv_export(self):
+        response = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment;', response['Content-Disposition'])
+        rows = list(csv.DictReader(response.streamed_text.splitlines()))
+        self.assertEqual([row['status'] for row in rows], ['confirmed', 'cancelled', 'pending'])
+        self.assertEqual(rows[0]['start_datetime'], '2030-01-01T10:00:00+00:00')
+        self.assertEqual((rows[0]['user'], rows[0]['car'], rows[0]['final_price']), ('rider', 'Car 0', '1500.50'))
+        self.assertEqual(rows[0]['trip_type'], '')
+
+        # A date bound covers its whole day
+        rows = list(csv.DictReader(self.export(start_from='2030-01-02', start_to='2030-01-03').streamed_text.splitlines()))
+        self.assertEqual([row['status'] for row in rows], ['cancelled', 'pending'])
+        rows = list(csv.DictReader(self.export(status='confirmed,pending', start_to='2030-01-02T10:00Z').streamed_text.splitlines()))
+        self.assertEqual([row['status'] for row in rows], ['confirmed'])
+        self.assertEqual(self.export(created_from='2999-01-01').streamed_text.splitlines(), [
+            'id,status,created_at,start_datetime,end_datetime,user,car_id,car,car_type,trip_type,pickup_location,'
+            'drop_location,destination_location,distance_km,duration_hours,num_passengers,driver_required,'
+            'promotion,fare_estimate,final_price',
+        ])
+
+    def test_ndjson_export(self):
+        response = self.export(output='ndjson', status='pending')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in response.streamed_text.splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['status'], 'pending')
+        self.assertEqual(rows[0]['end_datetime'], '2030-01-03T18:00:00+00:00')
+        self.assertEqual(rows[0]['final_price'], '1500.50')
+        self.assertIs(rows[0]['driver_required'], True)
+        self.assertIsNone(rows[0]['promotion'])
+
+    def test_staff_only_and_validation(self):
+        self.assertEqual(self.client.get('/api/bookings/export/').status_code, 401)
+        self.assertEqual(self.client.get('/api/bookings/export/', **self.rider).status_code, 403)
+        response = self.client.get('/api/bookings/export/', {
+            'output': 'xml', 'start_from': 'soon', 'status': 'done',
+        }, **self.staff)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'output', 'start_from', 'status'})
+
+    def test_command(self):
+        out = StringIO()
+        call_command('export_bookings', '--format', 'ndjson', '--status', 'cancelled', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 1)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bookings.csv')
+            call_command('export_bookings', '--output', path, '--start-from', '2030-01-02', stderr=StringIO())
+            with open(path, newline='') as exported:
+                self.assertEqual(len(exported.read().splitlines()), 3)
+        with self.assertRaises(CommandError):
+            call_command('export_bookings', '--created-to', 'tomorrow')
+
+
+@override_settings(LIST_CACHE_TIMEOUT=0)
+class FleetImportTests(TempMediaMixin, TestCase):
+    HEADER = 'registration_number,name,car_type,engine,mileage,seats,ac,base_fare,location,fuel,transmission,features,trip_types,images'
+
+    def setUp(self):
+        super().setUp()
+        clear_caches()
+        TripType.objects.create(name='One Way')
+        self.existing, = make_fleet(1)
+        Car.objects.filter(pk=self.existing.pk).update(registration_number='KA01AB0001')
+
+    def write(self, name, content):
+        path = os.path.join(self.media_root, name)
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def import_fleet(self, *args):
+        out = StringIO()
+        call_command('import_fleet', *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def csv_file(self):
+        return self.write('fleet.csv', '\n'.join([
+            self.HEADER,
+            'TN09CD1234,Swift Dzire,Sedan,1.2L,22 kmpl,5,yes,1500,Chennai Airport,Petrol,Automatic,GPS;Feature 0,One Way,cars/dzire.jpg',
+            'TN09CD1235,Creta,SUV,1.5L,17 kmpl,7,false,2500,Chennai Airport,Diesel,Manual,,,',
+        ]) + '\n')
+
+    def test_csv_import_is_an_idempotent_upsert(self):
+        path = self.csv_file()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertIn('2 created, 0 updated', self.import_fleet(path))
+        dzire = Car.objects.get(registration_number='TN09CD1234')
+        self.assertEqual((dzire.car_type, dzire.seats, dzire.ac, dzire.base_fare), ('Sedan', 5, True, 1500))
+        self.assertEqual((dzire.location.name, dzire.fuel.name, dzire.transmission.type), ('Chennai Airport', 'Petrol', 'Automatic'))
+        self.assertEqual(sorted(dzire.features.values_list('name', flat=True)), ['Feature 0', 'GPS'])
+        self.assertEqual(list(dzire.trip_types.values_list('name', flat=True)), ['One Way'])
+        self.assertEqual(list(dzire.images.values_list('image', flat=True)), ['cars/dzire.jpg'])
+        self.assertEqual(Location.objects.filter(name='Chennai Airport').count(), 1)
+
+        # Derived tables follow the bulk writes
+        self.assertEqual(sorted(car['name'] for car in self.client.get('/api/cars/', {'q': 'chennai'}).json()['results']), ['Creta', 'Swift Dzire'])
+        self.assertTrue(CarFacetValue.objects.filter(car=dzire, facet='features', value='GPS').exists())
+
+        counts = [model.objects.count() for model in (Car, CarImage, CarFeature, Location, Car.features.through)]
+        with self.assertNumQueries(11):  # used lookups, existing cars, links and images; nothing written
+            self.assertIn('0 created, 0 updated, 2 unchanged, 0 links added', self.import_fleet(path))
+        self.assertEqual([model.objects.count() for model in (Car, CarImage, CarFeature, Location, Car.features.through)], counts)
+
+    def test_json_updates_only_named_columns(self):
+        path = self.write('fleet.json', json.dumps({'cars': [{
+            'registration_number': 'KA01AB0001', 'base_fare': 900, 'features': ['Feature 1', 'Sunroof'],
+            'images': ['car_images/0.jpg', 'cars/new.jpg'], 'color': 'Red',
+        }]}))
+        self.assertIn('0 created, 1 updated, 0 unchanged, 1 links added, 2 removed, 1 images added', self.import_fleet(path))
+        car = Car.objects.get(pk=self.existing.pk)
+        self.assertEqual((car.name, car.base_fare, car.color.name, car.fuel.name), ('Car 0', 900, 'Red', 'Petrol'))
+        self.assertEqual(sorted(car.features.values_list('name', flat=True)), ['Feature 1', 'Sunroof'])
+        self.assertEqual(car.images.count(), 3)  # images are only added
+        self.assertEqual(car.rating_avg, 4.5)  # review aggregates are not import columns
+        self.assertIn('1 unchanged', self.import_fleet(path))
+
+    def test_invalid_records(self):
+        path = self.write('fleet.csv', '\n'.join([
+            self.HEADER,
+            'TN01,Fine,SUV,1.5L,15 kmpl,5,true,100,,,,,,',
+            'TN02,Bad type,Truck,1.5L,15 kmpl,5,true,100,,,,,,',
+            'TN03,Bad trip,SUV,1.5L,15 kmpl,five,true,100,,,,,Space Flight,',
+            ',No number,SUV,1.5L,15 kmpl,5,true,100,,,,,,',
+            'TN01,Again,SUV,1.5L,15 kmpl,5,true,100,,,,,,',
+        ]) + '\n')
+        with self.assertRaisesMessage(CommandError, '4 invalid records'):
+            self.import_fleet(path)
+        self.assertEqual(Car.objects.count(), 1)  # nothing imported
+
+        self.assertIn('1 created', self.import_fleet(path, '--skip-invalid', '--dry-run'))
+        self.assertEqual(Car.objects.count(), 1)
+        self.assertIn('1 created, 0 updated, 0 unchanged, 0 links added, 0 removed, 0 images added, 4 invalid', self.import_fleet(path, '--skip-invalid'))
+        self.assertEqual(list(Car.objects.filter(registration_number='TN01').values_list('name', flat=True)), ['Fine'])
+
+    def test_new_cars_need_the_required_columns(self):
+        with self.assertRaises(FleetImportError) as raised:
+            import_fleet([{'registration_number': 'KA01', 'name': 'Nano'}, {'registration_number': 'KA01AB0001', 'seats': 4}])
+        self.assertEqual(raised.exception.errors, [
+            (1, 'car_type is required for a new car; engine is required for a new car; mileage is required for a new car'),
+        ])
+        self.assertFalse(Car.objects.filter(registration_number='KA01').exists())
+
+    def test_shared_registration_numbers_abort_the_import(self):
+        twin, = make_fleet(1)
+        Car.objects.filter(pk=twin.pk).update(registration_number='KA01AB0001')
+        new = {'registration_number': 'KA02', 'name': 'Nano', 'car_type': 'Hatchback', 'engine': '0.6L', 'mileage': '25 kmpl'}
+        with self.assertRaises(FleetImportError) as raised:
+            import_fleet([{'registration_number': 'KA01AB0001', 'base_fare': 1}, new])
+        self.assertEqual(raised.exception.errors, [(1, "registration_number 'KA01AB0001' matches several cars")])
+        self.assertFalse(Car.objects.filter(registration_number='KA02').exists())
+        self.assertIn('1 created', str(import_fleet([{'registration_number': 'KA01AB0001', 'base_fare': 1}, new], skip_invalid=True)))
+
+
+class BookingConcurrencyTests(TransactionTestCase):
+    def test_no_double_booking_under_concurrency(self):
+        cars = make_fleet(3)
+        user = User.objects.create(username='rider')
+        result = booking_stress(cars, user, threads=8, attempts=25, seed=1)
+        self.assertEqual(result['double_bookings'], [])
+        self.assertEqual(result['errors'], 0)
+        self.assertGreater(result['commits'], 0)
+        self.assertGreater(result['conflicts'], 0)
+        self.assertEqual(result['commits'] + result['conflicts'], 8 * 25)
+        self.assertGreater(result['commits_per_second'], 0)
+
+    def test_api_rejects_overlap_with_409(self):
+        car = make_fleet(1)[0]
+        token = Token.objects.create(user=User.objects.create(username='rider'))
+        auth = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+        payload = {'car_id': car.pk, 'start_datetime': '2030-01-01T10:00Z', 'end_datetime': '2030-01-01T14:00Z'}
+        self.assertEqual(self.client.post('/api/bookings/', payload, **auth).status_code, 201)
+        payload.update(start_datetime='2030-01-01T13:00Z', end_datetime='2030-01-01T15:00Z')
+        self.assertEqual(self.client.post('/api/bookings/', payload, **auth).status_code, 409)
+        payload.update(start_datetime='2030-01-01T14:00Z')
+        self.assertEqual(self.client.post('/api/bookings/', payload, **auth).status_code, 201)
+
+
+class AsyncEndpointTests(TransactionTestCase):
+    """The /api/async/ twins return what the sync endpoints return."""
+
+    def setUp(self):
+        clear_caches()
+        # Flushes between tests send no signals, so drop in-process state
+        location_autocomplete.invalidate()
+        self.cars = make_fleet(3)
+        Booking.objects.create(
+            user=User.objects.create(username='rider'), car=self.cars[0],
+            start_datetime=timezone.now(), end_datetime=timezone.now() + timezone.timedelta(days=1),
+        )
+        self.temp = TempBooking.objects.create(pickup_location='Location 0', start_datetime='2030-01-01T10:00Z')
+
+    async def assertSameResponse(self, path, params=None):
+        expected = await sync_to_async(self.client.get)(f'/api/{path}', params or {})
+        got = await self.async_client.get(f'/api/async/{path}', params or {})
+        self.assertEqual(got.status_code, expected.status_code, path)
+        self.assertEqual(got.json(), expected.json(), path)
+        return got.json()
+
+    async def test_cars_available(self):
+        now = timezone.now().isoformat()
+        data = await self.assertSameResponse('cars/available/', {'start_datetime': now})
+        self.assertEqual(len(data), 2)
+        await self.assertSameResponse('cars/available/', {'pickup_location': 'Location 1'})
+        await self.assertSameResponse('cars/available/')
+
+    async def test_location_search(self):
+        data = await self.assertSameResponse('locations/', {'search': 'loc'})
+        self.assertEqual(data['count'], 3)
+        await self.assertSameResponse('locations/', {'search': 'loc', 'page': 9})
+
+    async def test_temp_booking(self):
+        await self.assertSameResponse(f'booking-temp/{self.temp.pk}/')
+        await self.assertSameResponse(f'booking-temp/{uuid.uuid4()}/')
+
+    async def test_health_check(self):
+        await self.assertSameResponse('health/')
@@ -0,0 +1,149 @@
+"""
+Streaming multi-image upload for cars.
+
+``StreamToStorageHandler`` replaces Django's upload handlers for the upload
+view: each file part is written chunk by chunk straight to its final name
+in media storage, so neither memory nor a temp-file copy ever holds a whole
+photo. The stored files are then validated concurrently with Pillow,
+rejected ones are deleted, and the rest become CarImage rows in one
+bulk_create. Every file gets its own result entry.
+
+Streaming needs a storage backed by the local filesystem (``path()``), which
+is what MEDIA_ROOT uses here.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopFutureHandlers
+from django.utils.text import get_valid_filename
+from PIL import Image, UnidentifiedImageError
+
+from .models import CarImage
+from .versioning import bump_version
+
+UPLOAD_TO = 'car_images/'
+UPLOAD_FIELD = 'images'
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'WEBP'}
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+VALIDATION_THREADS = 8
+
+
+class StoredUpload:
+    """A file part already written to storage under ``name``."""
+
+    def __init__(self, name, original_name, size=0, error=None):
+        self.name = name
+        self.original_name = original_name
+        self.size = size
+        self.error = error
+
+    def close(self):
+        pass  # the handler already closed the stored file
+
+
+class StreamToStorageHandler(FileUploadHandler):
+    chunk_size = 256 * 1024
+
+    def __init__(self, request=None, storage=None):
+        super().__init__(request)
+        self.storage = storage or default_storage
+        self._file = None
+        self.upload = None
+        self.rejected = []  # StoredUploads that never reached storage
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        super().new_file(field_name, file_name, *args, **kwargs)
+        self.upload = None
+        if field_name == UPLOAD_FIELD:
+            base = UPLOAD_TO + get_valid_filename(os.path.basename(file_name))
+            while True:
+                name = self.storage.get_available_name(base)
+                path = self.storage.path(name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                try:
+                    self._file = open(path, 'xb')  # exclusive: a racing upload picks another name
+                    break
+                except FileExistsError:
+                    continue
+            self.upload = StoredUpload(name, file_name)
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.upload is None:
+            raise SkipFile()  # not an image field: drop it
+        if start + len(raw_data) > MAX_IMAGE_BYTES:
+            self._discard()
+            self.rejected.append(StoredUpload(None, self.file_name, error='File is larger than 20 MB.'))
+            self.upload = None
+            raise SkipFile()
+        self._file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.upload is None:
+            return None
+        self._file.close()
+        self._file = None
+        self.upload.size = file_size
+        return self.upload
+
+    def upload_interrupted(self):
+        self._discard()
+
+    def _discard(self):
+        if self._file is not None:
+            path = self._file.name
+            self._file.close()
+            self._file = None
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def validate(storage, upload):
+    """The error message for a stored upload, or None if it is a usable photo."""
+    if not upload.size:
+        return 'File is empty.'
+    try:
+        with Image.open(storage.path(upload.name)) as image:
+            if image.format not in ALLOWED_FORMATS:
+                return f'Unsupported image format {image.format}.'
+            image.verify()
+    except (UnidentifiedImageError, Image.DecompressionBombError):
+        return 'Not a valid image.'
+    except Exception:
+        return 'Image is corrupt.'
+    return None
+
+
+def save_car_images(car, uploads, storage=None, rejected=()):
+    """
+    Validate ``uploads`` concurrently, bulk-insert the valid ones as images
+    of ``car`` and delete the rest. Returns ``(created images, results)``,
+    with one result per file in upload order, followed by the ``rejected``
+    files the handler refused to store.
+    """
+    storage = storage or default_storage
+    uploads = list(uploads)
+    with ThreadPoolExecutor(max_workers=max(1, min(VALIDATION_THREADS, len(uploads)))) as executor:
+        errors = list(executor.map(lambda upload: validate(storage, upload), uploads))
+
+    valid = [upload for upload, error in zip(uploads, errors) if error is None]
+    for upload, error in zip(uploads, errors):
+        if error is not None:
+            storage.delete(upload.name)
+    images = CarImage.objects.bulk_create([CarImage(car=car, image=upload.name) for upload in valid])
+    if images:
+        transaction.on_commit(lambda: bump_version(CarImage))  # bulk_create sends no signals
+
+    created = dict(zip((upload.name for upload in valid), images))
+    results = []
+    for upload, error in zip(uploads, errors):
+        if error is None:
+            image = created[upload.name]
+            results.append({'file': upload.original_name, 'ok': True, 'id': image.pk, 'image': image.image.url})
+        else:
+            results.append({'file': upload.original_name, 'ok': False, 'error': error})
+    results += [{'file': upload.original_name, 'ok': False, 'error': upload.error} for upload in rejected]
+    return images, results
@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import LocationSearchAPIView
-from . import views
+from .views import LocationSearchAPIView, NearestLocationsAPIView
+from . import async_views, views
 from .views import (
     CarViewSet,
     BookingViewSet,
@@ -27,10 +27,18 @@ router.register(r'packages', PackageViewSet, basename='package')
 
 urlpatterns = [
     path('health/', health_check, name='health-check'),
+    path('cars/<int:car_id>/images/', views.CarImageUploadView.as_view(), name='car-image-upload'),
     path('', include(router.urls)),
     path('api-auth/', include('rest_framework.urls')),
     path('locations/', LocationSearchAPIView.as_view(), name='location-search'),
+    path('locations/nearest/', NearestLocationsAPIView.as_view(), name='location-nearest'),
     path('offers/', OffersListView.as_view(), name='offers-list'),
     path('booking-temp/', views.create_temp_booking, name='create_temp_booking'),
     path('booking-temp/<uuid:temp_id>/', views.get_temp_booking, name='get_temp_booking'),
+
+    # Async (ASGI) versions of the read-heavy endpoints
+    path('async/health/', async_views.health_check, name='async-health-check'),
+    path('async/cars/available/', async_views.cars_available, name='async-car-available'),
+    path('async/locations/', async_views.location_search, name='async-location-search'),
+    path('async/booking-temp/<uuid:temp_id>/', async_views.get_temp_booking, name='async-get-temp-booking'),
 ]
@@ -0,0 +1,313 @@
+"""
+values()-based serialization for read-only list endpoints.
+
+On a page of cars DRF's field machinery costs far more CPU than the queries:
+every row becomes a model instance, then every field of every nested
+serializer is looked up and converted one by one. A ValuesSerializer renders
+the same JSON as its DRF serializer from ``values()`` rows instead. Nested
+forward relations come from joined columns, list-valued relations (images,
+features, add-ons) from one ``values()`` query each, and only the values
+that need it (decimals, datetimes, files) go through the DRF field's
+``to_representation``.
+
+It is compiled from the DRF serializer's fields, so fields added there show
+up here as well. SerializerMethodFields and StringRelatedFields need a
+``get_<name>`` method here, called with the ``method_columns`` it reads.
+``ValuesListMixin`` uses it for ``list()`` on views that set
+``values_serializer_class``.
+"""
+from collections import defaultdict
+from operator import itemgetter
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.encoding import filepath_to_uri
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .catalog import get_catalog
+from .models import Location
+from .serializers import (
+    BookingSerializer, CarImageSerializer, CarSerializer, LocationSerializer, ReviewSerializer, image_srcset,
+)
+
+# DRF fields whose to_representation returns what the database already gives us
+NATIVE_FIELDS = (
+    serializers.CharField, serializers.ChoiceField, serializers.IntegerField,
+    serializers.FloatField, serializers.BooleanField, serializers.PrimaryKeyRelatedField,
+)
+
+
+class ValuesSerializer:
+    serializer_class = None
+    method_columns = {}  # field name -> columns get_<name> is called with
+    registry = {}  # DRF serializer class -> its ValuesSerializer
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.serializer_class is not None:
+            ValuesSerializer.registry[cls.serializer_class] = cls
+
+    def __init__(self, context, serializer=None, prefix=''):
+        self.context = context
+        self.request = context.get('request')
+        serializer = serializer or self.drf_serializer()
+        self.model = serializer.Meta.model
+        self.prefix = prefix
+        self.pk = prefix + self.model._meta.pk.name
+        self.columns = [self.pk]
+        self.nested = []  # ValuesSerializers of forward relations, reading the same rows
+        self.lists = []   # ListLoaders of list-valued relations
+        self.plan = [
+            (name, self.compile(name, field))
+            for name, field in serializer.fields.items() if not field.write_only
+        ]
+
+    @classmethod
+    def drf_serializer(cls):
+        """
+        A context-free ``serializer_class()``, built once per process: only
+        its fields' types, sources and value converters are used, so the
+        ModelSerializer field introspection is not repeated per request.
+        """
+        if '_drf_serializer' not in cls.__dict__:
+            cls._drf_serializer = cls.serializer_class()
+        return cls._drf_serializer
+
+    def compile(self, name, field):
+        """A ``render(row)`` for ``field``; adds the columns it reads."""
+        method = getattr(self, f'get_{name}', None)
+        if method is not None:
+            columns = [self.prefix + column for column in self.method_columns.get(name, ())]
+            self.columns += columns
+            return lambda row: method(*[row[column] for column in columns])
+
+        if isinstance(field, (serializers.ListSerializer, serializers.ManyRelatedField)):
+            loader = ListLoader(self, field)
+            self.lists.append(loader)
+            return lambda row: loader.items.get(row[self.pk], [])
+
+        if isinstance(field, serializers.BaseSerializer):
+            nested = values_serializer_for(field)(self.context, field, prefix=f'{self.prefix}{field.source}__')
+            self.nested.append(nested)
+            self.columns += nested.columns
+            return lambda row: None if row[nested.pk] is None else nested.to_representation(row)
+
+        column = self.prefix + field.source
+        self.columns.append(column)
+        if isinstance(field, NATIVE_FIELDS):
+            return itemgetter(column)
+        if isinstance(field, serializers.FileField):
+            convert = self.file_url(self.model._meta.get_field(field.source).storage)
+        elif isinstance(field, serializers.DecimalField) and self.is_quantized(field):
+            convert = '{:f}'.format
+        elif isinstance(field, serializers.RelatedField):
+            raise TypeError(f'{type(self).__name__} needs a get_{name}() for {type(field).__name__} {name!r}')
+        else:
+            convert = field.to_representation
+        return lambda row: None if row[column] is None else convert(row[column])
+
+    def is_quantized(self, field):
+        # The database converter already quantized the value to the model
+        # field's places; DRF would only format it
+        model_field = self.model._meta.get_field(field.source)
+        return (
+            getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+            and not field.localize and not field.normalize_output
+            and field.decimal_places == model_field.decimal_places
+            and field.max_digits == model_field.max_digits
+        )
+
+    def file_url(self, storage):
+        """``request.build_absolute_uri(storage.url(name))`` without re-parsing both URLs per file."""
+        request = self.request
+        base_url = getattr(storage, 'base_url', '') if isinstance(storage, FileSystemStorage) else ''
+        host = request.build_absolute_uri('/')[:-1] if request is not None else None
+
+        def url(name):
+            if not name:
+                return None  # DRF renders an empty file as null
+            if base_url.endswith('/'):
+                url = base_url + filepath_to_uri(name).lstrip('/')
+            else:
+                url = storage.url(name)
+            if request is None:
+                return url
+            if url.startswith('/') and not url.startswith('//') and '/./' not in url and '/../' not in url:
+                return host + url
+            return request.build_absolute_uri(url)
+        return url
+
+    def prepare(self, rows):
+        """Load the list-valued relations of ``rows``, recursively."""
+        for loader in self.lists:
+            loader.load({row[self.pk] for row in rows if row[self.pk] is not None})
+        for nested in self.nested:
+            nested.prepare([row for row in rows if row[nested.pk] is not None])
+
+    def to_representation(self, row):
+        return {name: render(row) for name, render in self.plan}
+
+    def values(self, queryset, extra=()):
+        """``queryset`` as the values() rows ``render`` takes; ``extra`` columns are kept too."""
+        return queryset.prefetch_related(None).values(*dict.fromkeys([*self.columns, *extra]))
+
+    def render(self, rows):
+        rows = list(rows)
+        self.prepare(rows)
+        return [self.to_representation(row) for row in rows]
+
+
+class ListLoader:
+    """One values() query for a reverse foreign key or many-to-many field, grouped by owner."""
+
+    def __init__(self, owner, field):
+        relation = owner.model._meta.get_field(field.source)
+        if relation.many_to_many and relation.concrete:
+            # through the join table: (owner id, target columns)
+            self.queryset = relation.remote_field.through.objects.all()
+            self.owner_column = relation.m2m_field_name() + '_id'
+            prefix = relation.m2m_reverse_field_name() + '__'
+            ordering = relation.related_model._meta.ordering
+        elif relation.one_to_many:
+            self.queryset = relation.related_model._default_manager.all()
+            self.owner_column = relation.field.attname
+            prefix = ''
+            ordering = relation.related_model._meta.ordering
+        else:
+            raise TypeError(f'Cannot load {relation!r} as a list')
+        self.ordering = [prefix + name if not name.startswith('-') else '-' + prefix + name[1:] for name in ordering]
+
+        if isinstance(field, serializers.ListSerializer):
+            self.child = values_serializer_for(field.child)(owner.context, field.child, prefix=prefix)
+            self.columns = self.child.columns
+        else:
+            child = field.child_relation
+            column = prefix + (child.slug_field if isinstance(child, serializers.SlugRelatedField) else 'pk')
+            self.child = None
+            self.columns = [column]
+            self.column = column
+        self.items = {}
+
+    def load(self, owner_ids):
+        if not owner_ids:
+            self.items = {}
+            return
+        rows = list(
+            self.queryset.filter(**{self.owner_column + '__in': owner_ids})
+            .order_by(*self.ordering).values(self.owner_column, *dict.fromkeys(self.columns))
+        )
+        items = defaultdict(list)
+        if self.child is not None:
+            self.child.prepare(rows)
+            for row in rows:
+                items[row[self.owner_column]].append(self.child.to_representation(row))
+        else:
+            for row in rows:
+                items[row[self.owner_column]].append(row[self.column])
+        self.items = items
+
+
+def values_serializer_for(serializer):
+    """The ValuesSerializer class for a DRF serializer instance (a plain one if none is declared)."""
+    serializer_class = type(serializer)
+    if serializer_class not in ValuesSerializer.registry:
+        type(f'{serializer_class.__name__}Values', (ValuesSerializer,), {'serializer_class': serializer_class})
+    return ValuesSerializer.registry[serializer_class]
+
+
+class LocationValues(ValuesSerializer):
+    serializer_class = LocationSerializer
+    method_columns = {'distance_from_user': ('latitude', 'longitude')}
+
+    def __init__(self, context, *args, **kwargs):
+        request = context.get('request')
+        params = request.query_params if request is not None else {}
+        lat, lng = params.get('lat'), params.get('lng')
+        self.user_position = (float(lat), float(lng)) if lat and lng else None
+        super().__init__(context, *args, **kwargs)
+
+    def get_distance_from_user(self, latitude, longitude):
+        if self.user_position is None:
+            return None
+        distance = Location(latitude=latitude, longitude=longitude).distance_to(*self.user_position)
+        return round(distance, 2) if distance is not None else None
+
+
+class CarImageValues(ValuesSerializer):
+    serializer_class = CarImageSerializer
+    method_columns = {'srcset': ('derivatives',)}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.url = self.file_url(self.model._meta.get_field('image').storage)
+
+    def get_srcset(self, derivatives):
+        return image_srcset(derivatives, self.url)
+
+
+class CarValues(ValuesSerializer):
+    serializer_class = CarSerializer
+    method_columns = {'rating': ('reviews_count', 'rating_avg')}
+
+    def get_add_ons(self):
+        return get_catalog('addons').get()[1]
+
+    def get_rating(self, reviews_count, rating_avg):
+        if not reviews_count:
+            return None
+        return round(rating_avg, 1)
+
+
+class BookingValues(ValuesSerializer):
+    serializer_class = BookingSerializer
+    method_columns = {'user': ('user__username',)}
+
+    def get_user(self, username):
+        return username
+
+
+class ReviewValues(ValuesSerializer):
+    serializer_class = ReviewSerializer
+    method_columns = {
+        'user': ('user__username',),
+        'user_initials': ('user__first_name', 'user__last_name'),
+    }
+
+    def get_user(self, username):
+        return username
+
+    def get_user_initials(self, first_name, last_name):
+        if first_name and last_name:
+            return (first_name[0] + last_name[0]).upper()
+        elif first_name:
+            return first_name[0].upper()
+        return "XX"
+
+
+class ValuesListMixin:
+    """
+    ``list()`` through ``values_serializer_class`` instead of the DRF
+    serializer. Shaped requests (``?fields=``/``?expand=``, see shaping.py)
+    keep the regular path.
+    """
+    values_serializer_class = None
+
+    def use_values_serializer(self):
+        if self.values_serializer_class is None:
+            return False
+        shape_params = getattr(self, 'shape_params', None)
+        return shape_params is None or shape_params() == (None, None)
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_values_serializer():
+            return super().list(request, *args, **kwargs)
+        renderer = self.values_serializer_class(self.get_serializer_context())
+        # the keyset paginator reads its sort columns (and annotations, e.g.
+        # a search rank) off the rows
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = renderer.values(queryset, extra=[*getattr(self, 'plan_extra_only', ()), *queryset.query.annotations])
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(renderer.render(page))
+        return Response(renderer.render(rows))
@@ -0,0 +1,62 @@
+"""
+Per-model change versions.
+
+A version is an opaque token stored in the ``versions`` cache, replaced
+whenever a row of the model changes (see signals.py). In-process caches
+compare their token with the stored one, so a write in any worker
+invalidates every worker: the ``versions`` cache must be shared by all of
+them (see CACHES in settings.py), unlike the per-process default cache.
+Tokens start with the time they were issued, which conditional GETs use as
+Last-Modified.
+"""
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.core.cache import caches
+
+CACHE_ALIAS = 'versions'
+
+
+def _key(model):
+    return f'car_rental:version:{model._meta.label_lower}'
+
+
+def _new_token():
+    return f'{int(time.time() * 1000):x}.{uuid.uuid4().hex[:8]}'
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def get_version(model):
+    cache = _cache()
+    key = _key(model)
+    version = cache.get(key)
+    if version is None:
+        # add() so that workers racing on a cold cache settle on one token
+        cache.add(key, _new_token(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def get_versions(models):
+    """Versions of several models with one cache round trip when all are set."""
+    keys = [_key(model) for model in models]
+    found = _cache().get_many(keys)
+    return [found.get(key) or get_version(model) for key, model in zip(keys, models)]
+
+
+def bump_version(model):
+    _cache().set(_key(model), _new_token(), timeout=None)
+
+
+def version_time(version):
+    """When ``version`` was issued (aware UTC datetime), or None for foreign tokens."""
+    if not isinstance(version, str) or '.' not in version:
+        return None
+    try:
+        return datetime.fromtimestamp(int(version.split('.', 1)[0], 16) / 1000, tz=timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        return None
@@ -1,22 +1,42 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import generics
 from rest_framework.views import APIView
 from django.utils.dateparse import parse_datetime
-from django.db.models import Q, Avg
-from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.parsers import MultiPartParser
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.permissions import IsAuthenticated
 import uuid
 from django_filters.rest_framework import DjangoFilterBackend, FilterSet
+from django_filters.utils import translate_validation
 from django_filters import NumberFilter, CharFilter, BooleanFilter
 from rest_framework.filters import OrderingFilter
 from django.shortcuts import get_object_or_404
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.http import condition
+from .autocomplete import location_autocomplete
+from . import carcalendar, carfacets, carsearch
+from . import bookingexport
+from .bookings import commit_booking
+from .catalog import get_catalog
+from .conditional import CAR_MODELS, conditional, model_conditional
+from . import derivatives
+from .geo import location_grid
+from .pagination import KeysetPagination
+from .promotions import promotion_index
+from . import pricing
+from .shaping import ShapedViewMixin
+from .querybudget import query_budget
+from .responsecache import ListResponseCache
+from . import uploads
+from .valueserializers import BookingValues, CarValues, ReviewValues, ValuesListMixin
+from .versioning import get_version, version_time
+from . import tempbookings
 from .models import (
-    Car, Booking, Review, Promotion, Policy, TripType, AddOn, Location, Package, Offer,TempBooking
+    Car, Booking, Review, Promotion, Policy, TripType, AddOn, Location, Package, Offer,
 )
 from .serializers import (
     CarSerializer, BookingSerializer, ReviewSerializer,
@@ -24,17 +44,43 @@ from .serializers import (
     AddOnSerializer, LocationSerializer, PackageSerializer, OfferSerializer,TempBookingSerializer
 )
 
+# --- Catalog cache ---
+class CatalogListMixin:
+    """Serve list() from the in-memory catalog and tag it with its version."""
+    catalog_name = None
+
+    def catalog_etag(self, request, *args, **kwargs):
+        catalog = get_catalog(self.catalog_name)
+        return catalog.etag(get_version(catalog.model))
+
+    def catalog_last_modified(self, request, *args, **kwargs):
+        return version_time(get_version(get_catalog(self.catalog_name).model))
+
+    @conditional(catalog_etag, catalog_last_modified)
+    def list(self, request, *args, **kwargs):
+        # Searching/ordering still goes through the regular queryset path
+        if set(request.query_params) - {self.paginator.page_query_param}:
+            return super().list(request, *args, **kwargs)
+        version, data = get_catalog(self.catalog_name).get()
+        page = self.paginate_queryset(data)
+        if page is not None:
+            return self.get_paginated_response(page)
+        return Response(data)
+
 # --- Car Filter ---
 class CarFilter(FilterSet):
     car_type = CharFilter(field_name='car_type', lookup_expr='iexact')
+    fuel = CharFilter(field_name='fuel__name', lookup_expr='iexact')
+    transmission = CharFilter(field_name='transmission__type', lookup_expr='iexact')
     min_price = NumberFilter(method='filter_min_price')
     max_price = NumberFilter(method='filter_max_price')
     ac = BooleanFilter(field_name='ac')
     seats = NumberFilter(field_name='seats', lookup_expr='gte')
+    min_rating = NumberFilter(field_name='rating_avg', lookup_expr='gte')
 
     class Meta:
         model = Car
-        fields = ['car_type', 'ac', 'seats', 'min_price', 'max_price']
+        fields = ['car_type', 'fuel', 'transmission', 'ac', 'seats', 'min_price', 'max_price', 'min_rating']
 
     def filter_min_price(self, queryset, name, value):
         return queryset.filter(base_fare__gte=value)
@@ -43,20 +89,64 @@ class CarFilter(FilterSet):
         return queryset.filter(base_fare__lte=value)
 
 # --- Car API ---
-class CarViewSet(viewsets.ModelViewSet):
+class CarViewSet(ShapedViewMixin, ValuesListMixin, viewsets.ModelViewSet):
     queryset = Car.objects.all()
     serializer_class = CarSerializer
-    filter_backends = [DjangoFilterBackend, OrderingFilter]  # DRF's OrderingFilter only
+    values_serializer_class = CarValues  # list() renders from values() rows
+    # DRF's OrderingFilter only; ?q= is the full-text search (see carsearch.py)
+    filter_backends = [DjangoFilterBackend, carsearch.CarSearchFilter, OrderingFilter]
     filterset_class = CarFilter
-    ordering_fields = ['base_fare', 'rating']
+    ordering_fields = ['base_fare', 'rating_avg']
     permission_classes = [AllowAny]
+    pagination_class = KeysetPagination
+    # cars, images, features (add-ons come from the catalog cache), plus the
+    # calendar days of the window where it is free-checked; a quote is one
+    # query for the price columns plus those days; availability reads the
+    # car, its calendar days and its open-ended bookings; facets are one
+    # GROUP BY plus the match count
+    query_budgets = {'list': 3, 'retrieve': 3, 'available': 4, 'quote': 2, 'availability': 3, 'facets': 2}
+    keyset_orderings = {
+        'base_fare': ('base_fare', 'id'),
+        '-base_fare': ('-base_fare', '-id'),
+        'rating': ('-rating_avg', '-id'),
+        'rating_avg': ('rating_avg', 'id'),
+        '-rating_avg': ('-rating_avg', '-id'),
+    }
+
+    # keyset cursor columns (see keyset_orderings)
+    plan_extra_only = ('base_fare', 'rating_avg')
 
     def get_queryset(self):
-        qs = super().get_queryset()
-        ordering = self.request.query_params.get('ordering')
-        if ordering == 'rating':
-            qs = qs.annotate(rating_avg=Avg('reviews__rating')).order_by('-rating_avg')
-        return qs
+        # Fetch everything CarSerializer touches up front: a page of N cars
+        # costs the same handful of queries regardless of N. Rating and
+        # review count are stored on Car (see ratings.py). ?fields=/?expand=
+        # narrow this to what the shaped response renders (see shaping.py).
+        return self.shaped_queryset(super().get_queryset(), lambda qs: qs.select_related(
+            'group', 'variant', 'location', 'fuel', 'transmission'
+        ).prefetch_related(
+            'images', 'features'
+        ))
+
+    list_cache = ListResponseCache('cars', CAR_MODELS, CarFilter, params=[
+        'ordering', 'cursor', 'page_size', 'lat', 'lng', 'fields', 'expand', 'q',
+    ])
+
+    # 304 from the change versions before any query or serialization, then
+    # the shared response cache (see responsecache.py)
+    @model_conditional('cars', CAR_MODELS)
+    def list(self, request, *args, **kwargs):
+        return self.list_cache.respond(request, lambda: super(CarViewSet, self).list(request, *args, **kwargs))
+
+    @model_conditional('car', CAR_MODELS)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def get_keyset_ordering(self, request):
+        # 'rating' is the UI's "best rated first"; searches default to relevance
+        ordering = request.query_params.get('ordering')
+        if ordering not in self.keyset_orderings and carsearch.match_expression(request.query_params.get('q')):
+            return ('search_rank', 'id')
+        return self.keyset_orderings.get(ordering, ('id',))
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['request'] = self.request  # Pass request for distance calculation
@@ -72,56 +162,132 @@ class CarViewSet(viewsets.ModelViewSet):
         if pickup_location:
             cars = cars.filter(location__name__icontains=pickup_location)
 
-        # Check time overlap
-        if start_datetime_str and end_datetime_str:
-            start_datetime = parse_datetime(start_datetime_str)
-            end_datetime = parse_datetime(end_datetime_str)
-
-            if start_datetime and end_datetime:
-                overlapping_bookings = Booking.objects.filter(
-                    Q(start_datetime__lt=end_datetime) &
-                    Q(end_datetime__gt=start_datetime)
-                ).values_list('car_id', flat=True)
-                cars = cars.exclude(id__in=overlapping_bookings)
-
-        elif start_datetime_str:
-            # Fallback: If only start time is given
-            start_datetime = parse_datetime(start_datetime_str)
-            if start_datetime:
-                overlapping_bookings = Booking.objects.filter(
-                    Q(start_datetime__lte=start_datetime) &
-                    Q(end_datetime__gte=start_datetime)
-                ).values_list('car_id', flat=True)
-                cars = cars.exclude(id__in=overlapping_bookings)
+        # Check time overlap against the calendar bitmaps (see carcalendar.py);
+        # if only start time is given, the cars must be free at that instant
+        start_datetime = parse_datetime(start_datetime_str) if start_datetime_str else None
+        end_datetime = parse_datetime(end_datetime_str) if end_datetime_str else None
+
+        if start_datetime:
+            cars = carcalendar.exclude_busy(cars, start_datetime, end_datetime)
 
         serializer = self.get_serializer(cars, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'])
+    def quote(self, request):
+        # Fares for every available car matching the CarsList filters, priced
+        # together (see pricing.py); trip terms come from the catalog cache
+        trip = pricing.trip_from_params(request.query_params)
+        cars = self.filter_queryset(Car.objects.all())
+        pickup_location = request.query_params.get('pickup_location')
+        if pickup_location:
+            cars = cars.filter(location__name__icontains=pickup_location)
+        if trip.start:
+            cars = carcalendar.exclude_busy(cars, trip.start, trip.end)
+        return Response({'trip': trip.summary(), 'quotes': pricing.quote(cars, trip)})
+
+    @action(detail=True, methods=['get'])
+    def availability(self, request, pk=None):
+        # Is this car free for the whole window? Answered from its calendar
+        # bitmaps (see carcalendar.py), not from the bookings table
+        start = parse_datetime(request.query_params.get('start_datetime') or '')
+        end = parse_datetime(request.query_params.get('end_datetime') or '')
+        errors = {}
+        if start is None:
+            errors['start_datetime'] = 'A valid datetime is required.'
+        elif timezone.is_naive(start):
+            start = timezone.make_aware(start)
+        if end is None:
+            errors['end_datetime'] = 'A valid datetime is required.'
+        elif timezone.is_naive(end):
+            end = timezone.make_aware(end)
+        if start is not None and end is not None and end <= start:
+            errors['end_datetime'] = 'Must be after start_datetime.'
+        if errors:
+            raise ValidationError(errors)
+        car_id = get_object_or_404(Car.objects.values_list('pk', flat=True), pk=pk)
+        return Response({
+            'car': car_id,
+            'start_datetime': start,
+            'end_datetime': end,
+            'available': carcalendar.is_free(car_id, start, end),
+        })
+
+    facets_cache = ListResponseCache('car-facets', CAR_MODELS, CarFilter, params=['q'])
+
+    @action(detail=False, methods=['get'])
+    @model_conditional('car-facets', CAR_MODELS)
+    def facets(self, request):
+        # Counts for every search facet under the CarFilter parameters and
+        # ?q=, from the per-car facet rows (see carfacets.py)
+        def build():
+            cars = carsearch.search(Car.objects.all(), request.query_params.get('q'))
+            filterset = CarFilter(request.query_params, queryset=cars, request=request)
+            if not filterset.is_valid():
+                raise translate_validation(filterset.errors)
+            return Response({'count': filterset.qs.count(), 'facets': carfacets.counts(filterset, cars)})
+        return self.facets_cache.respond(request, build)
+
+
 # --- Booking API ---
-class BookingViewSet(viewsets.ModelViewSet):
+class BookingViewSet(ShapedViewMixin, ValuesListMixin, viewsets.ModelViewSet):
     queryset = Booking.objects.all()
     serializer_class = BookingSerializer
+    values_serializer_class = BookingValues
     permission_classes = [IsAuthenticated]  # require login
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-created_at', '-id')
+    # token, bookings, add-ons, car images, car features; the export
+    # streams every row from one query
+    query_budgets = {'list': 5, 'retrieve': 5, 'export': 2}
+    plan_extra_only = ('created_at',)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def export(self, request):
+        # All bookings in the date range as CSV or NDJSON, streamed from flat
+        # rows instead of paginated, serialized JSON (see bookingexport.py)
+        output = request.query_params.get('output', 'csv')
+        filters, errors = bookingexport.parse_filters(request.query_params)
+        if output not in bookingexport.FORMATS:
+            errors['output'] = f"Expected one of: {', '.join(bookingexport.FORMATS)}."
+        if errors:
+            raise ValidationError(errors)
+        response = StreamingHttpResponse(
+            bookingexport.stream(output, filters), content_type=bookingexport.FORMATS[output],
+        )
+        filename = f"bookings-{timezone.now():%Y%m%d-%H%M%S}.{output}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
     def perform_create(self, serializer):
         user = self.request.user
         if not user or not user.is_authenticated:
             raise PermissionDenied("Authentication required to create booking")
-        serializer.save(user=user)
+        commit_booking(serializer, user=user)
+
+    def perform_update(self, serializer):
+        commit_booking(serializer)
 
     def get_queryset(self):
         user = self.request.user
         if user.is_staff:
-            return Booking.objects.all()
-        if user.is_authenticated:
-            return Booking.objects.filter(user=user)
-        return Booking.objects.none()
+            bookings = Booking.objects.all()
+        elif user.is_authenticated:
+            bookings = Booking.objects.filter(user=user)
+        else:
+            return Booking.objects.none()
+        return self.shaped_queryset(bookings, lambda qs: qs.select_related(
+            'user', 'trip_type', 'applied_promotion',
+            'car__group', 'car__variant', 'car__location', 'car__fuel', 'car__transmission',
+        ).prefetch_related('add_ons', 'car__images', 'car__features'))
 
 # --- Review API ---
-class ReviewViewSet(viewsets.ModelViewSet):
-    queryset = Review.objects.all()
+class ReviewViewSet(ValuesListMixin, viewsets.ModelViewSet):
+    queryset = Review.objects.select_related('user')
     serializer_class = ReviewSerializer
+    values_serializer_class = ReviewValues
     permission_classes = [AllowAny]
+    query_budgets = {'list': 2, 'retrieve': 1}  # count + page
 
     def get_queryset(self):
         car_id = self.request.query_params.get('car')
@@ -135,51 +301,91 @@ class PromotionViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = PromotionSerializer
     permission_classes = [AllowAny]
 
+    query_budgets = {'validate_code': 0}
+
     @action(detail=False, methods=['post'])
     def validate_code(self, request):
-        code = request.data.get('code', '').upper()
-        try:
-            promo = Promotion.objects.get(code=code, is_active=True)
-            serializer = self.get_serializer(promo)
-            return Response({'valid': True, 'promo': serializer.data})
-        except Promotion.DoesNotExist:
-            return Response({'valid': False, 'error': 'Invalid promo code'}, status=status.HTTP_400_BAD_REQUEST)
+        # Answered from the in-memory promotion index, including unknown codes
+        promo, error = promotion_index.check(request.data.get('code', ''))
+        if error:
+            return Response({'valid': False, 'error': error}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = self.get_serializer(promo)
+        return Response({'valid': True, 'promo': serializer.data})
 
 # --- Policy API ---
-class PolicyViewSet(viewsets.ReadOnlyModelViewSet):
+class PolicyViewSet(CatalogListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Policy.objects.filter(is_active=True)
     serializer_class = PolicySerializer
     permission_classes = [AllowAny]
+    catalog_name = 'policies'
 
 # --- TripType API ---
-class TripTypeViewSet(viewsets.ReadOnlyModelViewSet):
+class TripTypeViewSet(CatalogListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = TripType.objects.all()
     serializer_class = TripTypeSerializer
     permission_classes = [AllowAny]
+    catalog_name = 'triptypes'
 
 # --- AddOn API ---
-class AddOnViewSet(viewsets.ReadOnlyModelViewSet):
+class AddOnViewSet(CatalogListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = AddOn.objects.all()
     serializer_class = AddOnSerializer
     permission_classes = [AllowAny]
+    catalog_name = 'addons'
 
 # --- Location Search API ---
 class LocationSearchAPIView(generics.ListAPIView):
     queryset = Location.objects.all()
     serializer_class = LocationSerializer
     permission_classes = [AllowAny]
+    max_results = 50
+    query_budgets = {'get': 0}
 
     def get_queryset(self):
+        # Ranked matches from the in-memory autocomplete index, not the DB
         query = self.request.query_params.get('search', '').strip()
         if query:
-            return self.queryset.filter(name__icontains=query)
+            return location_autocomplete.search(query, k=self.max_results)
         return Location.objects.none()
 
+# --- Nearest Locations API ---
+class NearestLocationsAPIView(APIView):
+    permission_classes = [AllowAny]
+    max_limit = 100
+
+    def get(self, request):
+        try:
+            lat = float(request.query_params['lat'])
+            lng = float(request.query_params['lng'])
+            radius = request.query_params.get('radius')
+            radius = float(radius) if radius else None
+            limit = int(request.query_params.get('limit', 10))
+        except (KeyError, ValueError):
+            return Response(
+                {'error': 'lat and lng are required; radius (km) and limit must be numbers'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180) or (radius is not None and radius <= 0):
+            return Response({'error': 'Coordinates or radius out of range'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, self.max_limit))
+
+        hits = location_grid.nearest(lat, lng, radius_km=radius, limit=limit)
+        locations = Location.objects.in_bulk([pk for pk, _ in hits])
+        results = []
+        for pk, distance in hits:
+            location = locations.get(pk)
+            if location is not None:
+                location.distance_km = distance
+                results.append(location)
+        serializer = LocationSerializer(results, many=True, context={'request': request})
+        return Response(serializer.data)
+
 # --- Package API ---
-class PackageViewSet(viewsets.ReadOnlyModelViewSet):
+class PackageViewSet(CatalogListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Package.objects.all()
     serializer_class = PackageSerializer
     permission_classes = [AllowAny]
+    catalog_name = 'packages'
 
 # --- Offers API ---
 class OffersListView(APIView):
@@ -187,10 +393,13 @@ class OffersListView(APIView):
     serializer_class = OfferSerializer
     permission_classes = [AllowAny]
 
+    catalog_name = 'offers'
+    catalog_etag = CatalogListMixin.catalog_etag
+    catalog_last_modified = CatalogListMixin.catalog_last_modified
+
+    @conditional(catalog_etag, catalog_last_modified)
     def get(self, request):
-        offers = Offer.objects.filter(is_active=True)
-        serializer = OfferSerializer(offers, many=True)
-        return Response(serializer.data)
+        return Response(get_catalog(self.catalog_name).get()[1])
 
 # --- Health Check API ---
 @api_view(['GET'])
@@ -201,49 +410,78 @@ def health_check(request):
 
 
 class CarImageUploadView(APIView):
-    parser_classes = [MultiPartParser, FormParser]
+    parser_classes = [MultiPartParser]
+    permission_classes = [IsAdminUser]
 
     def post(self, request, car_id):
         car = get_object_or_404(Car, id=car_id)
-        files = request.FILES.getlist('images')
-        for f in files:
-            CarImage.objects.create(car=car, image=f)
-        return Response({"status": "success"})
-
-
+        # Stream file parts straight into media storage instead of buffering
+        # them (see uploads.py); must be set before request.FILES is read
+        handler = uploads.StreamToStorageHandler(request._request)
+        request.upload_handlers = [handler]
+        files = request.FILES.getlist(uploads.UPLOAD_FIELD)
+
+        images, results = uploads.save_car_images(car, files, rejected=handler.rejected)
+        derivatives.schedule(images)  # thumbnails etc. appear once the pool is done
+        for result in results:
+            if result['ok']:
+                result['image'] = request.build_absolute_uri(result['image'])
+
+        if not results:
+            return Response({"status": "error", "error": "No images uploaded.", "results": []},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(images) == len(results):
+            outcome = "success"
+        else:
+            outcome = "partial" if images else "error"
+        return Response(
+            {"status": outcome, "results": results},
+            status=status.HTTP_201_CREATED if images else status.HTTP_400_BAD_REQUEST,
+        )
+
+
+@query_budget(post=1)
 @api_view(['POST'])
 @permission_classes([AllowAny])  # ✅ This applies AllowAny properly
 def create_temp_booking(request):
     serializer = TempBookingSerializer(data=request.data)
     if serializer.is_valid():
         booking = serializer.save()
+        tempbookings.remember(booking)  # CarsList reads it back right away
         # ✅ Return the ID of the saved record, not a random new UUID
         return Response({"temp_id": str(booking.id)}, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-def get_booking_by_uuid(temp_id):
-    import uuid
-    from django.http import Http404
+def parse_temp_id(temp_id):
+    # If temp_id is already a UUID instance, just return it; else parse.
+    if isinstance(temp_id, uuid.UUID):
+        return temp_id
+    try:
+        return uuid.UUID(str(temp_id), version=4)  # or version=None for any UUID
+    except ValueError:
+        raise Http404("Invalid UUID format")
+
 
-    # If temp_id is already a UUID instance, just assign it; else parse.
-    if not isinstance(temp_id, uuid.UUID):
-        try:
-            uuid_obj = uuid.UUID(str(temp_id), version=4)  # or version=None for any UUID
-        except ValueError:
-            raise Http404("Invalid UUID format")
-    else:
-        uuid_obj = temp_id  # It's already a UUID, no need to parse
-
-    booking = TempBooking.objects.filter(id=uuid_obj).first()
-    if not booking:
-        raise Http404("Booking not found")
-    return booking
 
+def temp_booking_etag(request, temp_id):
+    # Temp bookings never change: the id is the version
+    if tempbookings.get_data(temp_id) is not None:
+        return f'"temp-{temp_id}"'
+    return None
 
 
+def temp_booking_last_modified(request, temp_id):
+    data = tempbookings.get_data(temp_id)
+    return parse_datetime(data['created_at']) if data else None
+
+
+@query_budget(get=1)
+@condition(etag_func=temp_booking_etag, last_modified_func=temp_booking_last_modified)
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_temp_booking(request, temp_id):
-    booking = get_booking_by_uuid(temp_id)
-    serializer = TempBookingSerializer(booking)
-    return Response(serializer.data)
+    # Read-through cache; expired bookings read as missing (see tempbookings.py)
+    data = tempbookings.get_data(parse_temp_id(temp_id))
+    if data is None:
+        raise Http404("Booking not found")
+    return Response(data)